@@ -0,0 +1,253 @@
+"""This module contains the consolidated per-subject archive of spectral results.
+
+Spectra and TFRs of every sleep stage are stored in a single hdf5 file
+as chunked and compressed datasets under ``{kind}/{stage}``,
+so that a stage, channel or frequency range can be read without loading the rest.
+"""
+
+from collections.abc import Iterable
+from pathlib import Path
+
+import mne
+import numpy as np
+from attrs import define, field
+
+ARCHIVE_FNAME = "archive.h5"
+
+
+def _info_title(kind, stage):
+    return f"info_{kind}_{stage}"
+
+
+def write_archive(
+    fname: str | Path,
+    kind: str,
+    items: dict,
+    overwrite: bool = False,
+    compression: str = "gzip",
+):
+    """Writes spectra or TFRs per sleep stage into the archive.
+
+    Args:
+        fname: Path to the archive, created if doesn't exist.
+        kind: Kind of the items, e.g., "psd" or "spindles-tfr".
+        items: Instances of :py:class:`mne:mne.time_frequency.Spectrum`
+            or :py:class:`mne:mne.time_frequency.AverageTFR` per sleep stage.
+        overwrite: Whether to overwrite stages already present in the archive.
+            Defaults to False.
+        compression: Compression filter of the datasets. Defaults to "gzip".
+    """
+    import h5py
+    from h5io import write_hdf5
+
+    with h5py.File(fname, "a") as f:
+        for stage, item in items.items():
+            name = f"{kind}/{stage}"
+            if name in f:
+                if not overwrite:
+                    raise FileExistsError(
+                        f"{name} exists in {fname}. Please use option overwrite=True."
+                    )
+                del f[name]
+            group = f.create_group(name)
+            is_tfr = isinstance(item, mne.time_frequency.AverageTFR)
+            data = item.data if is_tfr else item.get_data()
+            # One chunk per channel, so picking channels reads only their chunks.
+            group.create_dataset(
+                "data",
+                data=data,
+                chunks=(1, *data.shape[1:]),
+                compression=compression,
+                shuffle=True,
+            )
+            group.create_dataset(
+                "ch_names", data=item.ch_names, dtype=h5py.string_dtype()
+            )
+            group.create_dataset("freqs", data=item.freqs)
+            if is_tfr:
+                group.create_dataset("times", data=item.times)
+                group.attrs["nave"] = item.nave
+                group.attrs["method"] = str(item.method)
+
+    for stage, item in items.items():
+        write_hdf5(
+            fname,
+            {"info": item.info},
+            title=_info_title(kind, stage),
+            overwrite="update",
+            slash="replace",
+        )
+
+
+def find_archive(dirpath: Path, kind: str) -> Path | None:
+    """Looks for an archive containing the kind of items.
+
+    Args:
+        dirpath: Path to the archive itself, to the directory containing it
+            or to a pipe directory inside the output directory.
+        kind: Kind of the items, e.g., "psd" or "spindles-tfr".
+
+    Returns:
+        Path to the archive or None if not found.
+    """
+    import h5py
+
+    dirpath = Path(dirpath)
+    candidates = (
+        [dirpath]
+        if dirpath.suffix == ".h5"
+        else [dirpath / ARCHIVE_FNAME, dirpath.parent / ARCHIVE_FNAME]
+    )
+    for path in candidates:
+        if path.is_file():
+            with h5py.File(path, "r") as f:
+                if kind in f:
+                    return path
+    return None
+
+
+@define(kw_only=True)
+class SleepArchive:
+    """Lazy reader of the archive.
+
+    Every call opens the file and reads only the requested slice.
+    """
+
+    path: Path = field(converter=Path)
+    """Path to the archive."""
+
+    @path.validator
+    def _validate_path(self, attr, value):
+        if not value.is_file():
+            raise FileNotFoundError(f"No such archive: {value}")
+
+    def _open(self):
+        import h5py
+
+        return h5py.File(self.path, "r")
+
+    def kinds(self) -> list:
+        """Kinds of items stored in the archive."""
+        with self._open() as f:
+            return [key for key in f if not key.startswith("info_")]
+
+    def stages(self, kind: str) -> list:
+        """Sleep stages stored for the kind."""
+        with self._open() as f:
+            return list(f[kind])
+
+    def ch_names(self, kind: str, stage: str) -> list:
+        """Channel names of the kind and stage."""
+        with self._open() as f:
+            return f[f"{kind}/{stage}/ch_names"].asstr()[:].tolist()
+
+    def freqs(self, kind: str, stage: str) -> np.ndarray:
+        """Frequencies of the kind and stage."""
+        with self._open() as f:
+            return f[f"{kind}/{stage}/freqs"][:]
+
+    def get_data(
+        self,
+        kind: str,
+        stage: str,
+        picks: str | Iterable[str] | None = None,
+        fmin: float | None = None,
+        fmax: float | None = None,
+        tmin: float | None = None,
+        tmax: float | None = None,
+    ) -> dict:
+        """Reads a slice of the stored data.
+
+        Args:
+            kind: Kind of the items, e.g., "psd" or "spindles-tfr".
+            stage: Sleep stage.
+            picks: Channel names to read. If None, all channels. Defaults to None.
+            fmin: Lower frequency bound. Defaults to None.
+            fmax: Upper frequency bound. Defaults to None.
+            tmin: Lower time bound, TFRs only. Defaults to None.
+            tmax: Upper time bound, TFRs only. Defaults to None.
+
+        Returns:
+            dict: "data" of shape (n_channels, n_freqs[, n_times]),
+            "ch_names", "freqs" and, for TFRs, "times", "nave" and "method".
+        """
+        with self._open() as f:
+            group = f[f"{kind}/{stage}"]
+            ch_names = group["ch_names"].asstr()[:].tolist()
+            if picks is None:
+                ch_idx = np.arange(len(ch_names))
+            else:
+                picks = [picks] if isinstance(picks, str) else list(picks)
+                missing = set(picks) - set(ch_names)
+                if missing:
+                    raise ValueError(
+                        f"Channels {sorted(missing)} are not in {kind}/{stage}"
+                    )
+                ch_idx = np.array([ch_names.index(ch) for ch in picks])
+
+            freqs = group["freqs"][:]
+            f_sl = _bounds_to_slice(freqs, fmin, fmax)
+            sl = [f_sl]
+            out = {"freqs": freqs[f_sl]}
+            if "times" in group:
+                times = group["times"][:]
+                t_sl = _bounds_to_slice(times, tmin, tmax)
+                sl.append(t_sl)
+                out.update(
+                    times=times[t_sl],
+                    nave=int(group.attrs["nave"]),
+                    method=group.attrs["method"],
+                )
+
+            # hdf5 fancy indexing requires increasing indices.
+            order = np.argsort(ch_idx)
+            data = group["data"][(ch_idx[order], *sl)]
+            out["data"] = data[np.argsort(order)]
+            out["ch_names"] = [ch_names[i] for i in ch_idx]
+        return out
+
+    def read(self, kind: str, stage: str, **kwargs):
+        """Reads a slice of the stored data into an MNE object.
+
+        Args:
+            kind: Kind of the items, e.g., "psd" or "spindles-tfr".
+            stage: Sleep stage.
+            **kwargs: Arguments passed to :py:meth:`get_data`.
+
+        Returns:
+            :py:class:`mne:mne.time_frequency.SpectrumArray` for spectra
+            or :py:class:`mne:mne.time_frequency.AverageTFR` for TFRs.
+        """
+        from h5io import read_hdf5
+
+        sliced = self.get_data(kind, stage, **kwargs)
+        info = mne.Info(
+            **read_hdf5(self.path, title=_info_title(kind, stage), slash="replace")[
+                "info"
+            ]
+        )
+        info = mne.pick_info(
+            info, [info.ch_names.index(ch) for ch in sliced["ch_names"]]
+        )
+        if "times" in sliced:
+            return mne.time_frequency.AverageTFR(
+                info=info,
+                data=sliced["data"],
+                times=sliced["times"],
+                freqs=sliced["freqs"],
+                nave=sliced["nave"],
+                method=sliced["method"],
+            )
+        return mne.time_frequency.SpectrumArray(
+            data=sliced["data"], info=info, freqs=sliced["freqs"]
+        )
+
+
+def _bounds_to_slice(values, vmin, vmax):
+    start = 0 if vmin is None else int(np.searchsorted(values, vmin, side="left"))
+    stop = (
+        len(values)
+        if vmax is None
+        else int(np.searchsorted(values, vmax, side="right"))
+    )
+    return slice(start, stop)
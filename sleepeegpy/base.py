@@ -13,11 +13,39 @@ from attrs import define, field
 from loguru import logger
 from tqdm import tqdm
 
+from .archive import ARCHIVE_FNAME, SleepArchive, find_archive, write_archive
+from .interpolation import INTERPOLATION_CACHE, InterpolationCache
+from .intervals import Intervals, bad_intervals
 from .utils import logger_wraps
 
 # For type annotation of pipe elements.
 BasePipeType = TypeVar("BasePipeType", bound="BasePipe")
 
+DETECTION_BLOCK_SEC = 300
+"""Length in seconds of the hypnogram blocks fingerprinted for re-detection."""
+
+EVENT_TIME_COLUMNS = (
+    "Start",
+    "Peak",
+    "NegPeak",
+    "MidCrossing",
+    "PosPeak",
+    "End",
+    "SigmaPeak",
+    "CooccurringSpindlePeak",
+)
+"""Event table columns holding times in seconds from the beginning of the data."""
+
+DEFAULT_BANDS = {
+    "Delta": (0, 3.99),
+    "Theta": (4, 7.99),
+    "Alpha": (8, 12.49),
+    "Sigma": (12.5, 15),
+    "Beta": (12.5, 29.99),
+    "Gamma": (30, 60),
+}
+"""Frequency bands band powers, spectral features and coherence default to."""
+
 
 @define(kw_only=True, slots=False)
 class BasePipe(ABC):
@@ -79,6 +107,16 @@ class BasePipe(ABC):
         """
         return self.mne_raw.info["sfreq"]
 
+    @property
+    def bad_intervals(self) -> Intervals:
+        """Interval index of the samples annotated as BAD,
+        rebuilt only when the annotations change.
+
+        Returns:
+            Intervals: Sorted, merged intervals of BAD samples.
+        """
+        return bad_intervals(self.mne_raw)
+
     @property
     def bad_data_percent(self):
         """Calculates percent of data segments annotated as BAD.
@@ -86,31 +124,43 @@ class BasePipe(ABC):
         Returns:
             float: percent of bad data spans in raw data
         """
-        df = self.mne_raw.annotations.to_data_frame()
-        return round(
-            100
-            * (
-                df[df.description.str.contains("bad", case=False)].duration.sum()
-                * self.sf
-            )
-            / self.mne_raw.n_times,
-            2,
-        )
+        return round(self.bad_intervals.percent, 2)
+
+    def _bad_samples(self, annotations=None):
+        """Boolean mask of samples annotated as BAD,
+        by the recording's annotations if None."""
+        if annotations is None:
+            return self.bad_intervals.mask()
+        return Intervals.from_annotations(
+            self.mne_raw, annotations=annotations
+        ).mask()
 
     @logger_wraps()
-    def interpolate_bads(self, **interp_kwargs):
+    def interpolate_bads(
+        self, cache: InterpolationCache | bool = True, **interp_kwargs
+    ):
         """A wrapper for :py:meth:`mne:mne.io.Raw.interpolate_bads`
 
         Args:
+            cache: Cache of the spherical-spline interpolation matrices,
+                reused across subjects on the same net with the same bad channels.
+                If True, the cache shared by the session, if False, no caching.
+                Defaults to True.
             **interp_kwargs: Arguments passed to :py:meth:`mne:mne.io.Raw.interpolate_bads`.
         """
         from ast import literal_eval
+        from contextlib import nullcontext
         from natsort import natsorted
 
         bads = (
             self.mne_raw.info["bads"] if self.mne_raw.info["bads"] is not None else []
         )
-        self.mne_raw.load_data().interpolate_bads(**interp_kwargs)
+        if cache is True:
+            cache = INTERPOLATION_CACHE
+        with cache.patch() if cache else nullcontext():
+            self.mne_raw.load_data().interpolate_bads(**interp_kwargs)
+        if cache:
+            cache.log_stats()
         try:
             old_interp = literal_eval(self.mne_raw.info["description"])
         except:
@@ -313,6 +363,19 @@ class BaseHypnoPipe(BasePipe, ABC):
             hypno_up = hypno_up[0:npts_data]
         self.hypno_up = hypno_up
 
+    def stage_intervals(self, stages: int | Iterable[int]) -> Intervals:
+        """Interval index of the runs of the upsampled hypnogram
+        scored as any of the stages.
+
+        Args:
+            stages: Sleep stage or stages, e.g., 2 or (1, 2, 3).
+
+        Returns:
+            Intervals: Sorted, merged intervals of the stage samples.
+        """
+        stages = [stages] if isinstance(stages, (int, np.integer)) else list(stages)
+        return Intervals.from_mask(np.isin(self.hypno_up, stages))
+
     @logger_wraps()
     def predict_hypno(
         self,
@@ -395,11 +458,202 @@ class BaseEventPipe(BaseHypnoPipe, ABC):
     """Instances of :py:class:`mne:mne.time_frequency.AverageTFR` per sleep stage.
     """
 
+    averages: dict = field(init=False, factory=dict)
+    """Event-locked averages per grouping variable ("Channel" or "Stage")
+    as returned by :py:meth:`compute_average`.
+    """
+
+    _detect_kwargs: dict = field(init=False, factory=dict)
+    _fingerprints: dict = field(init=False, factory=dict)
+
+    # Default landmark and window of the event-locked data.
+    _sync_center = "Peak"
+    _sync_window = (1, 1)
+    # Whether detection in a hypnogram block depends only on the signal around it,
+    # so that rescored blocks can be re-detected alone.
+    _block_local_detection = True
+
     @abstractmethod
     def detect(self):
         """Each event class should contain the detection method"""
         pass
 
+    def _get_detection_inst(self, picks, reference):
+        inst = self.mne_raw.copy().load_data()
+        if reference is not None:
+            inst.set_eeg_reference(ref_channels=reference)
+        return inst.pick(picks)
+
+    def _remember_detection(self, picks, reference, detect_kwargs):
+        """Stores detection arguments and input fingerprints for :py:meth:`redetect`."""
+        self._detect_kwargs = dict(picks=picks, reference=reference, **detect_kwargs)
+        self._fingerprints = (
+            self._fingerprint(
+                self.results._data, self.results._ch_names, self.results._hypno
+            )
+            if self.results is not None
+            else dict()
+        )
+
+    def _fingerprint(self, data, ch_names, hypno):
+        """Hashes every channel of the data and every hypnogram block."""
+        from hashlib import blake2b
+
+        def digest(arr):
+            return blake2b(np.ascontiguousarray(arr).tobytes(), digest_size=16).digest()
+
+        channels = {ch: digest(row) for ch, row in zip(ch_names, data)}
+        blocks = dict()
+        if hypno is not None:
+            n_block = int(DETECTION_BLOCK_SEC * self.sf)
+            for start in range(0, hypno.size, n_block):
+                stop = min(start + n_block, hypno.size)
+                blocks[(start, stop)] = digest(hypno[start:stop])
+        return {"channels": channels, "blocks": blocks}
+
+    @logger_wraps()
+    def redetect(self, pad_sec: float = 30, save: bool = False):
+        """Re-runs the last detection only where its inputs have changed.
+
+        Channels whose signal has changed (e.g., after interpolation) are re-detected
+        over the whole recording. Hypnogram blocks of DETECTION_BLOCK_SEC seconds
+        whose scoring has changed are re-detected on the rest of the channels.
+        Detections with thresholds computed over the whole night, such as
+        the RMS threshold of spindles, re-detect every channel over the whole
+        recording instead, since rescoring moves events outside the rescored blocks.
+        New events replace the outdated ones in self.results.
+        Falls back to the full detection if the channels or the recording length
+        have changed or if multi_only or remove_outliers were used.
+
+        Args:
+            pad_sec: Seconds of signal added on both sides of a re-detected block
+                to avoid filter edge effects. Defaults to 30.
+            save: Whether to save the events to csv. Defaults to False.
+        """
+        import pandas as pd
+
+        # Incremental detection needs the detection on arrays of the child class.
+        if not hasattr(self, "_detect_array"):
+            raise AttributeError(
+                f"'{self.__class__.__name__}' doesn't support incremental detection"
+            )
+        if not self._detect_kwargs:
+            raise AttributeError("Run the detect method first")
+
+        kwargs = dict(self._detect_kwargs)
+        picks, reference = kwargs.pop("picks"), kwargs.pop("reference")
+        inst = self._get_detection_inst(picks, reference)
+        ch_names = inst.ch_names
+        if (
+            self.results is None
+            or ch_names != list(self.results._ch_names)
+            or inst.n_times != self.results._data.shape[1]
+            or kwargs.get("multi_only")
+            or kwargs.get("remove_outliers")
+        ):
+            logger.info("Incremental detection isn't possible, running full detection")
+            return self.detect(picks=picks, reference=reference, save=save, **kwargs)
+
+        data = inst.get_data(units=dict(eeg="uV", emg="uV", eog="uV", ecg="uV"))
+        hypno = None if self.hypno_up is None else np.asarray(self.hypno_up, dtype=int)
+        fingerprints = self._fingerprint(data, ch_names, hypno)
+        changed_chans = np.array(
+            [
+                i
+                for i, ch in enumerate(ch_names)
+                if fingerprints["channels"][ch] != self._fingerprints["channels"][ch]
+            ],
+            dtype=int,
+        )
+        changed_blocks = [
+            block
+            for block, digest in fingerprints["blocks"].items()
+            if self._fingerprints["blocks"].get(block) != digest
+        ]
+        if changed_blocks and not self._block_local_detection:
+            changed_chans = np.arange(len(ch_names))
+        kept_chans = np.setdiff1d(np.arange(len(ch_names)), changed_chans)
+
+        events = self.results._events
+        data_filt = self.results._data_filt
+        starts = (events["Start"] * self.sf).round().astype(int)
+        keep = ~events["IdxChannel"].isin(changed_chans)
+        for start, stop in changed_blocks:
+            keep &= ~starts.between(start, stop - 1)
+        new_events = [events[keep]]
+
+        def collect(results, chans, offset, bounds):
+            ev = results._events.copy()
+            ev["IdxChannel"] = chans[ev["IdxChannel"]]
+            ev["Channel"] = [ch_names[i] for i in ev["IdxChannel"]]
+            time_cols = [col for col in EVENT_TIME_COLUMNS if col in ev]
+            ev[time_cols] += offset / self.sf
+            ev_starts = (ev["Start"] * self.sf).round().astype(int)
+            new_events.append(ev[ev_starts.between(bounds[0], bounds[1] - 1)])
+
+        # Changed channels are re-detected over the whole recording.
+        if changed_chans.size:
+            results = self._detect_array(
+                data[changed_chans],
+                [ch_names[i] for i in changed_chans],
+                hypno,
+                **kwargs,
+            )
+            if results is not None:
+                collect(results, changed_chans, 0, (0, inst.n_times))
+                data_filt[changed_chans] = results._data_filt
+
+        # Changed hypnogram blocks are re-detected on the unchanged channels.
+        pad = int(pad_sec * self.sf)
+        include = np.atleast_1d(kwargs.get("include"))
+        for start, stop in self._merge_blocks(changed_blocks):
+            if not kept_chans.size or not np.isin(hypno[start:stop], include).any():
+                continue
+            lo, hi = max(0, start - pad), min(inst.n_times, stop + pad)
+            results = self._detect_array(
+                data[kept_chans, lo:hi],
+                [ch_names[i] for i in kept_chans],
+                hypno[lo:hi],
+                **kwargs,
+            )
+            if results is not None:
+                collect(results, kept_chans, lo, (start, stop))
+                data_filt[kept_chans, start:stop] = results._data_filt[
+                    :, start - lo : stop - lo
+                ]
+
+        events = (
+            pd.concat(new_events, ignore_index=True)
+            .sort_values(["IdxChannel", "Start"])
+            .reset_index(drop=True)
+        )
+        self.results = type(self.results)(
+            events=events,
+            data=data,
+            sf=self.sf,
+            ch_names=ch_names,
+            hypno=hypno,
+            data_filt=data_filt,
+        )
+        self._fingerprints = fingerprints
+        logger.info(
+            f"Re-detected channels: {[ch_names[i] for i in changed_chans]}, "
+            f"re-detected hypnogram blocks: {len(changed_blocks)}"
+        )
+        if save:
+            self._save_to_csv()
+
+    @staticmethod
+    def _merge_blocks(blocks):
+        """Merges adjacent (start, stop) blocks into continuous spans."""
+        spans = []
+        for start, stop in sorted(blocks):
+            if spans and spans[-1][1] == start:
+                spans[-1][1] = stop
+            else:
+                spans.append([start, stop])
+        return spans
+
     def _save_to_csv(self):
         self.results.summary().to_csv(
             self.output_dir
@@ -408,17 +662,281 @@ class BaseEventPipe(BaseHypnoPipe, ABC):
             index=False,
         )
 
+    def _iter_sync_events(self, center, time_before, time_after, filt=None, mask=None):
+        """Yields channel index, events' stages and event-locked data
+        of shape (n_events, n_times) per channel."""
+        sf = self.results._sf
+        data = self.results._data
+        if filt is not None and any(filt):
+            data = mne.filter.filter_data(
+                data, sf, l_freq=filt[0], h_freq=filt[1], method="fir", verbose=False
+            )
+        events = self.results._events
+        if mask is not None:
+            events = events.loc[np.asarray(mask)]
+
+        offsets = np.arange(-int(sf * time_before), int(sf * time_after) + 1)
+        for i, ev_chan in events.groupby("IdxChannel"):
+            peaks = (ev_chan[center] * sf).astype(int).to_numpy()
+            # Drop events whose window exceeds the data.
+            valid = (peaks + offsets[0] >= 0) & (peaks + offsets[-1] < data.shape[1])
+            stages = ev_chan["Stage"].to_numpy()[valid] if "Stage" in ev_chan else None
+            yield i, stages, data[i, peaks[valid, None] + offsets]
+
     @logger_wraps()
-    def plot_average(self, save: bool = False, **kwargs):
+    def compute_average(
+        self,
+        center: str | None = None,
+        hue: str = "Channel",
+        time_before: float | None = None,
+        time_after: float | None = None,
+        filt: tuple = (None, None),
+        mask: Iterable[bool] | None = None,
+        n_boot: int = 1000,
+        ci: float = 95,
+        seed: int | None = None,
+        save: bool = False,
+        overwrite: bool = False,
+    ):
+        """Computes event-locked averages directly from the detection signal.
+
+        For every channel or sleep stage computes mean, standard error of the mean
+        and bootstrap confidence interval of the signal around the events.
+        The bootstrap draws Poisson(1) weights per event, so it reduces to
+        one matrix product per chunk of events. Results are stored in self.averages.
+
+        Args:
+            center: Event landmark to center on, e.g., "Peak" or "NegPeak".
+                If None, "Peak" for spindles and "NegPeak" for slow waves. Defaults to None.
+            hue: Grouping variable, "Channel" or "Stage". Defaults to "Channel".
+            time_before: Seconds before the center. If None, 1 for spindles
+                and 0.4 for slow waves. Defaults to None.
+            time_after: Seconds after the center. If None, 1 for spindles
+                and 0.8 for slow waves. Defaults to None.
+            filt: Band-pass filter edges applied to the data before averaging.
+                Defaults to (None, None).
+            mask: Boolean mask selecting the events to average. Defaults to None.
+            n_boot: Number of bootstrap resamples. Defaults to 1000.
+            ci: Width of the confidence interval in percent. Defaults to 95.
+            seed: Seed of the bootstrap random generator. Defaults to None.
+            save: Whether to save self.averages to hdf5 file. Defaults to False.
+            overwrite: Whether to overwrite existing averages file. Defaults to False.
+
+        Returns:
+            dict: "times", "labels", "n_events", "mean", "sem", "ci_low" and "ci_high",
+            the last four of shape (n_labels, n_times), in microvolts.
+        """
+        from natsort import natsorted
+
+        if not self.results:
+            raise AttributeError("Run the detect method first")
+        if hue not in ("Channel", "Stage"):
+            raise ValueError("the 'hue' argument should be 'Channel' or 'Stage'")
+        if hue == "Stage" and self.results._hypno is None:
+            raise ValueError("the 'hue' argument can't be 'Stage' without a hypnogram")
+
+        center = center or self._sync_center
+        time_before = self._sync_window[0] if time_before is None else time_before
+        time_after = self._sync_window[1] if time_after is None else time_after
+        rng = np.random.default_rng(seed)
+        chunk_size = 1024
+
+        sums, boots = dict(), dict()
+        for i, stages, epochs in self._iter_sync_events(
+            center, time_before, time_after, filt, mask
+        ):
+            if hue == "Channel":
+                groups = {self.results._ch_names[i]: epochs}
+            else:
+                groups = {stage: epochs[stages == stage] for stage in np.unique(stages)}
+            for label, group in groups.items():
+                n_times = group.shape[1]
+                acc = sums.setdefault(label, [0, np.zeros(n_times), np.zeros(n_times)])
+                boot = boots.setdefault(
+                    label, [np.zeros(n_boot), np.zeros((n_boot, n_times))]
+                )
+                acc[0] += group.shape[0]
+                acc[1] += group.sum(axis=0)
+                acc[2] += np.square(group).sum(axis=0)
+                for start in range(0, group.shape[0], chunk_size):
+                    chunk = group[start : start + chunk_size]
+                    weights = rng.poisson(1, size=(n_boot, chunk.shape[0]))
+                    boot[0] += weights.sum(axis=1)
+                    boot[1] += weights @ chunk
+
+        if not sums:
+            raise ValueError("Could not calculate event-locked data.")
+
+        labels = natsorted(sums)
+        n_events = np.array([sums[label][0] for label in labels])
+        mean = np.array([sums[label][1] for label in labels]) / n_events[:, None]
+        var = (
+            np.array([sums[label][2] for label in labels])
+            - n_events[:, None] * np.square(mean)
+        ) / np.maximum(n_events - 1, 1)[:, None]
+        boot_means = np.array(
+            [
+                np.divide(
+                    boots[label][1],
+                    boots[label][0][:, None],
+                    out=np.full_like(boots[label][1], np.nan),
+                    where=boots[label][0][:, None] > 0,
+                )
+                for label in labels
+            ]
+        )
+        ci_low, ci_high = np.nanpercentile(
+            boot_means, [(100 - ci) / 2, 100 - (100 - ci) / 2], axis=1
+        )
+        sf = self.results._sf
+        self.averages[hue] = {
+            "times": np.arange(-int(sf * time_before), int(sf * time_after) + 1) / sf,
+            "labels": labels,
+            "n_events": n_events,
+            "mean": mean,
+            "sem": np.sqrt(np.clip(var, 0, None) / n_events[:, None]),
+            "ci_low": ci_low,
+            "ci_high": ci_high,
+            "params": {
+                "center": center,
+                "time_before": time_before,
+                "time_after": time_after,
+                "filt": list(filt),
+                "n_boot": n_boot,
+                "ci": ci,
+            },
+        }
+        if save:
+            from h5io import write_hdf5
+
+            write_hdf5(
+                self.output_dir
+                / self.__class__.__name__
+                / f"{self.__class__.__name__[:-4].lower()}_averages.h5",
+                self.averages,
+                title="averages",
+                overwrite=overwrite,
+            )
+        return self.averages[hue]
+
+    @logger_wraps()
+    def plot_average(
+        self,
+        save: bool = False,
+        center: str | None = None,
+        hue: str = "Channel",
+        time_before: float | None = None,
+        time_after: float | None = None,
+        filt: tuple = (None, None),
+        mask: Iterable[bool] | None = None,
+        errorbar: str | None = "ci",
+        axis: plt.axis = None,
+        figsize: tuple = (6, 4.5),
+        **kwargs,
+    ):
         """Plot average of the detected event.
 
+        Drawn from the arrays computed by :py:meth:`compute_average`,
+        which is run if self.averages lacks the requested average.
+
         Args:
             save: Whether to save the figure to file. Defaults to False.
-            **kwargs: Arguments passed to the YASA's plot_average().
+            center: Refer to :py:meth:`compute_average`. Defaults to None.
+            hue: "Channel" or "Stage". Defaults to "Channel".
+            time_before: Refer to :py:meth:`compute_average`. Defaults to None.
+            time_after: Refer to :py:meth:`compute_average`. Defaults to None.
+            filt: Refer to :py:meth:`compute_average`. Defaults to (None, None).
+            mask: Refer to :py:meth:`compute_average`. Defaults to None.
+            errorbar: Shaded interval around the mean, "ci" for the bootstrap
+                confidence interval, "se" for the standard error or None.
+                Defaults to "ci".
+            axis: Instance of :py:class:`mpl:matplotlib.axes.Axes`.
+                Defaults to None.
+            figsize: Figure size in inches. Has no effect if axis is provided.
+                Defaults to (6, 4.5).
+            **kwargs: Arguments passed to :py:func:`seaborn.lineplot`, as before.
+                If given, the average is drawn by seaborn from YASA's
+                sync events instead of the arrays of :py:meth:`compute_average`,
+                which is slower.
         """
-        self.results.plot_average(**kwargs)
+        if axis is None:
+            fig, axis = plt.subplots(1, 1, figsize=figsize)
+        if kwargs:
+            self._plot_sync_events(
+                axis, center, hue, time_before, time_after, filt, mask, errorbar, kwargs
+            )
+            if save:
+                self._savefig(
+                    f"{self.__class__.__name__[:-4].lower()}_avg.png", axis.get_figure()
+                )
+            return
+
+        params = {
+            "center": center or self._sync_center,
+            "time_before": self._sync_window[0] if time_before is None else time_before,
+            "time_after": self._sync_window[1] if time_after is None else time_after,
+            "filt": list(filt),
+        }
+        avg = self.averages.get(hue)
+        if (
+            mask is not None
+            or avg is None
+            or any(avg["params"][k] != v for k, v in params.items())
+        ):
+            avg = self.compute_average(hue=hue, mask=mask, **params)
+
+        for i, label in enumerate(avg["labels"]):
+            (line,) = axis.plot(avg["times"], avg["mean"][i], label=label, **kwargs)
+            if errorbar == "ci":
+                low, high = avg["ci_low"][i], avg["ci_high"][i]
+            elif errorbar == "se":
+                low = avg["mean"][i] - avg["sem"][i]
+                high = avg["mean"][i] + avg["sem"][i]
+            else:
+                continue
+            axis.fill_between(
+                avg["times"], low, high, color=line.get_color(), alpha=0.2, linewidth=0
+            )
+        axis.set_xlim(avg["times"][0], avg["times"][-1])
+        axis.set_title(f"Average {self.__class__.__name__[:-4]}")
+        axis.set_xlabel("Time (sec)")
+        axis.set_ylabel("Amplitude (uV)")
+        axis.legend(title=hue)
         if save:
-            self._savefig(f"{self.__class__.__name__[:-4].lower()}_avg.png")
+            self._savefig(
+                f"{self.__class__.__name__[:-4].lower()}_avg.png", axis.get_figure()
+            )
+
+    def _plot_sync_events(
+        self, axis, center, hue, time_before, time_after, filt, mask, errorbar, kwargs
+    ):
+        """Draws the average by seaborn from YASA's long-format sync events."""
+        import seaborn as sns
+
+        df_sync = self.results.get_sync_events(
+            center=center or self._sync_center,
+            time_before=self._sync_window[0] if time_before is None else time_before,
+            time_after=self._sync_window[1] if time_after is None else time_after,
+            filt=filt,
+            mask=mask,
+        )
+        if df_sync.empty:
+            raise ValueError("Could not calculate event-locked data.")
+        if hue not in df_sync.columns:
+            raise ValueError(f"{hue} is not present in data.")
+        sns.lineplot(
+            data=df_sync,
+            x="Time",
+            y="Amplitude",
+            hue=hue,
+            errorbar=errorbar,
+            ax=axis,
+            **kwargs,
+        )
+        axis.set_xlim(df_sync["Time"].min(), df_sync["Time"].max())
+        axis.set_title(f"Average {self.__class__.__name__[:-4]}")
+        axis.set_xlabel("Time (sec)")
+        axis.set_ylabel("Amplitude (uV)")
 
     @logger_wraps()
     def plot_topomap(
@@ -647,9 +1165,11 @@ class BaseEventPipe(BaseHypnoPipe, ABC):
         method: str = "morlet",
         save: bool = False,
         overwrite: bool = False,
+        archive: bool = False,
         **tfr_kwargs,
     ):
         """Transforms the events signal to time-frequency representation.
+        Without a hypnogram, the TFRs of all events are stored as "Unscored".
 
         Args:
             freqs: Lower and upper bounds of frequencies of interest in Hz, e.g., (10,20).
@@ -659,6 +1179,8 @@ class BaseEventPipe(BaseHypnoPipe, ABC):
             method: TFR transform method. Defaults to "morlet".
             save: Whether to save the TFRs to file. Defaults to False.
             overwrite: Whether to overwrite existing TFR files.
+            archive: Whether to save the TFRs into the per-subject archive
+                instead of a file per sleep stage. Defaults to False.
             **tfr_kwargs: Arguments passed to :py:func:`mne:mne.time_frequency.tfr_array_morlet`
                 or :py:func:`mne:mne.time_frequency.tfr_array_multitaper`.
         """
@@ -684,34 +1206,24 @@ class BaseEventPipe(BaseHypnoPipe, ABC):
         tfr_kwargs["output"] = "avg_power"
 
         freqs = np.linspace(freqs[0], freqs[1], n_freqs)
-        # Get df with eeg signal per detected event.
-        df_raw = self.results.get_sync_events(
-            time_before=time_before, time_after=time_after
-        )[["Event", "Amplitude", "Channel", "Stage"]]
+        # As number of events ("epochs") per channel is heterogeneous,
+        # for every stage and channel collect data array
+        # of shape (n_events, 1, n_event_times).
+        per_stage = dict()
+        for i, stages, epochs in self._iter_sync_events(
+            self._sync_center, time_before, time_after
+        ):
+            # Without a hypnogram all events are unscored.
+            if stages is None:
+                stages = np.full(len(epochs), -2)
+            for stage in np.unique(stages):
+                per_stage.setdefault(stage, dict())[self.results._ch_names[i]] = (
+                    np.expand_dims(epochs[stages == stage], axis=1)
+                )
 
         self.tfrs = {}
 
-        for stage in df_raw["Stage"].unique():
-            df = df_raw[df_raw["Stage"] == stage]
-            df = df.groupby(["Channel", "Event"], group_keys=True).apply(
-                lambda x: x["Amplitude"]
-            )
-
-            # As number of events ("epochs") per channel is heterogeneous,
-            # for every channel create dict mapping channel and
-            # data array of shape (n_events, 1, n_event_times)
-            for_tfrs = {
-                channel: np.expand_dims(
-                    np.array(
-                        events_df.groupby(level=1)
-                        .apply(lambda x: x.to_numpy())
-                        .tolist()
-                    ),
-                    axis=1,
-                )
-                for channel, events_df in df.groupby(level=0)
-            }
-
+        for stage, for_tfrs in per_stage.items():
             # Calculate tfrs per channel
             if method == "morlet":
                 tfrs = {
@@ -755,7 +1267,14 @@ class BaseEventPipe(BaseHypnoPipe, ABC):
                 nave=np.mean([arr.shape[0] for arr in for_tfrs.values()], dtype=int),
                 method=method,
             )
-        if save:
+        if save and archive:
+            write_archive(
+                self.output_dir / ARCHIVE_FNAME,
+                f"{self.__class__.__name__[:-4].lower()}-tfr",
+                self.tfrs,
+                overwrite=overwrite,
+            )
+        elif save:
             for stage, tfr in self.tfrs.items():
                 tfr.save(
                     self.output_dir
@@ -765,25 +1284,52 @@ class BaseEventPipe(BaseHypnoPipe, ABC):
                 )
 
     @logger_wraps()
-    def read_tfrs(self, dirpath: str | None = None):
-        """Loads TFRs stored in hdf5 files.
+    def read_tfrs(
+        self,
+        dirpath: str | None = None,
+        stages: Iterable[str] | None = None,
+        picks: str | Iterable[str] | None = None,
+        fmin: float | None = None,
+        fmax: float | None = None,
+    ):
+        """Loads TFRs stored in the archive or in hdf5 files.
 
-        Filenames should end with {type_of_event}_{sleep_stage}-tfr.h5
+        The archive is looked up in dirpath and in its parent directory.
+        If it's not found, filenames should end with {type_of_event}_{sleep_stage}-tfr.h5
 
         Args:
-            dirpath: Path to the directory containing hdf5 files. Defaults to None.
+            dirpath: Path to the archive or to the directory containing hdf5 files.
+                Defaults to None.
+            stages: Sleep stages to load. If None, all stages. Defaults to None.
+            picks: Channels to load. If None, all channels. Defaults to None.
+            fmin: Lower frequency bound. Defaults to None.
+            fmax: Upper frequency bound. Defaults to None.
         """
         import re
 
-        r = f"{self.__class__.__name__[:-4].lower()}_(.+)(?:-tfr.h5)"
+        kind = f"{self.__class__.__name__[:-4].lower()}-tfr"
         self.tfrs = dict()
         dirpath = (
             Path(dirpath) if dirpath else self.output_dir / self.__class__.__name__
         )
+        path_to_archive = find_archive(dirpath, kind)
+        if path_to_archive:
+            archive = SleepArchive(path=path_to_archive)
+            for stage in archive.stages(kind):
+                if stages is None or stage in stages:
+                    self.tfrs[stage] = archive.read(
+                        kind, stage, picks=picks, fmin=fmin, fmax=fmax
+                    )
+            return
+
+        r = f"{self.__class__.__name__[:-4].lower()}_(.+)(?:-tfr.h5)"
         for p in dirpath.glob("*tfr.h5"):
             m = re.search(r, str(p))
-            if m:
-                self.tfrs[m.groups()[0]] = mne.time_frequency.read_tfrs(p)[0]
+            if m and (stages is None or m.groups()[0] in stages):
+                tfr = mne.time_frequency.read_tfrs(p)[0]
+                if picks is not None:
+                    tfr.pick(picks)
+                self.tfrs[m.groups()[0]] = tfr.crop(fmin=fmin, fmax=fmax)
 
 
 @define(kw_only=True, slots=False)
@@ -952,25 +1498,9 @@ class SpectrumPlots(ABC):
 
         [(_, b)] = band.items()
 
-        # Convert from Volts^2/Hz to microVolts^2/Hz or dB.
-        psds = (
-            10 * np.log10(10**12 * self.psds[stage]._data)
-            if dB
-            else 10**12 * self.psds[stage]._data
-        )
-        # Extract PSD values from specific stage for frequencies of interest.
-        psds = np.take(
-            psds,
-            np.where(
-                np.logical_and(
-                    self.psds[stage]._freqs >= b[0],
-                    self.psds[stage]._freqs <= b[1],
-                )
-            )[0],
-            axis=1,
-        ).mean(
-            axis=1
-        )  # Sum vs Mean vs Median?
+        # Mean PSD of the band per channel in microVolts^2/Hz or dB.
+        _, band_powers = self.compute_band_powers(bands=band, stages=[stage])
+        psds = band_powers["mean_psd_db" if dB else "mean_psd"][0, 0]
 
         plot_topomap(
             data=psds,
@@ -990,14 +1520,7 @@ class SpectrumPlots(ABC):
     def plot_topomap_collage(
         self,
         stages_to_plot: tuple = "all",
-        bands: dict = {
-            "Delta": (0, 3.99),
-            "Theta": (4, 7.99),
-            "Alpha": (8, 12.49),
-            "Sigma": (12.5, 15),
-            "Beta": (12.5, 29.99),
-            "Gamma": (30, 60),
-        },
+        bands: dict = DEFAULT_BANDS,
         dB: bool = False,
         low_percentile: float = 5,
         high_percentile: float = 95,
@@ -1059,31 +1582,11 @@ class SpectrumPlots(ABC):
         if high_percentile:
             perc_high = dict()
 
-        psds_per_stage_per_band = np.empty(
-            (len(stages_to_plot), len(bands)), dtype=object
-        )
-        for col_index, (band_key, b) in enumerate(bands.items()):
-            for_perc = []
-            for row_index, stage in enumerate(self.psds):
-                psds = (
-                    10 * np.log10(10**12 * self.psds[stage]._data)
-                    if dB
-                    else 10**12 * self.psds[stage]._data
-                )
-                # Extract PSD values from specific stage for frequencies of interest.
-                psds = np.take(
-                    psds,
-                    np.where(
-                        np.logical_and(
-                            self.psds[stage]._freqs >= b[0],
-                            self.psds[stage]._freqs <= b[1],
-                        )
-                    )[0],
-                    axis=1,
-                ).mean(axis=1)
-
-                for_perc.append(psds)
-                psds_per_stage_per_band[row_index, col_index] = psds
+        # Mean PSD of the bands per stage per channel in microVolts^2/Hz or dB.
+        _, band_powers = self.compute_band_powers(bands=bands)
+        psds_per_stage_per_band = band_powers["mean_psd_db" if dB else "mean_psd"]
+        for col_index, band_key in enumerate(bands):
+            for_perc = psds_per_stage_per_band[:, col_index]
             if low_percentile:
                 perc_low[band_key] = np.percentile(for_perc, low_percentile)
             if high_percentile:
@@ -1099,7 +1602,9 @@ class SpectrumPlots(ABC):
                     topomap_args["vlim"][1] = perc_high[band_key]
 
                 plot_topomap(
-                    data=psds_per_stage_per_band[row_index, col_index],
+                    data=psds_per_stage_per_band[
+                        band_powers["stages"].index(stage), col_index
+                    ],
                     axis=axes[col_index],
                     info=self.psds[stage].info,
                     topomap_args=topomap_args,
@@ -1118,17 +1623,136 @@ class SpectrumPlots(ABC):
             self._savefig(f"topomap_psd_collage.png", fig)
 
     @logger_wraps()
-    def save_psds(self, overwrite):
+    def compute_band_powers(
+        self,
+        bands: dict = DEFAULT_BANDS,
+        stages: Iterable[str] | None = None,
+        save: bool = False,
+    ):
+        """Computes band powers of every sleep stage and channel at once.
+
+        The PSDs are integrated over the bands, both edges included,
+        by differences of their cumulative sums over the frequency axis.
+        Relative powers are band powers divided by the power of the whole spectrum.
+        Band means of the PSDs are the values plotted by the topomaps.
+
+        Args:
+            bands: Dict of name-value pairs - with name=arbitrary name
+                and value=(l_freq, h_freq).
+                Defaults to { "Delta": (0, 3.99), "Theta": (4, 7.99), "Alpha": (8, 12.49),
+                "Sigma": (12.5, 15), "Beta": (12.5, 29.99), "Gamma": (30, 60), }.
+            stages: Sleep stages to compute band powers for.
+                If None, every stage in psds. Defaults to None.
+            save: Whether to save the table to band_powers.parquet
+                and the arrays with their coordinates to band_powers.h5.
+                Defaults to False.
+
+        Returns:
+            tuple: :py:class:`pandas:pandas.DataFrame` with a row per stage, band
+            and channel and power (uV^2), relative_power, mean_psd (uV^2/Hz)
+            and mean_psd_db columns, and a dict of arrays
+            of shape (n_stages, n_bands, n_channels) per column,
+            with their "stages", "bands" and "ch_names" coordinates.
+        """
+        import pandas as pd
+
+        stages = list(self.psds) if stages is None else list(stages)
+        freqs = self.psds[stages[0]].freqs
+        ch_names = self.psds[stages[0]].ch_names
+        for stage in stages:
+            if not np.array_equal(self.psds[stage].freqs, freqs):
+                raise ValueError(
+                    "Spectra of all stages must have the same frequencies."
+                )
+
+        # Convert from Volts^2/Hz to microVolts^2/Hz.
+        psds = 10**12 * np.array([self.psds[stage]._data for stage in stages])
+        edges = list(bands.values())
+        band_sums, n_bins = _band_sums(psds, freqs, edges)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            arrays = {
+                "power": band_sums * (freqs[1] - freqs[0]),
+                "relative_power": band_sums / psds.sum(axis=-1, keepdims=True),
+                "mean_psd": band_sums / n_bins,
+                "mean_psd_db": _band_sums(10 * np.log10(psds), freqs, edges)[0]
+                / n_bins,
+            }
+        # From (n_stages, n_channels, n_bands) to (n_stages, n_bands, n_channels).
+        arrays = {key: np.swapaxes(value, 1, 2) for key, value in arrays.items()}
+
+        table = pd.DataFrame(
+            {key: value.ravel() for key, value in arrays.items()},
+            index=pd.MultiIndex.from_product(
+                [stages, list(bands), ch_names], names=["stage", "band", "channel"]
+            ),
+        ).reset_index()
+        for i, col in enumerate(["l_freq", "h_freq"]):
+            edges = {key: band[i] for key, band in bands.items()}
+            table.insert(2 + i, col, table["band"].map(edges))
+
+        arrays = {
+            "stages": stages,
+            "bands": list(bands),
+            "ch_names": ch_names,
+            **arrays,
+        }
+        if save:
+            from h5io import write_hdf5
+
+            fname = self.output_dir / self.__class__.__name__ / "band_powers"
+            table.to_parquet(fname.with_suffix(".parquet"), index=False)
+            write_hdf5(
+                fname.with_suffix(".h5"),
+                {**arrays, "band_edges": np.array(list(bands.values()), dtype=float)},
+                title="band_powers",
+                overwrite=True,
+            )
+
+        return table, arrays
+
+    @logger_wraps()
+    def save_psds(self, overwrite, archive=False):
         """Saves SleepSpectrum objects to h5 files.
 
         Args:
             overwrite: Whether to overwrite existing spectrum files.
+            archive: Whether to save the spectra into the per-subject archive
+                instead of a file per sleep stage. Defaults to False.
         """
         import re
 
+        if archive:
+            write_archive(
+                self.output_dir / ARCHIVE_FNAME,
+                "psd",
+                {re.sub(r"[^\w\s-]", "_", k): v for k, v in self.psds.items()},
+                overwrite=overwrite,
+            )
+            return
+
         for stage, spectrum in self.psds.items():
             stage = re.sub(r"[^\w\s-]", "_", stage)
             spectrum.save(
                 self.output_dir / self.__class__.__name__ / f"{stage}-psd.h5",
                 overwrite=overwrite,
             )
+
+
+def _band_sums(values, freqs, edges):
+    """Sums of values of shape (..., n_freqs) over frequency bands,
+    both edges included, by differences of their cumulative sums.
+
+    Args:
+        values: Array of shape (..., n_freqs).
+        freqs: Increasing frequencies of the last axis of values.
+        edges: Iterable of (l_freq, h_freq) of the bands.
+
+    Returns:
+        tuple: Sums of shape (..., n_bands) and numbers of frequency bins
+        of shape (n_bands,).
+    """
+    starts = np.searchsorted(freqs, [edge[0] for edge in edges], side="left")
+    stops = np.searchsorted(freqs, [edge[1] for edge in edges], side="right")
+    pad = [(0, 0)] * (values.ndim - 1) + [(1, 0)]
+    cumsum = np.pad(np.cumsum(values, axis=-1), pad)
+    return cumsum[..., stops] - cumsum[..., starts], stops - starts
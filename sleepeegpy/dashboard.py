@@ -10,6 +10,7 @@ from matplotlib.colors import LinearSegmentedColormap
 from mne.io.pick import _picks_to_idx
 from numba.cuda.cudadrv.nvvm import logger
 
+from .interpolation import InterpolationCache
 from .pipeline import CleaningPipe, ICAPipe, SpectralPipe
 
 
@@ -90,10 +91,11 @@ def _hypno_psd(
     min_psd,
     max_psd,
     rba,
+    reference=None,
 ):
-    spectral_pipe.compute_psd(
+    spectra = spectral_pipe.compute_psd(
         sleep_stages=sleep_stages,
-        reference=None,
+        reference=reference,
         fmin=0,
         fmax=25,
         save=False,
@@ -130,11 +132,11 @@ def _hypno_psd(
         legend_args=dict(loc="upper right", fontsize="medium"),
     )
     psd_axes.axvspan(0, spectral_pipe.mne_raw.info["highpass"], alpha=0.3, color="gray")
-    return min_psd, max_psd
+    return min_psd, max_psd, spectra
 
 
 def _plot_dashboard_topographies(
-    spectral_pipe, reference, sleep_stages, topo_axes, topo_lims
+    spectral_pipe, reference, sleep_stages, topo_axes, topo_lims, average_psds=None
 ):
     if len(sleep_stages) == 1:
         stages = ["All"] * 4
@@ -149,7 +151,9 @@ def _plot_dashboard_topographies(
         topo_axes[1, 0].set_title(f"{stages[2]}, Delta (0.5-4 Hz)")
         topo_axes[1, 1].set_title(f"{stages[3]}, Theta (4-8 Hz)")
 
-    if reference != "average":
+    if average_psds is not None:
+        spectral_pipe.psds.update(average_psds)
+    elif reference != "average":
         spectral_pipe.compute_psd(
             sleep_stages=sleep_stages,
             reference="average",
@@ -225,6 +229,7 @@ def create_dashboard(
     path_to_annotations: str | os.PathLike | None = None,
     power_colorbar_limits: Sequence[tuple[float, float]] | None = None,
     prec_pipe: ICAPipe | CleaningPipe | None = None,
+    interpolation_cache: InterpolationCache | bool = True,
 ):
     """Applies cleaning, runs psd analyses and plots them on the dashboard.
     Can accept raw, resampled, filtered or cleaned (annotated) recording,
@@ -261,6 +266,10 @@ def create_dashboard(
         prec_pipe: A pipe object from which to build the dashboard.
             If of type ICAPipe, the components should be marked for exclusion,
             but not applied. Defaults to None.
+        interpolation_cache: Cache of the interpolation matrices
+            as accepts :py:meth:`~sleepeegpy.base.BasePipe.interpolate_bads`.
+            Pass an :py:class:`~sleepeegpy.interpolation.InterpolationCache`
+            with cache_dir to reuse the matrices across sessions. Defaults to True.
     """
     fig = plt.figure(layout="constrained", figsize=(1600 / 96, 1200 / 96), dpi=96)
     fig.suptitle(f"Dashboard <{subject_code}>")
@@ -278,7 +287,11 @@ def create_dashboard(
     )
     pipe = get_cleaning_pipe(output_dir, path_to_eeg, prec_pipe)
     bads, fmax, fmin, notch_freqs, sfreq = _filter_and_manage_bads(
-        bandpass_filter_freqs, path_to_bad_channels, pipe, resampling_freq
+        bandpass_filter_freqs,
+        path_to_bad_channels,
+        pipe,
+        resampling_freq,
+        interpolation_cache,
     )
     if reference:
         pipe.set_eeg_reference(ref_channels=reference)
@@ -304,6 +317,7 @@ def create_dashboard(
         pipe.read_annotations(path=path_to_annotations)
 
     is_ica, pipe = _get_ica_pipe(path_to_ica_fif, pipe, prec_pipe)
+    average_psds = None
     try:
         psd_after = _plot_dashboard_info(
             bads,
@@ -319,7 +333,7 @@ def create_dashboard(
             sfreq,
         )
         spectral_pipe.mne_raw = pipe.mne_raw
-        _plot_after_dashboard(
+        average_psds = _plot_after_dashboard(
             fig,
             grid_spec,
             hypno_psd_pick,
@@ -329,6 +343,7 @@ def create_dashboard(
             psd_after,
             sleep_stages,
             spectral_pipe,
+            reference,
         )
     except:
         logger.error(
@@ -339,7 +354,12 @@ def create_dashboard(
     topo_axes = topo_subfig.subplots(2, 2)
     try:
         _plot_dashboard_topographies(
-            spectral_pipe, reference, sleep_stages, topo_axes, power_colorbar_limits
+            spectral_pipe,
+            reference,
+            sleep_stages,
+            topo_axes,
+            power_colorbar_limits,
+            average_psds,
         )
     except:
         logger.error("Failed to plot topography. It will be missing from the dashboard")
@@ -355,7 +375,11 @@ def create_dashboard(
 
 
 def _filter_and_manage_bads(
-    bandpass_filter_freqs, path_to_bad_channels, pipe, resampling_freq
+    bandpass_filter_freqs,
+    path_to_bad_channels,
+    pipe,
+    resampling_freq,
+    interpolation_cache=True,
 ):
     sfreq, fmin, fmax, notch_freqs = _filter(
         pipe,
@@ -366,7 +390,7 @@ def _filter_and_manage_bads(
 
     if path_to_bad_channels is not None:
         pipe.read_bad_channels(path=path_to_bad_channels)
-        pipe.interpolate_bads(reset_bads=True)
+        pipe.interpolate_bads(cache=interpolation_cache, reset_bads=True)
 
     bads = []
     mne_info = pipe.mne_raw.info
@@ -387,12 +411,18 @@ def _plot_after_dashboard(
     psd_after,
     sleep_stages,
     spectral_pipe,
+    reference=None,
 ):
     hypno_after_axes = fig.add_subplot(grid_spec[2:3, 2:4])
     hypno_after_axes.set_title(
         f"Spectra after rejecting bad data spans ({picks_str_repr})"
     )
-    _hypno_psd(
+    # The average-referenced spectra of the topographies are computed
+    # in the same pass over the data.
+    references = {"original": None}
+    if reference != "average":
+        references["average"] = "average"
+    _, _, spectra = _hypno_psd(
         spectral_pipe,
         sleep_stages,
         hypno_psd_pick,
@@ -401,10 +431,12 @@ def _plot_after_dashboard(
         min_psd,
         max_psd,
         rba=True,
+        reference=references,
     )
     psd_after.get_legend().remove()
     hypno_after_axes.yaxis.set_label_coords(-0.05, 0.5)
     psd_after.yaxis.set_label_coords(-0.05, 0.5)
+    return spectra.get("average")
 
 
 def _plot_dashboard_info(
@@ -483,7 +515,7 @@ def _plot_before_parts(
     )
     hypno_before_axes.yaxis.set_label_coords(-0.05, 0.5)
 
-    min_psd, max_psd = _hypno_psd(
+    min_psd, max_psd, _ = _hypno_psd(
         s_pipe,
         sleep_stages,
         hypno_psd_pick,
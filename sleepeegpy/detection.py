@@ -0,0 +1,590 @@
+"""Native implementations of the YASA spindles and slow waves detection algorithms.
+
+The functions mirror :py:func:`yasa:yasa.spindles_detect` and :py:func:`yasa:yasa.sw_detect`
+and return the same results objects, but run the per-channel computations
+as Numba kernels in parallel threads.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from numba import njit
+
+
+@njit(nogil=True, cache=True)
+def _moving_corr(x, y, beg, end):
+    """Moving Pearson correlation, as :py:func:`yasa:yasa.moving_transform`."""
+    out = np.empty(beg.size)
+    for i in range(beg.size):
+        xs = x[beg[i] : end[i]]
+        ys = y[beg[i] : end[i]]
+        mx, my = xs.mean(), ys.mean()
+        xm2s, ym2s, r_num = 0.0, 0.0, 0.0
+        for j in range(xs.size):
+            xm = xs[j] - mx
+            ym = ys[j] - my
+            r_num += xm * ym
+            xm2s += xm**2
+            ym2s += ym**2
+        r_den = np.sqrt(xm2s) * np.sqrt(ym2s)
+        out[i] = np.nan if r_den == 0 else r_num / r_den
+    return out
+
+
+@njit(nogil=True, cache=True)
+def _moving_rms(x, beg, end):
+    """Moving root mean square, as :py:func:`yasa:yasa.moving_transform`."""
+    out = np.empty(beg.size)
+    for i in range(beg.size):
+        ms = 0.0
+        for j in range(beg[i], end[i]):
+            ms += x[j] ** 2
+        out[i] = np.sqrt(ms / (end[i] - beg[i]))
+    return out
+
+
+@njit(nogil=True, cache=True)
+def _centered_sum(x, w):
+    """Same-size moving sum, as np.convolve(x, np.ones(w), mode="same")."""
+    n = x.size
+    csum = np.zeros(n + 1, dtype=np.int64)
+    for i in range(n):
+        csum[i + 1] = csum[i] + x[i]
+    out = np.empty(n, dtype=np.int64)
+    for k in range(n):
+        lo = max(k - w // 2, 0)
+        hi = min(k - w // 2 + w, n)
+        out[k] = csum[hi] - csum[lo]
+    return out
+
+
+@njit(nogil=True, cache=True)
+def _merged_runs(cond, min_distance):
+    """Start and (inclusive) end indices of True runs,
+    merging runs separated by less than min_distance samples."""
+    starts, ends = [], []
+    i = 0
+    n = cond.size
+    while i < n:
+        if cond[i]:
+            j = i
+            while j + 1 < n and cond[j + 1]:
+                j += 1
+            if starts and i - ends[-1] < min_distance:
+                ends[-1] = j
+            else:
+                starts.append(i)
+                ends.append(j)
+            i = j + 1
+        else:
+            i += 1
+    return np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64)
+
+
+@njit(nogil=True, cache=True)
+def _local_maxima(x):
+    """Midpoints of local maxima, as in :py:func:`scipy:scipy.signal.find_peaks`."""
+    peaks = []
+    i = 1
+    i_max = x.size - 1
+    while i < i_max:
+        if x[i - 1] < x[i]:
+            i_ahead = i + 1
+            while i_ahead < i_max and x[i_ahead] == x[i]:
+                i_ahead += 1
+            if x[i_ahead] < x[i]:
+                peaks.append((i + i_ahead - 1) // 2)
+                i = i_ahead
+        i += 1
+    return np.array(peaks, dtype=np.int64)
+
+
+@njit(nogil=True, cache=True)
+def _select_by_distance(peaks, x, distance):
+    """Keeps the highest peaks at least distance samples apart."""
+    distance_ = np.ceil(distance)
+    keep = np.ones(peaks.size, dtype=np.bool_)
+    priority = np.argsort(x[peaks])
+    for i in range(peaks.size - 1, -1, -1):
+        j = priority[i]
+        if not keep[j]:
+            continue
+        k = j - 1
+        while 0 <= k and peaks[j] - peaks[k] < distance_:
+            keep[k] = False
+            k -= 1
+        k = j + 1
+        while k < peaks.size and peaks[k] - peaks[j] < distance_:
+            keep[k] = False
+            k += 1
+    return peaks[keep]
+
+
+@njit(nogil=True, cache=True)
+def _most_prominent(x, peaks):
+    """Peak with the highest prominence, as in :py:func:`scipy:scipy.signal.peak_prominences`."""
+    best, best_prom = peaks[0], -np.inf
+    for peak in peaks:
+        i = peak
+        left_min = x[peak]
+        while 0 <= i and x[i] <= x[peak]:
+            if x[i] < left_min:
+                left_min = x[i]
+            i -= 1
+        i = peak
+        right_min = x[peak]
+        while i < x.size and x[i] <= x[peak]:
+            if x[i] < right_min:
+                right_min = x[i]
+            i += 1
+        prom = x[peak] - max(left_min, right_min)
+        if prom > best_prom:
+            best, best_prom = peak, prom
+    return best
+
+
+@njit(nogil=True, cache=True)
+def _spindles_params(broad, rel_pow, inst_freq, inst_pow, starts, ends, distance):
+    """Per-spindle properties, as computed in :py:func:`yasa:yasa.spindles_detect`."""
+    n = starts.size
+    amp, rms, rel, absp = np.zeros(n), np.zeros(n), np.zeros(n), np.zeros(n)
+    freq, osc, sym, peak = np.zeros(n), np.zeros(n), np.zeros(n), np.zeros(n)
+    for j in range(n):
+        y = broad[starts[j] : ends[j] + 1]
+        size = y.size
+        # Linear detrending.
+        x = np.arange(size).astype(np.float64)
+        sx2, sx, sy, sxy = 0.0, 0.0, 0.0, 0.0
+        for k in range(size):
+            sx2 += x[k] ** 2
+            sx += x[k]
+            sxy += x[k] * y[k]
+            sy += y[k]
+        den = size * sx2 - sx**2
+        slope = np.nan if den == 0 else (size * sxy - sx * sy) / den
+        intercept = y.mean() - x.mean() * slope
+        det = y - (x * slope + intercept)
+
+        amp[j] = det.max() - det.min()
+        ms = 0.0
+        for k in range(size):
+            ms += det[k] ** 2
+        rms[j] = np.sqrt(ms / size)
+        rel[j] = np.median(rel_pow[starts[j] : ends[j] + 1])
+
+        sp_pow = inst_pow[starts[j] : ends[j] + 1]
+        sp_pow = sp_pow[sp_pow > 0]
+        absp[j] = np.median(np.log10(sp_pow)) if sp_pow.size else np.nan
+        sp_freq = inst_freq[starts[j] : min(ends[j] + 1, inst_freq.size)]
+        sp_freq = sp_freq[sp_freq > 0]
+        freq[j] = np.median(sp_freq) if sp_freq.size else np.nan
+
+        peaks = _local_maxima(det)
+        if peaks.size:
+            peaks = _select_by_distance(peaks, det, distance)
+            pk = _most_prominent(det, peaks)
+        else:
+            pk = 0
+        osc[j] = peaks.size
+        peak[j] = pk
+        sym[j] = pk / size
+    return amp, rms, rel, absp, freq, osc, sym, peak
+
+
+@njit(nogil=True, cache=True)
+def _sw_candidates(x, mask, amp_neg, amp_pos):
+    """Negative peaks, following positive peaks and zero-crossings,
+    as found in :py:func:`yasa:yasa.sw_detect`."""
+    empty = np.zeros(0, dtype=np.int64)
+    neg = _local_maxima(-x)
+    neg = neg[(-x[neg] >= amp_neg[0]) & (-x[neg] <= amp_neg[1]) & mask[neg]]
+    pos = _local_maxima(x)
+    pos = pos[(x[pos] >= amp_pos[0]) & (x[pos] <= amp_pos[1]) & mask[pos]]
+    if neg.size == 0 or pos.size == 0:
+        return empty, empty, empty
+    if pos[-1] < neg[-1]:
+        pos = np.append(pos, neg[-1] + 1)
+    pos = pos[np.searchsorted(pos, neg)]
+
+    is_pos = x > 0
+    zc = np.nonzero(is_pos[:-1] != is_pos[1:])[0].astype(np.int64)
+    return neg, pos, zc
+
+
+def _n_workers(n_jobs):
+    return os.cpu_count() if n_jobs is None or n_jobs < 1 else n_jobs
+
+
+def spindles_detect(
+    data,
+    sf=None,
+    ch_names=None,
+    hypno=None,
+    include=(1, 2, 3),
+    freq_sp=(12, 15),
+    freq_broad=(1, 30),
+    duration=(0.5, 2),
+    min_distance=500,
+    thresh={"corr": 0.65, "rel_pow": 0.2, "rms": 1.5},
+    multi_only=False,
+    remove_outliers=False,
+    verbose=False,
+    n_jobs=-1,
+):
+    """Spindles detection reproducing :py:func:`yasa:yasa.spindles_detect`.
+
+    Takes the same arguments and returns :py:class:`yasa:yasa.SpindlesResults`.
+
+    Args:
+        n_jobs: Number of threads processing channels in parallel.
+            If -1, all CPUs are used. Defaults to -1.
+    """
+    import pandas as pd
+    from mne.filter import filter_data
+    from scipy import signal
+    from scipy.fftpack import next_fast_len
+    from scipy.interpolate import interp1d
+    from yasa import SpindlesResults, stft_power
+    from yasa.detection import _check_data_hypno
+    from yasa.io import set_log_level
+    from yasa.others import trimbothstd
+
+    set_log_level(verbose)
+    (data, sf, ch_names, hypno, include, mask, n_chan, n_samples, bad_chan) = (
+        _check_data_hypno(data, sf, ch_names, hypno, include)
+    )
+    if sum(bad_chan) == n_chan:
+        return None
+
+    thresh = {"rel_pow": 0.20, "corr": 0.65, "rms": 1.5, **thresh}
+    do_rel_pow = thresh["rel_pow"] not in [None, "none", "None"]
+    do_corr = thresh["corr"] not in [None, "none", "None"]
+    do_rms = thresh["rms"] not in [None, "none", "None"]
+    n_thresh = sum([do_rel_pow, do_corr, do_rms])
+    if n_thresh < 1:
+        raise ValueError("At least one threshold must be defined.")
+
+    nfast = next_fast_len(n_samples)
+    data_broad = filter_data(
+        data, sf, freq_broad[0], freq_broad[1], method="fir", verbose=0
+    )
+    data_sigma = filter_data(
+        data,
+        sf,
+        freq_sp[0],
+        freq_sp[1],
+        l_trans_bandwidth=1.5,
+        h_trans_bandwidth=1.5,
+        method="fir",
+        verbose=0,
+    )
+    analytic = signal.hilbert(data_sigma, N=nfast)[:, :n_samples]
+    inst_pow = np.square(np.abs(analytic))
+    inst_freq = sf / (2 * np.pi) * np.diff(np.angle(analytic), axis=-1)
+    del analytic
+
+    # Windows of the moving transforms (0.3 s window, 0.1 s step).
+    idx = np.arange(0, n_samples / sf, 0.1)
+    beg = np.clip(((idx - 0.15) * sf).astype(int), 0, None)
+    end = np.clip(((idx + 0.15) * sf).astype(int), None, n_samples - 1)
+    t_win = np.column_stack((beg, end)).mean(1) / sf
+    times = np.arange(n_samples) / sf
+    w = int(0.1 * sf)
+    min_dist = min_distance / 1000.0 * sf if min_distance else 0
+    hypno_int = hypno if hypno is not None else np.zeros(n_samples, dtype=int)
+
+    def interp(t, values):
+        return interp1d(
+            t, values, kind="cubic", bounds_error=False, fill_value=0, assume_sorted=True
+        )(times)
+
+    def detect_channel(i):
+        if bad_chan[i]:
+            return None
+        f, t, Sxx = stft_power(
+            data_broad[i], sf, window=2, step=0.2, band=freq_broad, interp=False, norm=True
+        )
+        rel_pow = interp(t, Sxx[np.logical_and(f >= freq_sp[0], f <= freq_sp[1])].sum(0))
+
+        idx_sum = np.zeros(n_samples, dtype=np.int8)
+        if do_rel_pow:
+            idx_sum += rel_pow >= thresh["rel_pow"]
+        if do_corr:
+            mcorr = interp(t_win, _moving_corr(data_sigma[i], data_broad[i], beg, end))
+            idx_sum += mcorr >= thresh["corr"]
+        if do_rms:
+            mrms = interp(t_win, _moving_rms(data_sigma[i], beg, end))
+            masked = mrms[mask] if hypno is not None else mrms
+            thresh_rms = masked.mean() + thresh["rms"] * trimbothstd(masked, cut=0.10)
+            idx_sum += mrms >= min(thresh_rms, 10)
+        if hypno is not None:
+            idx_sum[~mask] = 0
+
+        # Soft threshold: at least n_thresh - 1 criteria met on average in ~100 ms.
+        starts, ends = _merged_runs(
+            _centered_sum(idx_sum, w) > (n_thresh - 1) * w, min_dist
+        )
+        sp_start, sp_end = starts / sf, ends / sf
+        sp_dur = sp_end - sp_start
+        good = np.logical_and(sp_dur > duration[0], sp_dur < duration[1])
+        if not good.any():
+            return None
+        starts, ends = starts[good], ends[good]
+
+        amp, rms, rel, absp, freq, osc, sym, peak = _spindles_params(
+            data_broad[i], rel_pow, inst_freq[i], inst_pow[i], starts, ends, 60 * sf / 1000
+        )
+        df_chan = pd.DataFrame(
+            {
+                "Start": sp_start[good],
+                "Peak": sp_start[good] + peak / sf,
+                "End": sp_end[good],
+                "Duration": sp_dur[good],
+                "Amplitude": amp,
+                "RMS": rms,
+                "AbsPower": absp,
+                "RelPower": rel,
+                "Frequency": freq,
+                "Oscillations": osc,
+                "Symmetry": sym,
+                "Stage": hypno_int[starts].astype(float),
+            }
+        )
+        if remove_outliers and df_chan.shape[0] >= 50:
+            df_chan = _remove_outliers(
+                df_chan,
+                [
+                    "Duration",
+                    "Amplitude",
+                    "RMS",
+                    "AbsPower",
+                    "RelPower",
+                    "Frequency",
+                    "Oscillations",
+                    "Symmetry",
+                ],
+            )
+        df_chan["Channel"] = ch_names[i]
+        df_chan["IdxChannel"] = i
+        return df_chan
+
+    with ThreadPoolExecutor(max_workers=_n_workers(n_jobs)) as executor:
+        dfs = [df for df in executor.map(detect_channel, range(n_chan)) if df is not None]
+
+    if not dfs:
+        return None
+    df = pd.concat(dfs, axis=0, ignore_index=True)
+    if hypno is None:
+        df = df.drop(columns=["Stage"])
+    else:
+        df["Stage"] = df["Stage"].astype(int)
+
+    if multi_only and df["Channel"].nunique() > 1:
+        idx_good = np.logical_or(
+            df["Start"].round(0).duplicated(keep=False),
+            df["End"].round(0).duplicated(keep=False),
+        ).to_list()
+        df = df[idx_good].reset_index(drop=True)
+
+    return SpindlesResults(
+        events=df, data=data, sf=sf, ch_names=ch_names, hypno=hypno, data_filt=data_sigma
+    )
+
+
+def sw_detect(
+    data,
+    sf=None,
+    ch_names=None,
+    hypno=None,
+    include=(2, 3),
+    freq_sw=(0.3, 1.5),
+    dur_neg=(0.3, 1.5),
+    dur_pos=(0.1, 1),
+    amp_neg=(40, 200),
+    amp_pos=(10, 150),
+    amp_ptp=(75, 350),
+    coupling=False,
+    coupling_params={"freq_sp": (12, 16), "p": 0.05, "time": 1},
+    remove_outliers=False,
+    verbose=False,
+    n_jobs=-1,
+):
+    """Slow waves detection reproducing :py:func:`yasa:yasa.sw_detect`.
+
+    Takes the same arguments and returns :py:class:`yasa:yasa.SWResults`.
+
+    Args:
+        n_jobs: Number of threads processing channels in parallel.
+            If -1, all CPUs are used. Defaults to -1.
+    """
+    import pandas as pd
+    from mne.filter import filter_data
+    from scipy import signal
+    from scipy.fftpack import next_fast_len
+    from yasa import SWResults
+    from yasa.detection import _check_data_hypno
+    from yasa.io import set_log_level
+
+    set_log_level(verbose)
+    (data, sf, ch_names, hypno, include, mask, n_chan, n_samples, bad_chan) = (
+        _check_data_hypno(data, sf, ch_names, hypno, include)
+    )
+    if sum(bad_chan) == n_chan:
+        return None
+
+    nfast = next_fast_len(n_samples)
+    data_filt = filter_data(
+        data,
+        sf,
+        freq_sw[0],
+        freq_sw[1],
+        method="fir",
+        verbose=0,
+        l_trans_bandwidth=0.2,
+        h_trans_bandwidth=0.2,
+    )
+    if coupling:
+        import tensorpac.methods as tpm
+        from yasa.others import get_centered_indices
+
+        freq_sp = coupling_params["freq_sp"]
+        data_sp = filter_data(
+            data,
+            sf,
+            freq_sp[0],
+            freq_sp[1],
+            method="fir",
+            l_trans_bandwidth=1.5,
+            h_trans_bandwidth=1.5,
+            verbose=0,
+        )
+        sw_pha = np.angle(signal.hilbert(data_filt, N=nfast)[:, :n_samples])
+        sp_amp = np.abs(signal.hilbert(data_sp, N=nfast)[:, :n_samples])
+        del data_sp
+
+    amp_neg = np.asarray(amp_neg, dtype=np.float64)
+    amp_pos = np.asarray(amp_pos, dtype=np.float64)
+    hypno_int = hypno if hypno is not None else np.zeros(n_samples, dtype=int)
+
+    def detect_channel(i):
+        if bad_chan[i]:
+            return None
+        x = data_filt[i]
+        neg, pos, zc = _sw_candidates(x, mask, amp_neg, amp_pos)
+        if not neg.size:
+            return None
+        ptp = np.abs(x[neg]) + x[pos]
+        good = np.logical_and(ptp > amp_ptp[0], ptp < amp_ptp[1])
+        if not good.any():
+            return None
+        ptp, neg, pos = ptp[good], neg[good], pos[good]
+        # Make sure that there is a zero-crossing after the last peak.
+        if not zc.size or zc[-1] < max(pos[-1], neg[-1]):
+            zc = np.append(zc, max(pos[-1], neg[-1]))
+
+        neg_sorted = np.searchsorted(zc, neg)
+        prev_neg_zc = zc[neg_sorted - 1] - neg
+        foll_neg_zc = zc[neg_sorted] - neg
+        pos_sorted = np.searchsorted(zc, pos)
+        prev_pos_zc = zc[pos_sorted - 1] - pos
+        foll_pos_zc = zc[pos_sorted] - pos
+        neg_phase_dur = (np.abs(prev_neg_zc) + foll_neg_zc) / sf
+        pos_phase_dur = (np.abs(prev_pos_zc) + foll_pos_zc) / sf
+
+        sw_start = (neg + prev_neg_zc) / sf
+        sw_end = (pos + foll_pos_zc) / sf
+        sw_dur = (sw_end - sw_start).round(4)
+        sw_midcrossing = (neg + foll_neg_zc) / sf
+        sw_slope = ptp / (sw_midcrossing - neg / sf)
+        good = np.logical_and.reduce(
+            (
+                prev_neg_zc != 0,
+                foll_neg_zc != 0,
+                prev_pos_zc != 0,
+                foll_pos_zc != 0,
+                sw_dur == (pos_phase_dur + neg_phase_dur).round(4),
+                sw_dur <= dur_neg[1] + dur_pos[1],
+                sw_dur >= dur_neg[0] + dur_pos[0],
+                neg_phase_dur > dur_neg[0],
+                neg_phase_dur < dur_neg[1],
+                pos_phase_dur > dur_pos[0],
+                pos_phase_dur < dur_pos[1],
+                sw_midcrossing > sw_start,
+                sw_midcrossing < sw_end,
+                sw_slope > 0,
+            )
+        )
+        if not good.any():
+            return None
+        neg, pos = neg[good], pos[good]
+
+        sw_params = {
+            "Start": sw_start[good],
+            "NegPeak": neg / sf,
+            "MidCrossing": sw_midcrossing[good],
+            "PosPeak": pos / sf,
+            "End": sw_end[good],
+            "Duration": sw_dur[good],
+            "ValNegPeak": x[neg],
+            "ValPosPeak": x[pos],
+            "PTP": ptp[good],
+            "Slope": sw_slope[good],
+            "Frequency": 1 / sw_dur[good],
+        }
+        if coupling:
+            bef = aft = int(sf * coupling_params["time"])
+            idx, idx_valid = get_centered_indices(data[i, :], neg, bef, aft)
+            sw_pha_ev, sp_amp_ev = sw_pha[i, idx], sp_amp[i, idx]
+            idx_max_amp = sp_amp_ev.argmax(axis=1)
+            for col in ["SigmaPeak", "PhaseAtSigmaPeak", "ndPAC"]:
+                sw_params[col] = np.full(neg.size, np.nan)
+            sw_params["SigmaPeak"][idx_valid] = (neg / sf)[idx_valid] + (
+                idx_max_amp - bef
+            ) / sf
+            sw_params["PhaseAtSigmaPeak"][idx_valid] = np.squeeze(
+                np.take_along_axis(sw_pha_ev, idx_max_amp[..., None], axis=1)
+            )
+            sw_params["ndPAC"][idx_valid] = np.squeeze(
+                tpm.norm_direct_pac(
+                    sw_pha_ev[None, ...], sp_amp_ev[None, ...], p=coupling_params["p"]
+                )
+            )
+        sw_params["Stage"] = hypno_int[neg]
+
+        df_chan = pd.DataFrame(sw_params)
+        df_chan = df_chan.drop_duplicates(subset=["Start"], keep=False)
+        df_chan = df_chan.drop_duplicates(subset=["End"], keep=False)
+        if remove_outliers and df_chan.shape[0] >= 50:
+            df_chan = _remove_outliers(
+                df_chan,
+                ["Duration", "ValNegPeak", "ValPosPeak", "PTP", "Slope", "Frequency"],
+            )
+        df_chan["Channel"] = ch_names[i]
+        df_chan["IdxChannel"] = i
+        return df_chan
+
+    with ThreadPoolExecutor(max_workers=_n_workers(n_jobs)) as executor:
+        dfs = [df for df in executor.map(detect_channel, range(n_chan)) if df is not None]
+
+    if not dfs:
+        return None
+    df = pd.concat(dfs, axis=0, ignore_index=True)
+    if hypno is None:
+        df = df.drop(columns=["Stage"])
+    else:
+        df["Stage"] = df["Stage"].astype(int)
+
+    return SWResults(
+        events=df, data=data, sf=sf, ch_names=ch_names, hypno=hypno, data_filt=data_filt
+    )
+
+
+def _remove_outliers(df_chan, columns):
+    from sklearn.ensemble import IsolationForest
+
+    ilf = IsolationForest(
+        contamination="auto", max_samples="auto", verbose=0, random_state=42
+    )
+    good = ilf.fit_predict(df_chan[columns])
+    return df_chan[good == 1]
@@ -0,0 +1,185 @@
+"""This module contains the cache of spherical-spline interpolation matrices.
+
+The interpolation matrix depends only on the sensor positions
+and on the set of bad channels, so recordings made with the same net
+share it whenever the same channels are bad.
+The matrices are keyed by a hash of the good and bad positions,
+kept in memory with LRU eviction and optionally stored on disk.
+"""
+
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from attrs import define, field
+from loguru import logger
+from mne.channels.interpolation import _make_interpolation_matrix
+
+_SWAP_LOCK = threading.RLock()
+"""Serializes the swaps of the private MNE and pyprep functions."""
+
+
+@contextmanager
+def _swapped(module, name, replacement, params):
+    """Replaces a private function of the module while the context is open,
+    restoring the function that was there before.
+
+    The hooks are written against mne~=1.6.0 and pyprep~=0.4.3. If the function
+    is missing or its parameters aren't params, the module is left unchanged.
+    """
+    with _SWAP_LOCK:
+        previous = getattr(module, name, None)
+        if previous is None or list(inspect.signature(previous).parameters) != params:
+            logger.warning(
+                f"{module.__name__}.{name} has changed, the cache isn't used"
+            )
+            yield
+            return
+        setattr(module, name, replacement)
+        try:
+            yield
+        finally:
+            setattr(module, name, previous)
+
+
+@define(kw_only=True)
+class InterpolationCache:
+    """Cache of spherical-spline interpolation matrices."""
+
+    name: str = "Interpolation"
+    """Name of the cache in the logs."""
+
+    maxsize: int = 64
+    """Number of matrices kept in memory."""
+
+    cache_dir: Path | None = field(
+        default=None, converter=lambda x: None if x is None else Path(x)
+    )
+    """Directory to store the matrices in. If None, memory only."""
+
+    hits: int = field(default=0, init=False)
+    """Number of matrices served from the cache."""
+
+    misses: int = field(default=0, init=False)
+    """Number of matrices computed."""
+
+    _entries: OrderedDict = field(factory=OrderedDict, init=False)
+
+    def __attrs_post_init__(self):
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def hit_rate(self) -> float:
+        """Percent of requests served from the cache."""
+        total = self.hits + self.misses
+        return round(100 * self.hits / total, 2) if total else 0.0
+
+    @staticmethod
+    def key(pos_from: np.ndarray, pos_to: np.ndarray, alpha: float | None) -> str:
+        """Hash of the good and bad sensor positions and the regularization."""
+        digest = hashlib.sha1()
+        for pos in (pos_from, pos_to):
+            # Rounding to a nanometer absorbs floating point noise of montages.
+            digest.update(np.round(np.asarray(pos, dtype=float), 9).tobytes())
+            digest.update(str(np.shape(pos)).encode())
+        digest.update(repr(alpha).encode())
+        return digest.hexdigest()
+
+    def get(
+        self, pos_from: np.ndarray, pos_to: np.ndarray, alpha: float | None = 1e-5
+    ) -> np.ndarray:
+        """Returns the interpolation matrix, computing it on a miss.
+
+        Args:
+            pos_from: Positions of the good sensors, shape (n_good, 3).
+            pos_to: Positions of the bad sensors, shape (n_bad, 3).
+            alpha: Regularization parameter. Defaults to 1e-5.
+
+        Returns:
+            np.ndarray: Matrix of shape (n_bad, n_good).
+        """
+        key = self.key(pos_from, pos_to, alpha)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        path = None if self.cache_dir is None else self.cache_dir / f"{key}.npy"
+        if path is not None and path.is_file():
+            matrix = np.load(path)
+            self.hits += 1
+        else:
+            matrix = _make_interpolation_matrix(pos_from, pos_to, alpha=alpha)
+            self.misses += 1
+            if path is not None:
+                np.save(path, matrix)
+
+        self._entries[key] = matrix
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return matrix
+
+    def clear(self):
+        """Drops the matrices kept in memory and resets the counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @contextmanager
+    def patch(self):
+        """Makes MNE's spherical-spline interpolation use the cache.
+
+        The swap is module-wide, so it's held by one thread at a time.
+        """
+        from mne.channels import interpolation
+
+        def cached(pos_from, pos_to, alpha=1e-5):
+            return self.get(pos_from, pos_to, alpha)
+
+        params = ["pos_from", "pos_to", "alpha"]
+        with _swapped(interpolation, "_make_interpolation_matrix", cached, params):
+            yield self
+
+    @contextmanager
+    def patch_ransac(self):
+        """Makes pyprep's RANSAC build its channel-subset predictors from the cache.
+
+        The random channel subsets are drawn from the random state of
+        :py:class:`pyprep.NoisyChannels`, so the predictors are reused
+        only across runs with the same seed and the same good channels.
+        The swap is module-wide, so it's held by one thread at a time.
+        """
+        from pyprep import ransac
+
+        def cached(random_ch_picks, chn_pos_good):
+            n_chans_good = chn_pos_good.shape[0]
+            mats = []
+            for picks in random_ch_picks:
+                mat = np.zeros((n_chans_good, n_chans_good))
+                mat[:, picks] = self.get(chn_pos_good[picks, :], chn_pos_good)
+                mats.append(mat)
+            return mats
+
+        params = ["random_ch_picks", "chn_pos_good"]
+        with _swapped(ransac, "_make_interpolation_matrices", cached, params):
+            yield self
+
+    def log_stats(self):
+        """Logs the hit rate of the cache."""
+        logger.info(
+            f"{self.name} cache: {self.hits} hits, {self.misses} misses "
+            f"({self.hit_rate}% hit rate)"
+        )
+
+
+INTERPOLATION_CACHE = InterpolationCache()
+"""Cache shared by the pipes of the session."""
+
+RANSAC_CACHE = InterpolationCache(name="RANSAC", maxsize=1024)
+"""Cache of the RANSAC predictors shared by the pipes of the session,
+large enough to hold several sets of random channel subsets."""
@@ -0,0 +1,211 @@
+"""This module contains the interval index of BAD annotated spans.
+
+Spans are kept as sorted, merged, half-open intervals of samples,
+so that the bad portion of any range of samples is found by binary search
+and combined with hypnogram stage runs without building masks.
+The index of a recording is built once per version of its annotations
+and shared by all pipes holding the recording.
+"""
+
+import weakref
+
+import mne
+import numpy as np
+from attrs import define, field
+
+
+def _as_index_array(values):
+    return np.asarray(values, dtype=np.int64).reshape(-1)
+
+
+@define(kw_only=True, frozen=True)
+class Intervals:
+    """Sorted and merged half-open intervals [start, stop) of samples."""
+
+    starts: np.ndarray = field(converter=_as_index_array)
+    """Interval starts."""
+
+    stops: np.ndarray = field(converter=_as_index_array)
+    """Interval stops, exclusive."""
+
+    n_times: int
+    """Number of samples in the recording."""
+
+    _cum_lengths: np.ndarray = field(init=False, repr=False)
+
+    @_cum_lengths.default
+    def _set_cum_lengths(self):
+        return np.concatenate([[0], np.cumsum(self.stops - self.starts)])
+
+    @classmethod
+    def from_spans(cls, starts, stops, n_times: int) -> "Intervals":
+        """Builds the index from any, possibly overlapping and unsorted, spans.
+        Spans are clipped to the recording and empty ones are dropped."""
+        starts = np.clip(_as_index_array(starts), 0, n_times)
+        stops = np.clip(_as_index_array(stops), 0, n_times)
+        keep = starts < stops
+        starts, stops = starts[keep], stops[keep]
+        order = np.argsort(starts, kind="stable")
+        starts, stops = starts[order], np.maximum.accumulate(stops[order])
+        # Overlapping or touching spans are merged.
+        first = np.ones(len(starts), dtype=bool)
+        first[1:] = starts[1:] > stops[:-1]
+        first = np.flatnonzero(first)
+        last = np.append(first[1:], len(starts))[: len(first)] - 1
+        return cls(starts=starts[first], stops=stops[last], n_times=n_times)
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray) -> "Intervals":
+        """Builds the index from the runs of True of a boolean mask."""
+        edges = np.diff(np.concatenate([[0], np.asarray(mask, dtype=np.int8), [0]]))
+        return cls(
+            starts=np.flatnonzero(edges == 1),
+            stops=np.flatnonzero(edges == -1),
+            n_times=len(mask),
+        )
+
+    @classmethod
+    def from_annotations(
+        cls,
+        raw: mne.io.BaseRaw,
+        kinds: tuple = ("BAD",),
+        annotations: mne.Annotations | None = None,
+    ) -> "Intervals":
+        """Builds the index of the annotations whose description
+        starts with any of kinds, as :py:meth:`mne:mne.io.Raw.get_data`
+        with reject_by_annotation rejects them.
+
+        Args:
+            raw: Recording the samples are indexed in.
+            kinds: Description prefixes, case insensitive. Defaults to ("BAD",).
+            annotations: Annotations to index instead of the recording's own,
+                as if set by :py:meth:`mne:mne.io.Raw.set_annotations`.
+                Defaults to None.
+        """
+        from copy import copy
+
+        from mne.annotations import _annotations_starts_stops
+
+        if annotations is not None:
+            # Set on a shallow copy, the annotations are aligned to the recording
+            # as by set_annotations, without copying the data or changing raw.
+            raw = copy(raw)
+            raw.set_annotations(annotations, emit_warning=False)
+        onsets, ends = _annotations_starts_stops(raw, list(kinds))
+        return cls.from_spans(onsets, ends, raw.n_times)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts.tolist(), self.stops.tolist())
+
+    @property
+    def n_samples(self) -> int:
+        """Number of samples covered by the intervals."""
+        return int(self._cum_lengths[-1])
+
+    @property
+    def percent(self) -> float:
+        """Percent of the recording covered by the intervals."""
+        return 100 * self.n_samples / self.n_times if self.n_times else 0.0
+
+    def _check_compatible(self, other):
+        if self.n_times != other.n_times:
+            raise ValueError(
+                f"Intervals of {self.n_times} and {other.n_times} samples "
+                "can't be combined."
+            )
+
+    def __or__(self, other: "Intervals") -> "Intervals":
+        self._check_compatible(other)
+        return Intervals.from_spans(
+            np.concatenate([self.starts, other.starts]),
+            np.concatenate([self.stops, other.stops]),
+            self.n_times,
+        )
+
+    def __invert__(self) -> "Intervals":
+        bounds = np.concatenate(
+            [[0], np.column_stack([self.starts, self.stops]).ravel(), [self.n_times]]
+        )
+        starts, stops = bounds[::2], bounds[1::2]
+        keep = starts < stops
+        return Intervals(starts=starts[keep], stops=stops[keep], n_times=self.n_times)
+
+    def __and__(self, other: "Intervals") -> "Intervals":
+        self._check_compatible(other)
+        return ~(~self | ~other)
+
+    def __sub__(self, other: "Intervals") -> "Intervals":
+        return self & ~other
+
+    def overlaps(self, start: int, stop: int) -> bool:
+        """Whether any interval overlaps [start, stop), in O(log n)."""
+        i = np.searchsorted(self.stops, start, side="right")
+        return bool(i < len(self.starts) and self.starts[i] < stop)
+
+    def count(self, start: int = 0, stop: int | None = None) -> int:
+        """Number of samples of [start, stop) covered by the intervals,
+        in O(log n)."""
+        stop = self.n_times if stop is None else stop
+        first = np.searchsorted(self.stops, start, side="right")
+        last = np.searchsorted(self.starts, stop, side="left")
+        if first >= last:
+            return 0
+        covered = self._cum_lengths[last] - self._cum_lengths[first]
+        # Intervals at the edges are only partially within the range.
+        covered -= max(start - self.starts[first], 0)
+        covered -= max(self.stops[last - 1] - stop, 0)
+        return int(covered)
+
+    def mask(self, start: int = 0, stop: int | None = None) -> np.ndarray:
+        """Boolean mask of the samples of [start, stop) covered by the intervals."""
+        stop = self.n_times if stop is None else stop
+        first = np.searchsorted(self.stops, start, side="right")
+        last = np.searchsorted(self.starts, stop, side="left")
+        edges = np.zeros(stop - start + 1, dtype=np.int8)
+        np.add.at(edges, np.clip(self.starts[first:last] - start, 0, None), 1)
+        np.add.at(
+            edges, np.clip(self.stops[first:last] - start, None, stop - start), -1
+        )
+        return np.cumsum(edges[:-1]) > 0
+
+
+# Keyed by id, as hashing a recording hashes its data.
+_BAD_INTERVALS = {}
+
+
+def _annotations_key(raw):
+    annot = raw.annotations
+    return (
+        raw.n_times,
+        raw.first_samp,
+        raw.info["sfreq"],
+        annot.orig_time,
+        annot.onset.tobytes(),
+        annot.duration.tobytes(),
+        tuple(annot.description),
+    )
+
+
+def bad_intervals(raw: mne.io.BaseRaw) -> Intervals:
+    """Interval index of the BAD annotated spans of the recording.
+
+    The index is cached for the recording and rebuilt only
+    when its annotations change.
+
+    Args:
+        raw: An instance of :py:class:`mne:mne.io.Raw`.
+
+    Returns:
+        Intervals: Sorted, merged intervals of BAD samples.
+    """
+    key = _annotations_key(raw)
+    cached = _BAD_INTERVALS.get(id(raw))
+    if cached is None or cached[0]() is not raw or cached[1] != key:
+        cached = (weakref.ref(raw), key, Intervals.from_annotations(raw))
+        if id(raw) not in _BAD_INTERVALS:
+            weakref.finalize(raw, _BAD_INTERVALS.pop, id(raw), None)
+        _BAD_INTERVALS[id(raw)] = cached
+    return cached[2]
@@ -0,0 +1,337 @@
+"""This module contains the vectorized spectral parametrization.
+
+It fits the model of :std:doc:`fooof:index` to all spectra at once.
+The aperiodic component is fitted by least squares in log-log space,
+robustly refitted to the points below the initial fit, and peaks are guessed
+as FOOOF guesses them, iterating over peaks instead of spectra.
+The nonlinear fits, of the peaks and of the aperiodic component with a knee,
+are a fixed number of Levenberg-Marquardt iterations run for all spectra at once,
+and the spectra fitted worse than a threshold can be refitted by FOOOF.
+Results are stored in FOOOF objects, so that they are reported
+and plotted as FOOOF fits.
+"""
+
+import numpy as np
+
+_ITERATIONS = 50
+"""Number of Levenberg-Marquardt iterations of the nonlinear fits."""
+
+
+def fit_fast(
+    model,
+    freqs: np.ndarray,
+    power_spectra: np.ndarray,
+    freq_range: tuple | None = None,
+    refine_r2: float | None = None,
+    n_jobs: int = 1,
+):
+    """Fits the model to the spectra at once, as the model's fit would.
+
+    Args:
+        model: An instance of :py:class:`fooof:fooof.FOOOF` for a single spectrum
+            or of :py:class:`fooof:fooof.FOOOFGroup`, whose settings are used.
+        freqs: Frequencies of the spectra.
+        power_spectra: Spectra of shape (n_freqs,) or (n_spectra, n_freqs),
+            in linear space.
+        freq_range: Range of frequencies to fit. If None, all frequencies.
+            Defaults to None.
+        refine_r2: Spectra fitted with R^2 below it are refitted by the model's
+            fit. If None, none are refitted. Defaults to None.
+        n_jobs: Number of processes refitting the spectra. Defaults to 1.
+    """
+    from fooof import FOOOFGroup
+    from fooof.data import FOOOFResults
+
+    is_group = isinstance(model, FOOOFGroup)
+    model.add_data(freqs, power_spectra, freq_range)
+    freqs = model.freqs
+    spectra = model.power_spectra if is_group else model.power_spectrum[None]
+
+    ap_params = _robust_aperiodic_fit(freqs, spectra, model.aperiodic_mode)
+    flat = spectra - _aperiodic(freqs, ap_params)
+    gaussians = _refine_peaks(freqs, flat, _fit_peaks(freqs, flat, model), model)
+    peak_fit = _gaussians(freqs, gaussians)
+    ap_params = _aperiodic_fit(
+        freqs, spectra - peak_fit, model.aperiodic_mode, init=ap_params
+    )
+    ap_fit = _aperiodic(freqs, ap_params)
+    fitted = ap_fit + peak_fit
+
+    centered = spectra - spectra.mean(-1, keepdims=True)
+    fitted_centered = fitted - fitted.mean(-1, keepdims=True)
+    r_squared = (centered * fitted_centered).sum(-1) ** 2 / (
+        (centered**2).sum(-1) * (fitted_centered**2).sum(-1)
+    )
+    residuals = np.abs(spectra - fitted)
+    error = {
+        "MAE": residuals.mean(-1),
+        "MSE": (residuals**2).mean(-1),
+        "RMSE": np.sqrt((residuals**2).mean(-1)),
+    }[model._error_metric]
+
+    results = []
+    for i in range(len(spectra)):
+        gaussian_params = gaussians[i][~np.isnan(gaussians[i, :, 0])]
+        gaussian_params = gaussian_params[np.argsort(gaussian_params[:, 0])]
+        # As FOOOF, peak heights are above the aperiodic fit at the closest bin.
+        inds = np.abs(freqs - gaussian_params[:, :1]).argmin(-1)
+        peak_params = np.column_stack(
+            [gaussian_params[:, 0], peak_fit[i, inds], 2 * gaussian_params[:, 2]]
+        )
+        results.append(
+            FOOOFResults(
+                ap_params[i], peak_params, r_squared[i], error[i], gaussian_params
+            )
+        )
+
+    refine = (
+        np.flatnonzero(r_squared < refine_r2)
+        if refine_r2 is not None
+        else np.array([], dtype=int)
+    )
+    if len(refine):
+        exact = FOOOFGroup(**model.get_settings()._asdict(), verbose=False)
+        exact.fit(freqs, 10 ** spectra[refine], n_jobs=n_jobs)
+        for i, result in zip(refine, exact.group_results):
+            results[i] = result
+
+    if is_group:
+        model.group_results = results
+    else:
+        model.add_results(results[0])
+        model._regenerate_model()
+
+
+def _aperiodic(freqs, params):
+    """Aperiodic components in log10 power of shape (n_spectra, n_freqs)."""
+    if params.shape[1] == 2:
+        return params[:, :1] - params[:, 1:] * np.log10(freqs)
+    return params[:, :1] - np.log10(params[:, 1:2] + freqs ** params[:, 2:])
+
+
+def _aperiodic_fit(freqs, spectra, mode, weights=None, init=None):
+    """Least squares aperiodic parameters of spectra of shape (n_spectra, n_freqs),
+    fitted to the points of nonzero weights."""
+    weights = np.ones_like(spectra) if weights is None else weights
+    log_freqs = np.log10(freqs)
+    sw = weights.sum(-1)
+    sx = weights @ log_freqs
+    sxx = weights @ log_freqs**2
+    sy = (weights * spectra).sum(-1)
+    sxy = (weights * spectra) @ log_freqs
+    slope = (sw * sxy - sx * sy) / (sw * sxx - sx**2)
+    params = np.column_stack([(sy - slope * sx) / sw, -slope])
+    if mode == "knee":
+        if init is None:
+            init = np.column_stack([params[:, 0], np.zeros(len(params)), params[:, 1]])
+        params = _knee_fit(freqs, spectra, weights, init)
+    return params
+
+
+def _knee_fit(freqs, spectra, weights, init):
+    """Aperiodic parameters with a knee by Levenberg-Marquardt iterations
+    run for all spectra at once."""
+    params = init.copy()
+    damping = np.full(len(params), 1e-3)
+
+    def cost(params):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            residuals = spectra - _aperiodic(freqs, params)
+        return np.where(
+            np.isnan(residuals).any(-1), np.inf, (weights * residuals**2).sum(-1)
+        )
+
+    current = cost(params)
+    for _ in range(_ITERATIONS):
+        powered = freqs ** params[:, 2:]
+        denominator = np.log(10) * (params[:, 1:2] + powered)
+        jacobian = np.stack(
+            [
+                np.ones_like(spectra),
+                -1 / denominator,
+                -powered * np.log(freqs) / denominator,
+            ],
+            axis=-1,
+        )
+        residuals = spectra - _aperiodic(freqs, params)
+        jtj = np.einsum("sfi,sf,sfj->sij", jacobian, weights, jacobian)
+        jtr = np.einsum("sfi,sf,sf->si", jacobian, weights, residuals)
+        diagonal = np.einsum("sii->si", jtj)
+        lhs = jtj + (damping[:, None] * diagonal)[..., None] * np.eye(3)
+        step = np.linalg.solve(lhs + 1e-12 * np.eye(3), jtr[..., None])[..., 0]
+        candidate = params + step
+        new = cost(candidate)
+        accept = new < current
+        params[accept] = candidate[accept]
+        current[accept] = new[accept]
+        damping = np.where(accept, damping / 10, damping * 10)
+    return params
+
+
+def _robust_aperiodic_fit(freqs, spectra, mode):
+    """Aperiodic parameters refitted to the points of each spectrum
+    not above its initial fit, as FOOOF's robust fit."""
+    params = _aperiodic_fit(freqs, spectra, mode)
+    flat = np.clip(spectra - _aperiodic(freqs, params), 0, None)
+    # FOOOF thresholds at the 0.025th percentile of the flattened spectrum.
+    threshold = np.percentile(flat, 0.025, axis=-1, keepdims=True)
+    weights = (flat <= threshold).astype(float)
+    return _aperiodic_fit(freqs, spectra, mode, weights=weights, init=params)
+
+
+def _gaussians(freqs, params):
+    """Sums of the gaussians of params of shape (n_spectra, n_peaks, 3),
+    with NaN rows for no peak."""
+    center, height, std = np.nan_to_num(params).transpose(2, 0, 1)
+    std = np.where(std > 0, std, 1)
+    return (
+        height[..., None]
+        * np.exp(-((freqs - center[..., None]) ** 2) / (2 * std[..., None] ** 2))
+    ).sum(1)
+
+
+def _fit_peaks(freqs, flat, model):
+    """Gaussian parameters of shape (n_spectra, n_peaks, 3) of the peaks
+    guessed as by FOOOF, with NaN rows for no peak."""
+    n_spectra, n_freqs = flat.shape
+    rows = np.arange(n_spectra)
+    bins = np.arange(n_freqs)
+    std_limits = np.array(model.peak_width_limits) / 2
+    max_n_peaks = int(min(model.max_n_peaks, n_freqs))
+    guess = np.full((n_spectra, max_n_peaks, 3), np.nan)
+    flat = flat.copy()
+    active = np.ones(n_spectra, dtype=bool)
+    for peak in range(max_n_peaks):
+        max_ind = flat.argmax(-1)
+        max_height = flat[rows, max_ind]
+        active &= (max_height > model.peak_threshold * flat.std(-1)) & (
+            max_height > model.min_peak_height
+        )
+        if not active.any():
+            break
+
+        # Distance to the closest bin at half the height, on either side.
+        below = flat <= 0.5 * max_height[:, None]
+        left = below & (bins > 0) & (bins < max_ind[:, None])
+        right = below & (bins > max_ind[:, None])
+        left_distance = np.where(
+            left.any(-1), max_ind - np.where(left, bins, -1).max(-1), np.inf
+        )
+        right_distance = np.where(
+            right.any(-1), np.where(right, bins, n_freqs).min(-1) - max_ind, np.inf
+        )
+        short_side = np.minimum(left_distance, right_distance)
+        fwhm = short_side * 2 * model.freq_res
+        guess_std = np.where(
+            np.isinf(short_side),
+            np.mean(model.peak_width_limits),
+            fwhm / (2 * np.sqrt(2 * np.log(2))),
+        )
+        guess_std = np.clip(guess_std, *std_limits)
+
+        params = np.column_stack([freqs[max_ind], max_height, guess_std])
+        params[~active] = np.nan
+        guess[:, peak] = params
+        flat -= _gaussians(freqs, params[:, None])
+
+    # Peaks too close to the edges of the range are dropped.
+    center, height, std = guess.transpose(2, 0, 1)
+    edge = std * model._bw_std_edge
+    keep = (np.abs(center - model.freq_range[0]) > edge) & (
+        np.abs(center - model.freq_range[1]) > edge
+    )
+    guess[~keep] = np.nan
+
+    # Of overlapping neighbouring peaks, the lower one is dropped.
+    order = np.argsort(np.where(np.isnan(guess[..., 0]), np.inf, guess[..., 0]), -1)
+    guess = np.take_along_axis(guess, order[..., None], axis=1)
+    center, height, std = guess.transpose(2, 0, 1)
+    lower = center - std * model._gauss_overlap_thresh
+    upper = center + std * model._gauss_overlap_thresh
+    overlap = upper[:, :-1] > lower[:, 1:]
+    drop = np.zeros(guess.shape[:2], dtype=bool)
+    first_lower = height[:, :-1] <= height[:, 1:]
+    drop[:, :-1] |= overlap & first_lower
+    drop[:, 1:] |= overlap & ~first_lower
+    guess[drop] = np.nan
+    return guess
+
+
+def _refine_peaks(freqs, flat, guess, model):
+    """Gaussian parameters jointly fitted to the flattened spectra from the guesses,
+    within the bounds of FOOOF."""
+    valid = ~np.isnan(guess[..., 0])
+    # Guesses are sorted with no peak last.
+    n_peaks = valid.sum(-1).max(initial=0)
+    if not n_peaks:
+        return guess
+    guess, valid = guess[:, :n_peaks], valid[:, :n_peaks]
+    std_limits = np.array(model.peak_width_limits) / 2
+    center = np.nan_to_num(guess[..., 0])
+    std = np.where(valid, guess[..., 2], 1)
+    bound = 2 * model._cf_bound * std
+    lower = np.stack(
+        [
+            np.maximum(center - bound, model.freq_range[0]),
+            np.zeros_like(center),
+            np.full_like(center, std_limits[0]),
+        ],
+        axis=-1,
+    )
+    upper = np.stack(
+        [
+            np.minimum(center + bound, model.freq_range[1]),
+            np.full_like(center, np.inf),
+            np.full_like(center, std_limits[1]),
+        ],
+        axis=-1,
+    )
+    params = np.where(valid[..., None], guess, 0)
+    # Parameters of no peak are kept at zero height.
+    mask = np.repeat(valid, 3, axis=-1).astype(float)
+    n_params = 3 * n_peaks
+    damping = np.full(len(params), 1e-3)
+
+    def components(params):
+        center, height, std = params.transpose(2, 0, 1)
+        std = np.where(std > 0, std, 1)
+        offset = freqs - center[..., None]
+        gauss = np.exp(-(offset**2) / (2 * std[..., None] ** 2))
+        return center, height, std, offset, gauss
+
+    def cost(params):
+        _, height, _, _, gauss = components(params)
+        return ((flat - (height[..., None] * gauss).sum(1)) ** 2).sum(-1)
+
+    current = cost(params)
+    for _ in range(_ITERATIONS):
+        _, height, std, offset, gauss = components(params)
+        residuals = flat - (height[..., None] * gauss).sum(1)
+        jacobian = np.stack(
+            [
+                height[..., None] * gauss * offset / std[..., None] ** 2,
+                gauss,
+                height[..., None] * gauss * offset**2 / std[..., None] ** 3,
+            ],
+            axis=2,
+        ).reshape(len(params), n_params, -1) * mask[..., None]
+        jtj = np.einsum("spf,sqf->spq", jacobian, jacobian)
+        jtr = np.einsum("spf,sf->sp", jacobian, residuals)
+        diagonal = np.einsum("spp->sp", jtj)
+        lhs = jtj + (damping[:, None] * diagonal)[..., None] * np.eye(n_params)
+        # Parameters of no peak have zero rows, solved as zero steps.
+        lhs += (1 - mask)[..., None] * np.eye(n_params)
+        step = np.linalg.solve(lhs + 1e-12 * np.eye(n_params), jtr[..., None])[..., 0]
+        candidate = np.where(
+            valid[..., None],
+            np.clip(params + step.reshape(params.shape), lower, upper),
+            0,
+        )
+        new = cost(candidate)
+        accept = new < current
+        params[accept] = candidate[accept]
+        current[accept] = new[accept]
+        damping = np.where(accept, damping / 10, damping * 10)
+
+    params[~valid] = np.nan
+    return params
@@ -4,7 +4,7 @@
 import os
 from collections.abc import Iterable
 from pathlib import Path
-from typing import TypeVar
+from typing import TYPE_CHECKING, TypeVar
 import sys
 import matplotlib.pyplot as plt
 import mne
@@ -14,9 +14,22 @@ import pyprep
 from attrs import define, field
 from loguru import logger
 
-from .base import BaseEventPipe, BaseHypnoPipe, BasePipe, SpectrumPlots
+from .base import (
+    DEFAULT_BANDS,
+    BaseEventPipe,
+    BaseHypnoPipe,
+    BasePipe,
+    SpectrumPlots,
+    _band_sums,
+)
+from .interpolation import RANSAC_CACHE, InterpolationCache
+from .intervals import _annotations_key
+from .spectra_cache import SpectraCache, data_version
 from .utils import logger_wraps
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 CHANNELS_DETECTION_METHODS = {
     "ransac": "bad_by_ransac",
     "SNR": "bad_by_SNR",
@@ -42,6 +55,16 @@ class CleaningPipe(BasePipe):
     and bad data spans.
     """
 
+    proxy: dict = field(init=False, factory=dict)
+    """Low-passed, decimated proxy of the recording with its high-frequency power
+    and amplitude jumps envelopes as built by :py:meth:`build_proxy`.
+    """
+
+    proxy_report: dict = field(init=False, factory=dict)
+    """Agreement of proxy-mode and full-rate detections and their timings
+    as computed by :py:meth:`validate_proxy`.
+    """
+
     @logger_wraps()
     def resample(self, sfreq: float = 250, **resample_kwargs):
         """A wrapper for :py:meth:`mne:mne.io.Raw.resample`
@@ -86,10 +109,11 @@ class CleaningPipe(BasePipe):
                 raise ValueError(f"Unsupported frequency: {freqs}")
         self.mne_raw.load_data().notch_filter(freqs=freqs, **notch_kwargs)
 
-    def _get_segments_number(self):
-        duration = self.mne_raw.times[-1]
-        sfreq = self.mne_raw.info["sfreq"]
-        ch_number = len(self.mne_raw.info["ch_names"])
+    def _get_segments_number(self, raw=None):
+        raw = self.mne_raw if raw is None else raw
+        duration = raw.times[-1]
+        sfreq = raw.info["sfreq"]
+        ch_number = len(raw.info["ch_names"])
         total_samples = sfreq * duration * ch_number
 
         segment_duration = duration
@@ -100,11 +124,27 @@ class CleaningPipe(BasePipe):
         return chunk_numbers, segment_duration
 
     def _add_bad_channels(
-        self, bad_channels_set, eeg_segment, methods=CHANNELS_DETECTION_METHODS.keys()
+        self,
+        bad_channels_set,
+        eeg_segment,
+        methods=CHANNELS_DETECTION_METHODS.keys(),
+        random_state=None,
+        hf_power=None,
     ):
         if len(eeg_segment.times) >= 2:
-            noisy_channels = pyprep.NoisyChannels(eeg_segment)
-            noisy_channels.find_all_bads()
+            noisy_channels = pyprep.NoisyChannels(
+                eeg_segment, random_state=random_state
+            )
+            if hf_power is None:
+                noisy_channels.find_all_bads()
+            else:
+                # Same steps as find_all_bads, but the high-frequency noise
+                # is evaluated on the full-rate power kept by the proxy.
+                noisy_channels.find_bad_by_deviation()
+                _proxy_hf_noise(noisy_channels, hf_power)
+                noisy_channels.find_bad_by_correlation()
+                noisy_channels.find_bad_by_SNR()
+                noisy_channels.find_bad_by_ransac()
 
             for key, attr in CHANNELS_DETECTION_METHODS.items():
                 if key in methods:
@@ -117,60 +157,451 @@ class CleaningPipe(BasePipe):
             for item in array:
                 file.write(item + "\n")
 
-    def auto_set_annotations(self, amplitude_peak=100e-6, amplitude_min_duration=0.005):
+    @logger_wraps()
+    def build_proxy(
+        self,
+        sfreq: float = 125,
+        hf_cutoff: float = 50,
+        min_duration: float = 0.005,
+        block_sec: float = 300,
+    ) -> dict:
+        """Derives the compact representation the proxy-mode detectors run on.
+
+        The recording is low-passed below ``hf_cutoff`` and decimated by an integer
+        factor. For every proxy sample the mean power above ``hf_cutoff``
+        and the largest sample-to-sample jump sustained for ``min_duration``
+        are kept from the full-rate data, so that the high-frequency noise
+        and amplitude criteria are still evaluated at the full rate.
+
+        Args:
+            sfreq: Approximate sampling frequency of the proxy in Hz.
+                Defaults to 125.
+            hf_cutoff: Frequency in Hz splitting the proxy
+                from the high-frequency power. Defaults to 50.
+            min_duration: Minimum duration in seconds of the amplitude jumps
+                as in :py:meth:`auto_set_annotations`. Defaults to 0.005.
+            block_sec: Length in seconds of the blocks the recording
+                is processed in. Defaults to 300.
+
+        Returns:
+            dict: "raw" proxy :py:class:`mne:mne.io.RawArray`,
+            "hf_power" and "jump" envelopes and "nan" mask
+            of shape (n_channels, n_proxy_times), decimation "factor"
+            and the parameters.
+        """
+        from numpy.lib.stride_tricks import sliding_window_view
+
+        raw = self.mne_raw
+        n_times = raw.n_times
+        factor = max(int(self.sf // sfreq), 1)
+        h_freq = min(hf_cutoff, 0.4 * self.sf / factor)
+        n_bins = -(-n_times // factor)
+        min_samples = max(int(np.round(min_duration * self.sf)), 1)
+        pad = max(
+            len(mne.filter.create_filter(None, self.sf, None, h_freq, verbose=False)),
+            min_samples,
+        )
+        # Blocks span whole bins.
+        block = max(int(block_sec * self.sf) // factor, 1) * factor
+
+        shape = (len(raw.ch_names), n_bins)
+        proxy_data = np.empty(shape)
+        hf_power = np.empty(shape, dtype=np.float32)
+        jump = np.empty(shape, dtype=np.float32)
+        nan = np.zeros(shape, dtype=bool)
+        for start in range(0, n_times, block):
+            stop = min(start + block, n_times)
+            # Padded blocks are filtered to avoid edge effects.
+            pad_start = max(start - pad, 0)
+            pad_stop = min(stop + pad, n_times)
+            x = raw.get_data(start=pad_start, stop=pad_stop)
+            is_nan = np.isnan(x)
+            x_filled = np.where(is_nan, 0, x)
+            low = mne.filter.filter_data(
+                x_filled, self.sf, None, h_freq, verbose=False
+            )
+            inner = slice(start - pad_start, stop - pad_start)
+            bins = slice(start // factor, -(-stop // factor))
+            edges = np.arange(0, stop - start, factor)
+
+            proxy_data[:, bins] = low[:, inner][:, ::factor]
+            hf = np.square((x_filled - low)[:, inner])
+            hf_power[:, bins] = np.add.reduceat(hf, edges, axis=1) / np.diff(
+                np.append(edges, stop - start)
+            )
+            nan[:, bins] = np.logical_or.reduceat(is_nan[:, inner], edges, axis=1)
+
+            # A jump at sample k is flagged if it belongs to a run of min_samples
+            # differences, which is the largest of the runs' minima around it.
+            diff = np.abs(np.diff(x, axis=1))
+            diff[np.isnan(diff)] = -np.inf
+            run_min = np.full_like(diff, -np.inf)
+            if diff.shape[1] >= min_samples:
+                run_min[:, : diff.shape[1] - min_samples + 1] = sliding_window_view(
+                    diff, min_samples, axis=1
+                ).min(axis=-1)
+            flag = sliding_window_view(
+                np.pad(
+                    run_min,
+                    ((0, 0), (min_samples - 1, 1)),
+                    constant_values=-np.inf,
+                ),
+                min_samples,
+                axis=1,
+            ).max(axis=-1)[:, inner]
+            jump[:, bins] = np.maximum.reduceat(flag, edges, axis=1)
+
+        info = raw.info.copy()
+        with info._unlock():
+            info["sfreq"] = self.sf / factor
+            info["lowpass"] = h_freq
+        proxy_raw = mne.io.RawArray(
+            proxy_data, info, first_samp=raw.first_samp // factor, verbose=False
+        )
+        proxy_raw.set_annotations(raw.annotations)
+        self.proxy = {
+            "raw": proxy_raw,
+            "hf_power": hf_power,
+            "jump": jump,
+            "nan": nan,
+            "factor": factor,
+            "hf_cutoff": h_freq,
+            "min_duration": min_duration,
+        }
+        logger.info(
+            f"Built {proxy_raw.info['sfreq']:.1f} Hz proxy "
+            f"of {self.sf:.1f} Hz recording"
+        )
+        return self.proxy
+
+    def _proxy_amplitude_annotations(self, peak, min_duration, bad_percent):
+        """Equivalent of :py:func:`mne:mne.preprocessing.annotate_amplitude`
+        and :py:func:`mne:mne.preprocessing.annotate_nan` on the proxy envelopes,
+        with a resolution of one proxy sample."""
+        from mne.io.pick import _picks_to_idx
+
+        if not self.proxy or self.proxy["min_duration"] != min_duration:
+            self.build_proxy(min_duration=min_duration)
+        raw, factor = self.mne_raw, self.proxy["factor"]
+        picks = _picks_to_idx(raw.info, None, "data_or_ica", exclude="bads")
+        flags = self.proxy["jump"][picks] >= peak
+        flagged_percent = 100 * flags.sum(axis=1) * factor / raw.n_times
+        # Channels flagged for too long are bad channels rather than annotated.
+        to_annotate = (flagged_percent > 0) & (flagged_percent < bad_percent)
+        annotations = _mask_to_annotations(
+            flags[to_annotate].any(axis=0), "BAD_peak", raw, factor
+        )
+        for ch_name, ch_nan in zip(raw.ch_names, self.proxy["nan"]):
+            annotations += _mask_to_annotations(
+                ch_nan, "BAD_NAN", raw, factor, ch_names=[ch_name]
+            )
+        return annotations
+
+    def auto_set_annotations(
+        self,
+        amplitude_peak=100e-6,
+        amplitude_min_duration=0.005,
+        proxy=False,
+        amplitude_flat=None,
+        chunk_sec=300,
+        n_jobs=-1,
+    ):
         """Sets annotations automatically based on MNE preprocessing library.
 
         Args:
             amplitude_peak (float): Maximum accepted peak-to-peak (PTP) amplitude.
             amplitude_min_duration (float): Minimum required duration for the annotation.c
+            proxy (bool): Whether to detect on the envelopes of :py:meth:`build_proxy`
+                instead of the full-rate data. Annotations then have the resolution
+                of a proxy sample. Defaults to False.
+            amplitude_flat (float): Minimum accepted peak-to-peak (PTP) amplitude.
+                If None, flat segments are not annotated. Defaults to None.
+            chunk_sec (float): Length in seconds of the chunks processed
+                in parallel, so that the data needn't be loaded. The annotations
+                are identical to the single pass over the whole recording,
+                which is used if None. Defaults to 300.
+            n_jobs (int): Number of parallel workers. Defaults to -1.
 
         For more information about these parameters, check:
         https://mne.tools/dev/generated/mne.preprocessing.annotate_amplitude.html
         """
+        self.mne_raw.set_annotations(
+            self._detect_annotations(
+                amplitude_peak,
+                amplitude_min_duration,
+                proxy,
+                amplitude_flat,
+                chunk_sec,
+                n_jobs,
+            )
+        )
+
+    def _detect_annotations(
+        self,
+        amplitude_peak,
+        amplitude_min_duration,
+        proxy,
+        amplitude_flat=None,
+        chunk_sec=300,
+        n_jobs=-1,
+    ):
+        if proxy:
+            if amplitude_flat is not None:
+                raise ValueError("Flat segments can't be detected on the proxy.")
+            return self._proxy_amplitude_annotations(
+                amplitude_peak, amplitude_min_duration, bad_percent=10
+            )
+        acq_skips = any(
+            d.lower().startswith("bad_acq_skip")
+            for d in self.mne_raw.annotations.description
+        )
+        # MNE concatenates the data around acquisition skips before the diffs.
+        if chunk_sec is not None and not acq_skips:
+            return self._chunked_annotations(
+                amplitude_peak,
+                amplitude_flat,
+                amplitude_min_duration,
+                bad_percent=10,
+                chunk_sec=chunk_sec,
+                n_jobs=n_jobs,
+            )
         amplitude_annotations = mne.preprocessing.annotate_amplitude(
             self.mne_raw,
             peak=amplitude_peak,
+            flat=amplitude_flat,
             bad_percent=10,
             min_duration=amplitude_min_duration,
             picks=None,
             verbose=None,
         )[0]
         nan_annotations = mne.preprocessing.annotate_nan(self.mne_raw)
-        self.mne_raw.set_annotations(amplitude_annotations + nan_annotations)
+        return amplitude_annotations + nan_annotations
+
+    def _chunked_annotations(
+        self, peak, flat, min_duration, bad_percent, chunk_sec, n_jobs
+    ):
+        """Equivalent of :py:func:`mne:mne.preprocessing.annotate_amplitude`
+        followed by :py:func:`mne:mne.preprocessing.annotate_nan`, computed
+        on chunks of the recording in parallel.
+
+        Each chunk overlaps the next one by a sample, so that the diffs
+        at its end are complete. Runs of flagged diffs are merged
+        across chunk boundaries before the short runs are rejected.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from mne.io.pick import _picks_to_idx
+
+        raw = self.mne_raw
+        n_times = raw.n_times
+        picks = _picks_to_idx(raw.info, None, "data_or_ica", exclude="bads")
+        min_samples = int(np.round(min_duration * self.sf))
+        chunk = max(int(chunk_sec * self.sf), 1)
+        n_jobs = os.cpu_count() if n_jobs is None or n_jobs < 1 else n_jobs
+        with ThreadPoolExecutor(n_jobs) as executor:
+            results = list(
+                executor.map(
+                    lambda start: _annotate_chunk(
+                        raw, picks, start, min(start + chunk, n_times), peak, flat
+                    ),
+                    range(0, n_times, chunk),
+                )
+            )
+
+        def merged(kind):
+            return _merge_runs(
+                *(np.concatenate([r[kind][i] for r in results]) for i in range(3))
+            )
+
+        annotations = mne.Annotations([], [], [], orig_time=raw.info["meas_date"])
+        for kind, threshold in (("flat", flat), ("peak", peak)):
+            if threshold is None:
+                continue
+            rows, starts, stops = merged(kind)
+            keep = stops - starts >= min_samples
+            rows, starts, stops = rows[keep], starts[keep], stops[keep]
+            count = np.bincount(rows, weights=stops - starts, minlength=len(picks))
+            count[count > 0] += 1  # offset by 1 due to diff
+            percent = count / n_times * 100
+            # Channels flagged for too long are bad channels rather than annotated.
+            to_annotate = ((percent > 0) & (percent < bad_percent))[rows]
+            annotations += _intervals_to_annotations(
+                *_union_intervals(starts[to_annotate], stops[to_annotate]),
+                f"BAD_{kind}",
+                raw,
+            )
+
+        rows, starts, stops = merged("nan")
+        # As annotate_nan, spans end at the sample after the run or the last one.
+        onsets = raw.times[starts]
+        nan_annotations = mne.Annotations(
+            onsets,
+            raw.times[np.minimum(stops, n_times - 1)] - onsets,
+            "BAD_NAN",
+            ch_names=[[raw.ch_names[row]] for row in rows],
+            orig_time=raw.info["meas_date"],
+        )
+        if raw.info["meas_date"] is not None:
+            nan_annotations.onset += raw.first_time
+        return annotations + nan_annotations
 
     def auto_detect_bad_channels(
-        self, path=None, methods=CHANNELS_DETECTION_METHODS.keys()
+        self,
+        path=None,
+        methods=CHANNELS_DETECTION_METHODS.keys(),
+        random_state: int | None = 0,
+        cache: InterpolationCache | bool = True,
+        proxy: bool = False,
     ):
         """Writes bad channels file automatically based on pyprep lib
 
         Args:
             path: Path to the output bad channels file. if None will be saved in default path.
+            random_state: Seed of the RANSAC channel subsets. With a fixed seed
+                the RANSAC predictors are reused across segments and subjects
+                on the same net. Defaults to 0.
+            cache: Cache of the RANSAC predictors. If True, the cache shared
+                by the session, if False, no caching. Defaults to True.
+            proxy: Whether to detect on the proxy of :py:meth:`build_proxy`
+                instead of the full-rate data. Defaults to False.
         Returns:
             str: The path of the generated bad channels file.
         """
+        from contextlib import nullcontext
+
+        if cache is True:
+            cache = RANSAC_CACHE
+        with cache.patch_ransac() if cache else nullcontext():
+            bad_channels = self._detect_bad_channels(methods, random_state, proxy)
+        if cache:
+            cache.log_stats()
+
+        default_path = os.path.join(
+            self.output_dir, self.__class__.__name__, "bad_channels.txt"
+        )
+        self._write_array_to_file(list(bad_channels), path or default_path)
+        return path or default_path
 
+    def _detect_bad_channels(self, methods, random_state, proxy):
+        raw, hf_power = self.mne_raw, None
+        if proxy:
+            if not self.proxy:
+                self.build_proxy()
+            raw, hf_power = self.proxy["raw"], self.proxy["hf_power"]
         bad_channels = set()
         # To avoid memory errors, if the data size is big, the raw data is processed in smaller segments.
-        segments_number, segment_duration = self._get_segments_number()
-        duration = self.mne_raw.times[-1]
+        segments_number, segment_duration = self._get_segments_number(raw)
+        duration = raw.times[-1]
         if segment_duration >= duration:
-            self._add_bad_channels(bad_channels, self.mne_raw, methods)
+            self._add_bad_channels(bad_channels, raw, methods, random_state, hf_power)
         else:
             segment_start = 0
             segment_end = segment_duration
             for i in range(segments_number):
-                segment = self.mne_raw.copy().crop(segment_start, segment_end)
-                self._add_bad_channels(bad_channels, segment, methods)
-                segment_start = segment_end
-                segment_end = min(
-                    segment_end + CHANNELS_DETECTION_SEGMENT_SIZE, duration
+                segment = raw.copy().crop(segment_start, segment_end)
+                segment_hf_power = None
+                if hf_power is not None:
+                    first = raw.time_as_index(segment_start)[0]
+                    segment_hf_power = hf_power[:, first : first + segment.n_times]
+                self._add_bad_channels(
+                    bad_channels, segment, methods, random_state, segment_hf_power
                 )
+                segment_start = segment_end
+                segment_end = min(segment_end + segment_duration, duration)
+        return bad_channels
 
-        default_path = os.path.join(
-            self.output_dir, self.__class__.__name__, "bad_channels.txt"
+    @logger_wraps()
+    def validate_proxy(
+        self,
+        methods=CHANNELS_DETECTION_METHODS.keys(),
+        amplitude_peak: float = 100e-6,
+        amplitude_min_duration: float = 0.005,
+        random_state: int | None = 0,
+        **proxy_kwargs,
+    ) -> dict:
+        """Compares the proxy-mode detection of bad channels and annotations
+        with the full-rate one. The report is saved to "proxy_validation.csv".
+        Neither the bad channels nor the annotations of the recording are changed.
+
+        Args:
+            methods: Bad channels detection methods
+                as in :py:meth:`auto_detect_bad_channels`.
+            amplitude_peak: Maximum accepted peak-to-peak amplitude
+                as in :py:meth:`auto_set_annotations`. Defaults to 100e-6.
+            amplitude_min_duration: Minimum required duration for the annotation
+                as in :py:meth:`auto_set_annotations`. Defaults to 0.005.
+            random_state: Seed of the RANSAC channel subsets. Defaults to 0.
+            **proxy_kwargs: Arguments passed to :py:meth:`build_proxy`.
+
+        Returns:
+            dict: Bad channels found by each mode and their agreement,
+            annotated durations and their overlap, and timings with the speedup.
+        """
+        import time
+
+        import pandas as pd
+
+        timings = dict()
+
+        def timed(name, func, *args, **kwargs):
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            timings[name] = time.perf_counter() - start
+            return result
+
+        proxy_kwargs.setdefault("min_duration", amplitude_min_duration)
+        timed("proxy_build_sec", self.build_proxy, **proxy_kwargs)
+
+        full_bads = timed(
+            "full_channels_sec", self._detect_bad_channels, methods, random_state, False
+        )
+        proxy_bads = timed(
+            "proxy_channels_sec", self._detect_bad_channels, methods, random_state, True
+        )
+        args = (amplitude_peak, amplitude_min_duration)
+        full_mask = self._bad_samples(
+            timed("full_annotations_sec", self._detect_annotations, *args, False)
+        )
+        proxy_mask = self._bad_samples(
+            timed("proxy_annotations_sec", self._detect_annotations, *args, True)
         )
-        self._write_array_to_file(list(bad_channels), path or default_path)
-        return path or default_path
+
+        full_sec = timings["full_channels_sec"] + timings["full_annotations_sec"]
+        proxy_sec = (
+            timings["proxy_build_sec"]
+            + timings["proxy_channels_sec"]
+            + timings["proxy_annotations_sec"]
+        )
+        union_bads = full_bads | proxy_bads
+        union_mask = (full_mask | proxy_mask).sum()
+        self.proxy_report = {
+            "proxy_sfreq": self.proxy["raw"].info["sfreq"],
+            "full_bad_channels": sorted(full_bads),
+            "proxy_bad_channels": sorted(proxy_bads),
+            "missed_bad_channels": sorted(full_bads - proxy_bads),
+            "extra_bad_channels": sorted(proxy_bads - full_bads),
+            "bad_channels_jaccard": (
+                len(full_bads & proxy_bads) / len(union_bads) if union_bads else 1.0
+            ),
+            "full_bad_sec": full_mask.sum() / self.sf,
+            "proxy_bad_sec": proxy_mask.sum() / self.sf,
+            "missed_bad_sec": (full_mask & ~proxy_mask).sum() / self.sf,
+            "extra_bad_sec": (proxy_mask & ~full_mask).sum() / self.sf,
+            "annotations_jaccard": (
+                (full_mask & proxy_mask).sum() / union_mask if union_mask else 1.0
+            ),
+            **timings,
+            "speedup": full_sec / proxy_sec,
+        }
+        logger.info(
+            f"Proxy detection took {proxy_sec:.1f} s instead of {full_sec:.1f} s, "
+            f"bad channels agreement {self.proxy_report['bad_channels_jaccard']:.2f}, "
+            f"annotations agreement {self.proxy_report['annotations_jaccard']:.2f}"
+        )
+        pd.DataFrame([self.proxy_report]).to_csv(
+            self.output_dir / self.__class__.__name__ / "proxy_validation.csv",
+            index=False,
+        )
+        return self.proxy_report
 
     def read_bad_channels(self, path: str | None = None):
         """Imports bad channels from file to mne raw object.
@@ -251,6 +682,99 @@ class CleaningPipe(BasePipe):
             )
 
 
+def _proxy_hf_noise(noisy_channels, hf_power, zscore_threshold=5.0):
+    """Sets bad_by_hf_noise of :py:class:`pyprep.NoisyChannels` run on the proxy
+    from the full-rate high-frequency power, as pyprep does at the full rate."""
+    MAD_TO_SD = 1.4826
+    usable = noisy_channels.usable_idx
+    low = noisy_channels.EEGFiltered
+    if low is None:
+        low = noisy_channels.EEGFiltered = noisy_channels._get_filtered_data()
+    # Medians of 1 second power windows stand in for pyprep's amplitude MADs.
+    win = max(min(int(noisy_channels.sample_rate), low.shape[1]), 1)
+    n_win = low.shape[1] // win
+    hf = hf_power[usable, : n_win * win].reshape(-1, n_win, win).mean(axis=-1)
+    lf = np.square(low[:, : n_win * win]).reshape(-1, n_win, win).mean(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        noisiness = np.sqrt(np.median(hf, axis=1) / np.median(lf, axis=1))
+    noise_median = np.nanmedian(noisiness)
+    noise_sd = np.nanmedian(np.abs(noisiness - noise_median)) * MAD_TO_SD
+    noise_zscore = np.zeros(len(noisy_channels.ch_names_original))
+    noise_zscore[usable] = (noisiness - noise_median) / noise_sd
+    hf_mask = np.isnan(noise_zscore) | (noise_zscore > zscore_threshold)
+    noisy_channels.bad_by_hf_noise = noisy_channels.ch_names_original[
+        hf_mask
+    ].tolist()
+
+
+def _mask_to_annotations(mask, description, raw, step=1, ch_names=None):
+    """Annotations of the runs of a mask whose elements span step samples."""
+    _, starts, stops = _mask_runs(mask[np.newaxis])
+    return _intervals_to_annotations(
+        starts * step, np.minimum(stops * step, raw.n_times), description, raw, ch_names
+    )
+
+
+def _intervals_to_annotations(starts, stops, description, raw, ch_names=None):
+    """Annotations of the samples intervals, as MNE's annotate_amplitude does."""
+    annotations = mne.Annotations(
+        starts / raw.info["sfreq"],
+        (stops - starts) / raw.info["sfreq"],
+        description,
+        ch_names=None if ch_names is None else [ch_names] * len(starts),
+        orig_time=raw.info["meas_date"],
+    )
+    if raw.info["meas_date"] is not None:
+        annotations.onset += raw.first_time
+    return annotations
+
+
+def _annotate_chunk(raw, picks, start, stop, peak, flat):
+    """Runs of diffs beyond the thresholds and of NaN samples in a chunk."""
+    n_times = raw.n_times
+    # One more sample for the diff at the end of the chunk.
+    data = raw.get_data(start=start, stop=min(stop + 1, n_times))
+    diff = np.abs(np.diff(data[picks], axis=1))[:, : stop - start]
+    runs = {"nan": _mask_runs(np.isnan(data[:, : stop - start]), start)}
+    if peak is not None:
+        runs["peak"] = _mask_runs(diff >= peak, start)
+    if flat is not None:
+        runs["flat"] = _mask_runs(diff <= flat, start)
+    return runs
+
+
+def _mask_runs(mask, offset=0):
+    """Rows, starts and stops of the runs of True along the rows of a 2D mask."""
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    stops = np.nonzero(edges == -1)[1]
+    return rows, starts + offset, stops + offset
+
+
+def _merge_runs(rows, starts, stops):
+    """Sorts runs by row and start and merges the adjacent ones of a row."""
+    order = np.lexsort((starts, rows))
+    rows, starts, stops = rows[order], starts[order], stops[order]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = (rows[1:] != rows[:-1]) | (starts[1:] != stops[:-1])
+    first = np.flatnonzero(first)
+    last = np.append(first[1:], len(rows))[: len(first)] - 1
+    return rows[first], starts[first], stops[last]
+
+
+def _union_intervals(starts, stops):
+    """Union of intervals as sorted disjoint intervals."""
+    order = np.argsort(starts, kind="stable")
+    starts, stops = starts[order], np.maximum.accumulate(stops[order])
+    first = np.ones(len(starts), dtype=bool)
+    first[1:] = starts[1:] > stops[:-1]
+    first = np.flatnonzero(first)
+    last = np.append(first[1:], len(starts))[: len(first)] - 1
+    return starts[first], stops[last]
+
+
 @define(kw_only=True)
 class ICAPipe(BasePipe):
     """The ICA pipeline element.
@@ -265,6 +789,26 @@ class ICAPipe(BasePipe):
     """Instance of :py:class:`mne:mne.preprocessing.ICA`.
     """
 
+    sources_cache: dict = field(init=False, factory=dict)
+    """Memmapped source activations file with per-component spectra
+    and segments variances as computed by :py:meth:`compute_sources`.
+    """
+
+    component_scores: "pd.DataFrame | None" = field(init=False, default=None)
+    """Instance of :py:class:`pandas:pandas.DataFrame` with scores, label and
+    decision per component as returned by :py:meth:`score_components`.
+    None until the components are scored.
+    """
+
+    suggested_exclude: list = field(init=False, factory=list)
+    """Components suggested for exclusion by :py:meth:`score_components`.
+    """
+
+    fit_report: dict = field(init=False, factory=dict)
+    """Training set size, fit times and unmixing stability
+    as computed by :py:meth:`fit` with report=True.
+    """
+
     def __init__(
         self,
         prec_pipe: BasePipeType | None = None,
@@ -274,6 +818,7 @@ class ICAPipe(BasePipe):
         n_components: int | float | None = None,
         fit_params: dict | None = None,
         path_to_ica: str | None = None,
+        preload: bool = True,
         **ica_kwargs,
     ):
         """
@@ -295,6 +840,8 @@ class ICAPipe(BasePipe):
                 `infomax <https://mne.tools/stable/generated/mne.preprocessing.infomax.html#mne.preprocessing.infomax>`_.
                 Defaults to None.
             path_to_ica: Path to the saved -ica.fif file you want to continue work with. Defaults to None.
+            preload: Whether to load the data into memory. If False, the data is read from file
+                as needed, e.g., by :py:meth:`apply` with block_sec. Defaults to True.
             **ica_kwargs: Arguments passed to :py:class:`mne:mne.preprocessing.ICA`.
         """
         if path_to_ica is not None:
@@ -314,53 +861,693 @@ class ICAPipe(BasePipe):
                 output_dir=output_dir,
                 mne_ica=ica,
             )
-        self.mne_raw.load_data()
+        if preload:
+            self.mne_raw.load_data()
 
     @logger_wraps()
-    def fit(self, filter_kwargs: dict = None, **fit_kwargs):
+    def fit(
+        self,
+        filter_kwargs: dict = None,
+        sample_budget: int | None = None,
+        target_sfreq: float | None = None,
+        span_sec: float = 10.0,
+        hypno: Iterable[int] | None = None,
+        hypno_freq: float = 1 / 30,
+        seed: int | None = None,
+        report: bool = False,
+        template: mne.preprocessing.ICA | str | None = None,
+        **fit_kwargs,
+    ):
         """High-pass filters (1 Hz) a copy of the mne_raw object
         and then runs :py:meth:`mne:mne.preprocessing.ICA.fit` on it.
 
+        If any of sample_budget, target_sfreq or hypno is provided, ICA is fitted
+        on a training set instead: spans of span_sec seconds free of BAD annotations
+        are sampled (evenly across sleep stages if hypno is provided)
+        up to sample_budget, and only they are filtered and resampled to target_sfreq.
+
         Args:
             filter_args: Arguments passed to :py:meth:`mne:mne.io.Raw.filter`. Defaults to None.
+            sample_budget: Maximal number of time samples (at target_sfreq)
+                in the training set. If None, all clean spans are used. Defaults to None.
+            target_sfreq: Sampling frequency of the training set.
+                If None, the original is kept. Defaults to None.
+            span_sec: Length of the sampled spans in seconds. Defaults to 10.
+            hypno: Hypnogram to sample the spans across sleep stages. Defaults to None.
+            hypno_freq: Sampling rate of the hypnogram in Hz. Defaults to 1/30.
+            seed: Seed of the spans sampling. Defaults to None.
+            report: Whether to also fit ICA on the full recording and
+                report fit-time reduction and unmixing stability in self.fit_report
+                and ica_fit_report.csv. Defaults to False.
+            template: Fitted ICA (or path to -ica.fif file) on the same channels,
+                e.g., of a previous subject or a group ICA, to initialize the fit with.
+                Its unmixing is mapped into this recording's PCA space,
+                which costs one extra PCA pass. Defaults to None.
             **fit_kwargs: Arguments passed to :py:meth:`mne:mne.preprocessing.ICA.fit`.
         """
+        import copy
+        import time
+
+        import pandas as pd
+
         filter_kwargs = filter_kwargs or dict()
         filter_kwargs.setdefault("l_freq", 1.0)
         filter_kwargs.setdefault("h_freq", None)
+        self.sources_cache = {}
+        use_training_set = not (
+            sample_budget is None and target_sfreq is None and hypno is None
+        )
+        if not use_training_set:
+            self._fit_full(self.mne_ica, filter_kwargs, template, **fit_kwargs)
+            return
+
+        full_ica = copy.deepcopy(self.mne_ica)
+        start = time.perf_counter()
+        training_raw = self._build_training_set(
+            filter_kwargs,
+            sample_budget,
+            target_sfreq,
+            span_sec,
+            hypno,
+            hypno_freq,
+            seed,
+        )
+        self._fit_ica(self.mne_ica, training_raw, template, **fit_kwargs)
+        training_time = time.perf_counter() - start
+        training_sfreq = training_raw.info["sfreq"]
+        logger.info(
+            f"ICA fitted on {training_raw.n_times} samples at {training_sfreq} Hz "
+            f"({training_raw.n_times / training_sfreq / 60:.1f} min)"
+        )
+        if not report:
+            return
+
+        start = time.perf_counter()
+        self._fit_full(full_ica, filter_kwargs, template, **fit_kwargs)
+        full_time = time.perf_counter() - start
+        self.fit_report = {
+            "training_samples": training_raw.n_times,
+            "training_sfreq": training_sfreq,
+            "full_samples": self.mne_raw.n_times,
+            "training_fit_sec": training_time,
+            "full_fit_sec": full_time,
+            "speedup": full_time / training_time,
+            "training_n_iter": getattr(self.mne_ica, "n_iter_", None),
+            "full_n_iter": getattr(full_ica, "n_iter_", None),
+            **_match_components(self.mne_ica, full_ica),
+        }
+        logger.info(
+            f"ICA fit took {training_time:.1f} s instead of {full_time:.1f} s, "
+            "matched components correlation: "
+            f"mean {self.fit_report['mean_abs_corr']:.3f}, "
+            f"min {self.fit_report['min_abs_corr']:.3f}"
+        )
+        pd.DataFrame([self.fit_report]).to_csv(
+            self.output_dir / self.__class__.__name__ / "ica_fit_report.csv",
+            index=False,
+        )
+
+    def _fit_full(self, ica, filter_kwargs, template=None, **fit_kwargs):
         if self.mne_raw.info["highpass"] < 1.0:
-            filtered_raw = self.mne_raw.copy()
+            filtered_raw = self.mne_raw.copy().load_data()
             filtered_raw.filter(**filter_kwargs)
         else:
             filtered_raw = self.mne_raw
-        self.mne_ica.fit(filtered_raw, **fit_kwargs)
+        self._fit_ica(ica, filtered_raw, template, **fit_kwargs)
+
+    def _fit_ica(self, ica, inst, template=None, **fit_kwargs):
+        """Fits ICA, warm-started from the template if provided."""
+        if template is None:
+            ica.fit(inst, **fit_kwargs)
+            return
+
+        import copy
+        import warnings
+
+        if not isinstance(template, mne.preprocessing.ICA):
+            template = mne.preprocessing.read_ica(template, verbose=False)
+        # A single iteration fit gives PCA of this data.
+        probe = copy.deepcopy(ica)
+        probe.fit_params["max_iter"] = 1
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            probe.fit(inst, **{**fit_kwargs, "verbose": False})
+        w_init = _warm_start_unmixing(template, probe)
+        if w_init is None:
+            logger.warning("Template ICA doesn't match, fitting from scratch.")
+            ica.fit(inst, **fit_kwargs)
+            return
+
+        key = "weights" if ica.method == "infomax" else "w_init"
+        ica.fit_params[key] = w_init
+        try:
+            ica.fit(inst, **fit_kwargs)
+        finally:
+            del ica.fit_params[key]
+
+    def _build_training_set(
+        self,
+        filter_kwargs,
+        sample_budget,
+        target_sfreq,
+        span_sec,
+        hypno,
+        hypno_freq,
+        seed,
+    ):
+        """Concatenates filtered and resampled clean spans into a raw object."""
+        raw = self.mne_raw
+        span_len = int(span_sec * self.sf)
+        n_spans = raw.n_times // span_len
+
+        # Spans overlapping BAD annotations are not used.
+        bad = self._bad_samples()
+        clean = ~bad[: n_spans * span_len].reshape(n_spans, span_len).any(axis=1)
+        spans = np.flatnonzero(clean)
+        if spans.size == 0:
+            raise ValueError("No clean spans to fit ICA on")
+
+        rng = np.random.default_rng(seed)
+        if hypno is not None:
+            hypno = np.asarray(hypno)
+            centers = (spans + 0.5) * span_sec
+            stages = hypno[
+                np.minimum((centers * hypno_freq).astype(int), len(hypno) - 1)
+            ]
+            # Interleave shuffled spans of every stage, so that any budget
+            # takes spans evenly across stages.
+            per_stage = [
+                rng.permutation(spans[stages == stage]) for stage in np.unique(stages)
+            ]
+            order = sorted(
+                (rank, i, span)
+                for i, stage_spans in enumerate(per_stage)
+                for rank, span in enumerate(stage_spans)
+            )
+            spans = np.array([span for _, _, span in order])
+        else:
+            spans = rng.permutation(spans)
+        if sample_budget is not None:
+            sfreq = target_sfreq or self.sf
+            spans = spans[: max(int(np.ceil(sample_budget / (span_sec * sfreq))), 1)]
+        spans = np.sort(spans)
+
+        # Filter adjacent spans together, padded to avoid edge artifacts.
+        runs = np.split(spans, np.flatnonzero(np.diff(spans) > 1) + 1)
+        pad = int(
+            min(10 / filter_kwargs["l_freq"] if filter_kwargs["l_freq"] else 10, 30)
+            * self.sf
+        )
+        pieces = []
+        for run in runs:
+            start, stop = run[0] * span_len, (run[-1] + 1) * span_len
+            pad_start, pad_stop = max(start - pad, 0), min(stop + pad, raw.n_times)
+            piece = mne.io.RawArray(
+                raw.get_data(start=pad_start, stop=pad_stop),
+                raw.info,
+                verbose=False,
+            )
+            piece.filter(**{"verbose": False, **filter_kwargs})
+            if target_sfreq is not None and target_sfreq < self.sf:
+                piece.resample(target_sfreq, verbose=False)
+            piece.crop(
+                tmin=(start - pad_start) / self.sf,
+                tmax=(stop - pad_start) / self.sf,
+                include_tmax=False,
+            )
+            pieces.append(piece)
+        return mne.concatenate_raws(pieces, verbose=False)
+
+    @logger_wraps()
+    def compute_sources(
+        self,
+        block_sec: float = 60,
+        segment_sec: float = 2,
+        fmax: float | None = None,
+        n_jobs: int = -1,
+    ):
+        """Computes ICA source activations once into ica_sources.dat memmap
+        and per-component spectra and variances of segments in parallel.
+
+        :py:meth:`plot_properties` and :py:meth:`score_components` are served
+        from this cache until the ICA is refitted or applied.
+
+        Args:
+            block_sec: Length of blocks in seconds the sources are computed by.
+                Defaults to 60.
+            segment_sec: Length of segments in seconds for spectra and variances.
+                Defaults to 2.
+            fmax: Upper frequency bound of spectra. If None, 1.25 of lowpass
+                or Nyquist frequency. Defaults to None.
+            n_jobs: Number of components processed in parallel, -1 for all CPUs.
+                Defaults to -1.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        raw = self.mne_raw
+        picks = [raw.ch_names.index(ch) for ch in self.mne_ica.ch_names]
+        operator, offset = self._ica_operator(picks, "get_sources")
+
+        fname = self.output_dir / self.__class__.__name__ / "ica_sources.dat"
+        shape = (self.mne_ica.n_components_, raw.n_times)
+        sources = np.memmap(fname, dtype="float64", mode="w+", shape=shape)
+        block = int(block_sec * self.sf)
+        for start in range(0, raw.n_times, block):
+            data = raw.get_data(picks, start=start, stop=start + block)
+            sources[:, start : start + block] = operator @ data + offset[:, None]
+        sources.flush()
+
+        # Segments overlapping BAD annotations are left out of the spectra.
+        segment_len = int(segment_sec * self.sf)
+        n_segments = raw.n_times // segment_len
+        good = ~(
+            self._bad_samples()[: n_segments * segment_len]
+            .reshape(n_segments, segment_len)
+            .any(axis=1)
+        )
+        if fmax is None:
+            fmax = min(raw.info["lowpass"] * 1.25, self.sf / 2)
+
+        def component_stats(idx):
+            segments = sources[idx, : n_segments * segment_len].reshape(
+                n_segments, segment_len
+            )
+            psds, freqs = mne.time_frequency.psd_array_welch(
+                segments[good], self.sf, fmax=fmax, n_fft=segment_len, verbose=False
+            )
+            psds_db = 10 * np.log10(psds)
+            return (
+                freqs,
+                psds.mean(axis=0),
+                psds.std(axis=0),
+                psds_db.mean(axis=0),
+                psds_db.std(axis=0),
+                segments.var(axis=1),
+            )
+
+        n_workers = os.cpu_count() if n_jobs is None or n_jobs < 1 else n_jobs
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            stats = list(executor.map(component_stats, range(shape[0])))
+
+        self.sources_cache = {
+            "fname": fname,
+            "shape": shape,
+            "sfreq": self.sf,
+            "segment_len": segment_len,
+            "good_segments": good,
+            "freqs": stats[0][0],
+            **{
+                key: np.array([stat[i] for stat in stats])
+                for i, key in enumerate(
+                    ["psd_mean", "psd_std", "psd_db_mean", "psd_db_std", "segment_var"],
+                    start=1,
+                )
+            },
+        }
+
+    def _ica_sources(self):
+        cache = self.sources_cache
+        return np.memmap(
+            cache["fname"], dtype="float64", mode="r", shape=cache["shape"]
+        )
 
     def plot_sources(self, **kwargs):
-        """A wrapper for :py:meth:`mne:mne.preprocessing.ICA.plot_sources`."""
+        """A wrapper for :py:meth:`mne:mne.preprocessing.ICA.plot_sources`.
+
+        The sources are computed by MNE rather than read from
+        :py:meth:`compute_sources` cache, as MNE's browser, which excludes
+        components interactively, has no public way to take precomputed sources.
+        """
         return self.mne_ica.plot_sources(inst=self.mne_raw, **kwargs)
 
     def plot_components(self, save=False, **kwargs):
-        """A wrapper for :py:meth:`mne:mne.preprocessing.ICA.plot_components`."""
+        """A wrapper for :py:meth:`mne:mne.preprocessing.ICA.plot_components`.
+
+        The topographies come from the mixing matrix, so no sources are computed.
+        """
         fig = self.mne_ica.plot_components(inst=self.mne_raw, **kwargs)
         if save:
             self._savefig("ica_components.png", fig)
         return fig
 
-    def plot_properties(self, picks=None, save=False, **kwargs):
-        """A wrapper for :py:meth:`mne:mne.preprocessing.ICA.plot_properties`."""
-        figs = self.mne_ica.plot_properties(self.mne_raw, picks=picks, **kwargs)
+    @logger_wraps()
+    def plot_properties(
+        self,
+        picks=None,
+        save=False,
+        dB: bool = True,
+        n_jobs: int = -1,
+        figsize: tuple = (9, 6),
+        **kwargs,
+    ):
+        """Plots components' topography, segments image, spectrum and
+        segments variance from the cache computed by :py:meth:`compute_sources`,
+        which is run if there is no cache.
+
+        If any MNE-only arguments (e.g., psd_args or image_args) are given,
+        :py:meth:`mne:mne.preprocessing.ICA.plot_properties` is called instead.
+
+        Args:
+            picks: Indices of components to plot. If None, the first five
+                components. Defaults to None.
+            save: Whether to save the figures to files. If True, the figures
+                are rendered and saved in a process pool and not returned.
+                Defaults to False.
+            dB: Whether to plot spectra in decibels. Defaults to True.
+            n_jobs: Number of processes rendering the figures, -1 for all CPUs.
+                Defaults to -1.
+            figsize: Figure size in inches. Defaults to (9, 6).
+            **kwargs: Arguments passed to
+                :py:meth:`mne:mne.preprocessing.ICA.plot_properties`.
+
+        Returns:
+            list of matplotlib figures if save is False,
+            otherwise list of saved files.
+        """
+        if kwargs:
+            figs = self.mne_ica.plot_properties(
+                self.mne_raw, picks=picks, dB=dB, figsize=figsize, **kwargs
+            )
+            if save:
+                for i, fig in enumerate(figs):
+                    self._savefig(f"proprety_{i}.png", fig)
+            return figs
+
+        if not self.sources_cache:
+            self.compute_sources()
+        # As MNE, the first five components by default.
+        picks = range(min(5, self.mne_ica.n_components_)) if picks is None else picks
+        picks = [picks] if isinstance(picks, int) else list(picks)
+
+        if not save:
+            return [
+                _plot_component_properties(
+                    self.mne_ica, self.sources_cache, pick, dB, figsize
+                )
+                for pick in picks
+            ]
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        fnames = [
+            self.output_dir / self.__class__.__name__ / f"proprety_{pick}.png"
+            for pick in picks
+        ]
+        n_workers = os.cpu_count() if n_jobs is None or n_jobs < 1 else n_jobs
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            list(
+                executor.map(
+                    _save_component_properties,
+                    *zip(
+                        *[
+                            (self.mne_ica, self.sources_cache, pick, dB, figsize, fname)
+                            for pick, fname in zip(picks, fnames)
+                        ]
+                    ),
+                )
+            )
+        return fnames
+
+    @logger_wraps()
+    def score_components(
+        self,
+        eog: str | Iterable[str] | None = None,
+        ecg: str | Iterable[str] | None = None,
+        emg: str | Iterable[str] | None = None,
+        templates=None,
+        threshold: float = 3.0,
+        borderline: float = 2.0,
+        template_threshold: float = 0.9,
+        hf_fmin: float = 30,
+        block_sec: float = 300,
+        save: bool = False,
+    ):
+        """Scores all components against EOG, ECG and EMG references
+        and a library of component templates in one pass over the sources.
+
+        Sources and references are band-pass filtered as in MNE's
+        find_bads_eog (1-10 Hz), find_bads_ecg (8-16 Hz) and above hf_fmin for EMG,
+        and correlated outside BAD annotations. Absolute correlations are z-scored
+        across components, leaving out outliers iteratively. High-frequency power ratio
+        is taken from :py:meth:`compute_sources` spectra and robustly z-scored.
+
+        Args:
+            eog: EOG reference channels. If None, channels of eog type. Defaults to None.
+            ecg: ECG reference channels. If None, channels of ecg type. Defaults to None.
+            emg: EMG reference channels. If None, channels of emg type. Defaults to None.
+            templates: Library of component topographies: a DataFrame or
+                a path to csv file with channel names as index and template names
+                as columns, as written by :py:meth:`export_templates`. Defaults to None.
+            threshold: Z-score (of correlation or high-frequency ratio) to suggest
+                the component for exclusion. Defaults to 3.0.
+            borderline: Z-score to mark the component for manual review.
+                Defaults to 2.0.
+            template_threshold: Absolute correlation with a template to suggest
+                the component for exclusion, borderline if 0.1 lower. Defaults to 0.9.
+            hf_fmin: Lower bound of high frequencies in Hz. Defaults to 30.
+            block_sec: Length of blocks in seconds the sources are read by.
+                Defaults to 300.
+            save: Whether to save the table to ica_component_scores.csv.
+                Defaults to False.
+
+        Returns:
+            pandas.DataFrame: Scores per component with "label" and
+            "decision" ("exclude", "borderline" or "keep") columns.
+        """
+        import pandas as pd
+
+        if not self.sources_cache:
+            self.compute_sources()
+        raw = self.mne_raw
+        names = self.mne_ica._ica_names
+        refs = {
+            "eog": self._reference_channels(eog, "eog"),
+            "ecg": self._reference_channels(ecg, "ecg"),
+            "emg": self._reference_channels(emg, "emg"),
+        }
+        bands = {"eog": (1, 10), "ecg": (8, 16), "emg": (hf_fmin, None)}
+        bands = {kind: band for kind, band in bands.items() if refs[kind]}
+
+        corrs = self._correlate_sources(refs, bands, block_sec) if bands else {}
+        table = pd.DataFrame(index=pd.Index(names, name="component"))
+        z_scores = dict()
+        for kind, corr in corrs.items():
+            for i, ch in enumerate(refs[kind]):
+                table[f"{ch}_corr"] = corr[:, i]
+            z_scores[kind] = np.max(
+                [_outlier_zscore(np.abs(c), threshold) for c in corr.T], axis=0
+            )
+            table[f"{kind}_z"] = z_scores[kind]
+
+        freqs = self.sources_cache["freqs"]
+        psd = self.sources_cache["psd_mean"][:, freqs >= 1]
+        hf_ratio = psd[:, freqs[freqs >= 1] >= hf_fmin].sum(axis=1) / psd.sum(axis=1)
+        table["hf_ratio"] = hf_ratio
+        # Robust z-score, as ratios of ocular and cardiac components are
+        # outliers on the low side.
+        mad = 1.4826 * np.median(np.abs(hf_ratio - np.median(hf_ratio)))
+        z_scores["hf"] = (hf_ratio - np.median(hf_ratio)) / (mad or hf_ratio.std())
+        table["hf_z"] = z_scores["hf"]
+
+        template_corrs = dict()
+        if templates is not None:
+            if not isinstance(templates, pd.DataFrame):
+                templates = pd.read_csv(templates, index_col=0)
+            maps = pd.DataFrame(
+                self.mne_ica.get_components(), index=self.mne_ica.ch_names
+            )
+            common = maps.index.intersection(templates.index)
+            corr = np.corrcoef(maps.loc[common].T, templates.loc[common].T)
+            corr = np.abs(corr[: maps.shape[1], maps.shape[1] :])
+            for i, template in enumerate(templates.columns):
+                template_corrs[template] = corr[:, i]
+                table[f"{template}_template_corr"] = corr[:, i]
+
+        labels, decisions = [], []
+        for idx in range(len(names)):
+            excluded = [kind for kind, z in z_scores.items() if z[idx] >= threshold]
+            excluded += [
+                template
+                for template, corr in template_corrs.items()
+                if corr[idx] >= template_threshold
+            ]
+            review = [kind for kind, z in z_scores.items() if z[idx] >= borderline]
+            review += [
+                template
+                for template, corr in template_corrs.items()
+                if corr[idx] >= template_threshold - 0.1
+            ]
+            labels.append(",".join(excluded or review))
+            decisions.append(
+                "exclude" if excluded else "borderline" if review else "keep"
+            )
+        table["label"] = labels
+        table["decision"] = decisions
+
+        self.component_scores = table
+        self.suggested_exclude = list(np.flatnonzero(table["decision"] == "exclude"))
+        logger.info(
+            f"Suggested ICA components to exclude: {self.suggested_exclude}, "
+            f"to review: {list(np.flatnonzero(table['decision'] == 'borderline'))}"
+        )
         if save:
-            for i, fig in enumerate(figs):
-                self._savefig(f"proprety_{i}.png", fig)
-        return figs
+            table.to_csv(
+                self.output_dir / self.__class__.__name__ / "ica_component_scores.csv"
+            )
+        return table
+
+    def _reference_channels(self, picks, ch_type):
+        if picks is None:
+            return [
+                self.mne_raw.ch_names[i]
+                for i in mne.pick_types(self.mne_raw.info, **{ch_type: True})
+            ]
+        return [picks] if isinstance(picks, str) else list(picks)
+
+    def _correlate_sources(self, refs, bands, block_sec):
+        """Correlations of filtered sources with filtered references
+        per band, accumulated over blocks of the sources."""
+        sources = self._ica_sources()
+        n_times = sources.shape[1]
+        good = ~self._bad_samples()
+        filtered_refs = {
+            kind: mne.filter.filter_data(
+                self.mne_raw.get_data(refs[kind]), self.sf, *band, verbose=False
+            )
+            for kind, band in bands.items()
+        }
+        pads = {
+            kind: len(mne.filter.create_filter(None, self.sf, *band, verbose=False))
+            for kind, band in bands.items()
+        }
+        sums = {kind: [0, 0, 0, 0, 0, 0] for kind in bands}
+        block = int(block_sec * self.sf)
+        for start in range(0, n_times, block):
+            stop = min(start + block, n_times)
+            mask = good[start:stop]
+            for kind, band in bands.items():
+                # Padded blocks are filtered to avoid edge effects.
+                pad_start = max(start - pads[kind], 0)
+                pad_stop = min(stop + pads[kind], n_times)
+                x = mne.filter.filter_data(
+                    np.array(sources[:, pad_start:pad_stop]),
+                    self.sf,
+                    *band,
+                    verbose=False,
+                )[:, start - pad_start : stop - pad_start][:, mask]
+                y = filtered_refs[kind][:, start:stop][:, mask]
+                acc = sums[kind]
+                acc[0] += mask.sum()
+                acc[1] += x.sum(axis=1)
+                acc[2] += y.sum(axis=1)
+                acc[3] += np.square(x).sum(axis=1)
+                acc[4] += np.square(y).sum(axis=1)
+                acc[5] += x @ y.T
+
+        corrs = dict()
+        for kind, (n, sx, sy, sxx, syy, sxy) in sums.items():
+            cov = sxy - np.outer(sx, sy) / n
+            corrs[kind] = cov / np.sqrt(np.outer(sxx - sx**2 / n, syy - sy**2 / n))
+        return corrs
+
+    def export_templates(self, picks: Iterable[int], names: Iterable[str], fname):
+        """Adds topographies of components to the csv library of templates
+        used by :py:meth:`score_components`.
+
+        Args:
+            picks: Indices of components.
+            names: Template names for the components.
+            fname: Path to the csv file, created if doesn't exist.
+        """
+        import pandas as pd
+
+        maps = pd.DataFrame(
+            self.mne_ica.get_components()[:, list(picks)],
+            index=self.mne_ica.ch_names,
+            columns=list(names),
+        )
+        if Path(fname).exists():
+            library = pd.read_csv(fname, index_col=0)
+            maps = library.drop(columns=maps.columns, errors="ignore").join(
+                maps, how="outer"
+            )
+        maps.to_csv(fname)
 
     @logger_wraps()
-    def apply(self, exclude=None, **kwargs):
-        """A wrapper for :py:meth:`mne:mne.preprocessing.ICA.apply`."""
+    def apply(self, exclude=None, block_sec=None, **kwargs):
+        """A wrapper for :py:meth:`mne:mne.preprocessing.ICA.apply`.
+
+        If block_sec is provided, the ICA reconstruction is applied block by block
+        as a single linear projection, reading the blocks from the (possibly not loaded)
+        mne_raw and writing them to a new ica_applied_*.dat memmap, which then
+        backs mne_raw and is removed with it. If mne_raw is already backed by
+        such a memmap, it's updated in place.
+        Peak memory is bounded by the block size.
+
+        Args:
+            exclude: Components to exclude in addition to mne_ica.exclude.
+                Defaults to None.
+            block_sec: Length of blocks in seconds. If None, the whole recording
+                is reconstructed in memory. Defaults to None.
+            **kwargs: Arguments passed to :py:meth:`mne:mne.preprocessing.ICA.apply`.
+        """
         logger.info(
             f"Excluded ICA components: {list(set((exclude or [])+(self.mne_ica.exclude or [])))}"
         )
-        self.mne_ica.apply(self.mne_raw, exclude=exclude, **kwargs)
+        self.sources_cache = {}
+        if block_sec is None:
+            self.mne_ica.apply(self.mne_raw, exclude=exclude, **kwargs)
+            return
+
+        raw = self.mne_raw
+        picks = [raw.ch_names.index(ch) for ch in self.mne_ica.ch_names]
+        operator, offset = self._ica_operator(picks, exclude=exclude, **kwargs)
+
+        shape = (len(raw.ch_names), raw.n_times)
+        # Every block is read before it's written, so the store of a previous
+        # apply backing mne_raw is updated in place, as MNE applies in place.
+        # Otherwise a new store is made, so that recordings returned earlier
+        # aren't changed.
+        out = raw._data if raw.preload else None
+        if not (
+            isinstance(out, np.memmap)
+            and Path(out.filename).name.startswith("ica_applied_")
+            and out.shape == shape
+            and out.dtype == np.float64
+            and out.flags.writeable
+        ):
+            out = _scratch_memmap(
+                self.output_dir / self.__class__.__name__, "ica_applied_", shape
+            )
+        block = int(block_sec * self.sf)
+        for start in range(0, raw.n_times, block):
+            data = raw.get_data(start=start, stop=start + block)
+            data[picks] = operator @ data[picks] + offset[:, None]
+            out[:, start : start + block] = data
+        out.flush()
+
+        applied = mne.io.RawArray(
+            out, raw.info, first_samp=raw.first_samp, verbose=False
+        )
+        applied.set_annotations(raw.annotations)
+        self.mne_raw = applied
+
+    def _ica_operator(self, picks, method="apply", **kwargs):
+        """The affine map of the ICA reconstruction or sources, obtained
+        by passing the zero vector and the unit vectors through mne_ica."""
+        n_channels = len(picks)
+        probe = mne.io.RawArray(
+            np.hstack([np.zeros((n_channels, 1)), np.eye(n_channels)]),
+            mne.pick_info(self.mne_raw.info, picks),
+            verbose=False,
+        )
+        if method == "apply":
+            self.mne_ica.apply(probe, verbose=False, **kwargs)
+        else:
+            probe = self.mne_ica.get_sources(probe)
+        probed = probe.get_data()
+        offset = probed[:, 0]
+        return probed[:, 1:] - offset[:, None], offset
 
     @logger_wraps()
     def save_ica(self, fname: str = "data-ica.fif", overwrite: bool = False):
@@ -375,6 +1562,118 @@ class ICAPipe(BasePipe):
         )
 
 
+def _plot_component_properties(ica, cache, pick, dB, figsize):
+    """Draws ICA component properties from the sources cache."""
+    sources = np.memmap(cache["fname"], dtype="float64", mode="r", shape=cache["shape"])
+    segment_len, good = cache["segment_len"], cache["good_segments"]
+    times = np.arange(segment_len) / cache["sfreq"]
+
+    fig = plt.figure(figsize=figsize, layout="constrained")
+    grid = fig.add_gridspec(2, 2)
+    topo_ax, image_ax = fig.add_subplot(grid[0, 0]), fig.add_subplot(grid[0, 1])
+    psd_ax, var_ax = fig.add_subplot(grid[1, 0]), fig.add_subplot(grid[1, 1])
+
+    ica.plot_components(picks=pick, axes=topo_ax, colorbar=False, show=False)
+
+    # At most 1000 segments evenly taken from the good ones.
+    segment_idx = np.flatnonzero(good)
+    segment_idx = segment_idx[
+        np.linspace(0, len(segment_idx) - 1, min(len(segment_idx), 1000)).astype(int)
+    ]
+    image = sources[pick, : len(good) * segment_len].reshape(len(good), segment_len)
+    image = image[segment_idx]
+    vlim = np.percentile(np.abs(image), 99)
+    image_ax.imshow(
+        image,
+        aspect="auto",
+        origin="lower",
+        cmap="RdBu_r",
+        vmin=-vlim,
+        vmax=vlim,
+        extent=(times[0], times[-1], 0, len(segment_idx)),
+    )
+    image_ax.set(title="Segments", xlabel="Time (sec)", ylabel="Segment")
+
+    mean = cache["psd_db_mean" if dB else "psd_mean"][pick]
+    std = cache["psd_db_std" if dB else "psd_std"][pick]
+    psd_ax.plot(cache["freqs"], mean, color="k")
+    psd_ax.fill_between(cache["freqs"], mean - std, mean + std, color="k", alpha=0.2)
+    psd_ax.set(
+        title="Spectrum",
+        xlabel="Frequency (Hz)",
+        ylabel="Power (dB)" if dB else "Power",
+    )
+
+    variance = cache["segment_var"][pick]
+    var_ax.scatter(
+        np.flatnonzero(good), variance[good], s=3, color="k", label="Good"
+    )
+    var_ax.scatter(
+        np.flatnonzero(~good), variance[~good], s=3, color="r", label="BAD"
+    )
+    var_ax.set(title="Segments variance", xlabel="Segment", ylabel="Variance")
+    if (~good).any():
+        var_ax.legend()
+
+    return fig
+
+
+def _save_component_properties(ica, cache, pick, dB, figsize, fname):
+    plt.switch_backend("agg")
+    fig = _plot_component_properties(ica, cache, pick, dB, figsize)
+    fig.savefig(fname)
+    plt.close(fig)
+
+
+def _outlier_zscore(values, threshold, max_iter=2):
+    """Z-scores with mean and std of values that aren't outliers,
+    as MNE's iterative outliers detection."""
+    mask = np.ones(len(values), dtype=bool)
+    for _ in range(max_iter):
+        z = (values - values[mask].mean()) / values[mask].std()
+        if not (mask & (z >= threshold)).any():
+            break
+        mask &= z < threshold
+    return z
+
+
+def _warm_start_unmixing(template, ica):
+    """Maps sensor-space unmixing of the template into PCA space of ica
+    as the initial unmixing of the ICA algorithm, None if they don't match."""
+    n_components = ica.n_components_
+    if (
+        template.n_components_ != n_components
+        or set(template.ch_names) != set(ica.ch_names)
+        or template.pre_whitener_.shape[1] != 1
+        or ica.pre_whitener_.shape[1] != 1
+    ):
+        return None
+    order = [template.ch_names.index(ch) for ch in ica.ch_names]
+    sensor = template.unmixing_matrix_ @ template.pca_components_[:n_components]
+    sensor = (sensor / template.pre_whitener_[:, 0])[:, order] * ica.pre_whitener_[:, 0]
+    unmixing = sensor @ ica.pca_components_[:n_components].T
+    # The algorithm works on whitened PCA components,
+    # where unmixing is orthogonal, hence symmetric decorrelation.
+    unmixing *= np.sqrt(ica.pca_explained_variance_[:n_components])
+    u, _, vh = np.linalg.svd(unmixing)
+    return u @ vh
+
+
+def _match_components(ica, ref_ica):
+    """Matches components of two ICAs by absolute correlation
+    of their topographies."""
+    from scipy.optimize import linear_sum_assignment
+
+    maps, ref_maps = ica.get_components(), ref_ica.get_components()
+    n = min(maps.shape[1], ref_maps.shape[1])
+    corr = np.abs(np.corrcoef(maps.T, ref_maps.T)[:n, maps.shape[1] :][:, :n])
+    rows, cols = linear_sum_assignment(corr, maximize=True)
+    return {
+        "mean_abs_corr": corr[rows, cols].mean(),
+        "min_abs_corr": corr[rows, cols].min(),
+    }
+
+
 @define(kw_only=True)
 class SpectralPipe(BaseHypnoPipe, SpectrumPlots):
     """The spectral analyses pipeline element.
@@ -394,32 +1693,63 @@ class SpectralPipe(BaseHypnoPipe, SpectrumPlots):
         try:
             eeg = mne.io.read_raw(self.path_to_eeg)
         except ValueError:
-            eeg = mne.read_epochs(self.path_to_eeg)
+            # Epochs are read from disk in batches by compute_psd.
+            eeg = mne.read_epochs(self.path_to_eeg, preload=False)
         return eeg
 
     fooofs: dict = field(init=False, factory=dict)
     """Instances of :py:class:`fooof:fooof.FOOOF` per sleep stage.
     """
 
+    epochs_psds: dict = field(init=False, factory=dict)
+    """Spectra of every epoch of epochs mne_raw, with their frequencies and info,
+    per version of the epochs, picks, reference and spectral parameters.
+    """
+
+    epoch_features: dict = field(init=False, factory=dict)
+    """Spectral features of every epoch of the recording,
+    see :py:meth:`compute_epoch_features`.
+    """
+
+    coherence: dict = field(init=False, factory=dict)
+    """Coherence and imaginary coherence per sleep stage and band,
+    see :py:meth:`compute_coherence`.
+    """
+
     @logger_wraps()
     def compute_psd(
         self,
         sleep_stages: dict = {"Wake": 0, "N1": 1, "N2": 2, "N3": 3, "REM": 4},
-        reference: Iterable[str] | str | None = None,
+        reference: Iterable[str] | str | dict | None = None,
         fmin: float = 0,
         fmax: float = 60,
         picks: str | Iterable[str] = "eeg",
         reject_by_annotation: bool = True,
         save: bool = False,
         overwrite: bool = False,
+        archive: bool = False,
+        n_jobs: int = 1,
+        dtype: str | np.dtype = "float64",
+        block_sec: float | None = None,
+        cache: SpectraCache | bool = True,
+        force: bool = False,
         **psd_kwargs,
     ):
         """For each sleep stage creates a :py:class:`mne:mne.time_frequency.SpectrumArray` object.
 
+        Re-referencing is applied as a linear combination of channels
+        to the Fourier coefficients of each Welch segment, which are computed
+        once for all references, so the recording isn't copied per reference.
+        For epochs, the spectra of every epoch are computed once
+        by :py:meth:`mne:mne.Epochs.compute_psd` and averaged per stage.
+
         Args:
             sleep_stages: Sleep stages mapping in hypnogram.
                 Defaults to {"Wake": 0, "N1": 1, "N2": 2, "N3": 3, "REM": 4}.
-            reference: Which eeg reference to compute PSD with.
+            reference: Which eeg reference to compute PSD with,
+                as accepts :py:meth:`mne:mne.io.Raw.set_eeg_reference`.
+                A dict maps labels to several references, e.g.,
+                {"original": None, "average": "average", "mastoids": ["M1", "M2"]}.
                 If None, the reference isn't changed. Defaults to None.
             fmin: Lower frequency bound. Defaults to 0.
             fmax: Upper frequency bound. Defaults to 60.
@@ -429,85 +1759,844 @@ class SpectralPipe(BaseHypnoPipe, SpectrumPlots):
                 Defaults to True.
             save: Whether to save the spectra in .h5 files. Defaults to False.
             overwrite: Whether to overwrite psd files. Defaults to False.
+            archive: Whether to save the spectra into the per-subject archive
+                instead of a file per sleep stage. Defaults to False.
+            n_jobs: Number of threads computing the spectra of the stage runs,
+                each also split by channels when there is a single reference.
+                As the channel blocks differ, spectra of different n_jobs
+                agree up to floating point rounding rather than bitwise.
+                If None or < 1, as many as CPUs. Defaults to 1.
+            dtype: Precision of the data and FFTs. "float32" halves the memory.
+                The rounding error of an FFT bin scales with the amplitude
+                of the whole signal rather than of the bin, so the relative
+                error of a float32 bin against float64 is within
+                1e-5 * sqrt(peak / power), where peak is the channel's largest
+                power. The margin covers references cancelling most of
+                the signal. Defaults to "float64".
+            block_sec: If set, the recording is streamed in blocks of this length
+                in seconds, accumulating the periodograms of the Welch segments
+                per stage run, so that the memory is bounded by the block size.
+                The spectra are the same as of the whole recording read at once.
+                Supports only average="mean". Defaults to None.
+            cache: On-disk cache of the spectra, keyed by the data version,
+                hypnogram, annotations, reference, picks and spectral parameters.
+                If True, psd_cache in the pipe's directory, if False, no caching.
+                Defaults to True.
+            force: Whether to recompute the spectra and overwrite the cached ones.
+                Defaults to False.
             **psd_kwargs: Additional arguments passed to :py:func:`mne:mne.time_frequency.psd_array_welch`.
-        """
-        from more_itertools import collapse
-        from scipy import ndimage
 
+        Returns:
+            dict: If reference is a dict, the spectra per sleep stage per label.
+                The spectra of the first label are also kept in psds.
+        """
         psd_kwargs["fmin"] = fmin
         psd_kwargs["fmax"] = fmax
+        references = reference if isinstance(reference, dict) else {None: reference}
+        if cache is True:
+            cache = SpectraCache(
+                cache_dir=self.output_dir / self.__class__.__name__ / "psd_cache"
+            )
+        if cache:
+            is_epochs = isinstance(self.mne_raw, mne.BaseEpochs)
+            key = cache.key(
+                data=data_version(self.mne_raw),
+                hypno=None if self.hypno_up is None else self.hypno_up.tobytes(),
+                annotations=None if is_epochs else _annotations_key(self.mne_raw),
+                sleep_stages=sleep_stages,
+                references=references,
+                picks=picks,
+                reject_by_annotation=reject_by_annotation,
+                dtype=np.dtype(dtype).name,
+                psd_kwargs=sorted(psd_kwargs.items()),
+            )
+        spectra = cache.get(key) if cache and not force else None
+        if spectra is None:
+            spectra = self._compute_stage_spectra(
+                sleep_stages,
+                references,
+                picks,
+                reject_by_annotation,
+                n_jobs,
+                dtype,
+                block_sec,
+                **psd_kwargs,
+            )
+            if cache:
+                cache.put(key, spectra)
+        if cache:
+            cache.log_stats()
 
-        if reference is not None:
-            inst = self.mne_raw.copy().load_data().set_eeg_reference(reference)
+        self.psds.update(next(iter(spectra.values())))
+        if save:
+            self.save_psds(overwrite, archive=archive)
+        if isinstance(reference, dict):
+            return spectra
+
+    def _compute_stage_spectra(
+        self,
+        sleep_stages,
+        references,
+        picks,
+        reject_by_annotation,
+        n_jobs,
+        dtype,
+        block_sec,
+        **psd_kwargs,
+    ):
+        """Spectra per sleep stage per reference label."""
+        spectra = {label: {} for label in references}
+
+        if isinstance(self.mne_raw, mne.BaseEpochs):
+            epochs = self.mne_raw
+            # Stages are reduced from the spectra of all epochs,
+            # which are computed once even if stages share epochs.
+            stage_epochs = {
+                stage: np.searchsorted(epochs.selection, epochs[stage_epo].selection)
+                for stage, stage_epo in sleep_stages.items()
+            }
+            for label, ref in references.items():
+                cache = self._compute_epochs_spectra(picks, ref, **psd_kwargs)
+                for stage, idx in stage_epochs.items():
+                    spectra[label][stage] = mne.time_frequency.SpectrumArray(
+                        data=cache["psds"][idx].mean(axis=0),
+                        info=cache["info"].copy(),
+                        freqs=cache["freqs"],
+                    )
+                    spectra[label][stage].info["description"] = str(
+                        round(len(idx) / len(epochs) * 100, 2)
+                    )
         else:
-            inst = self.mne_raw
+            from mne.io.pick import _picks_to_idx
 
-        if isinstance(inst, mne.Epochs):
+            from .intervals import Intervals
 
-            for stage, stage_epo in sleep_stages.items():
-                self.psds[stage] = (
-                    inst[stage_epo].compute_psd(picks=picks, **psd_kwargs).average()
+            raw = self.mne_raw
+            picks = _picks_to_idx(raw.info, picks, "all", exclude=())
+            operators = [
+                _reference_operator(raw.info, picks, ref) for ref in references.values()
+            ]
+            if all(operator is None for operator in operators):
+                channels, operators = picks, [None] * len(operators)
+            else:
+                # Unchanged references select the picked channels.
+                selection = np.eye(raw.info["nchan"])[picks]
+                operators = [
+                    selection if operator is None else operator
+                    for operator in operators
+                ]
+                channels = np.flatnonzero(np.any(operators, axis=(0, 1)))
+                operators = [operator[:, channels] for operator in operators]
+
+            operators = [
+                None if operator is None else operator.astype(dtype)
+                for operator in operators
+            ]
+            # The BAD spans come from the interval index of the recording
+            # instead of MNE re-deriving them from the annotations.
+            if reject_by_annotation:
+                bad = self.bad_intervals
+            else:
+                bad = Intervals(starts=[], stops=[], n_times=raw.n_times)
+            # Two cases: when one stage is provided as integer vs
+            # when multiple stages as list, e.g., 'NREM': (1,2,3).
+            stage_regions = {
+                stage: self.stage_intervals(stage_idx)
+                for stage, stage_idx in sleep_stages.items()
+            }
+            if block_sec is None:
+                data = self._get_data(channels, dtype)
+                data[:, bad.mask()] = np.nan
+                stage_psds = {
+                    stage: self._compute_spectra(
+                        data, regions, bad, operators, n_jobs, **psd_kwargs
+                    )
+                    for stage, regions in stage_regions.items()
+                }
+            else:
+                stage_psds = self._stream_spectra(
+                    channels,
+                    stage_regions,
+                    bad,
+                    operators,
+                    block_sec,
+                    dtype,
+                    **psd_kwargs,
                 )
-                self.psds[stage].info["description"] = str(
-                    round(len(inst[stage_epo]) / len(inst) * 100, 2)
+            n_samples_total = raw.n_times - bad.n_samples
+            info = mne.pick_info(raw.info, picks)
+            for stage, regions in stage_regions.items():
+                psds, freqs = stage_psds[stage]
+                # Save percentage of the sleep stage.
+                n_samples = (regions - bad).n_samples
+                for label, label_psds in zip(references, psds):
+                    stage_info = info.copy()
+                    stage_info["description"] = str(
+                        round(n_samples / n_samples_total * 100, 2)
+                    )
+                    spectra[label][stage] = mne.time_frequency.SpectrumArray(
+                        data=label_psds, info=stage_info, freqs=freqs
+                    )
+
+        return spectra
+
+    def _compute_epochs_spectra(
+        self, picks, reference, batch_size=256, memmap_bytes=2**28, **psd_kwargs
+    ):
+        """Spectra of every epoch, of shape (n_epochs, n_channels, n_freqs).
+
+        Epochs are loaded in batches. Spectra larger than memmap_bytes
+        are kept in an epochs_psd_*.dat memmap, removed with the spectra.
+        The spectra are cached per version of the epochs, so they are
+        recomputed once the epochs are changed in place.
+        """
+        epochs = self.mne_raw
+        version = data_version(epochs)
+        key = (version, repr((picks, reference, sorted(psd_kwargs.items()))))
+        if key in self.epochs_psds:
+            return self.epochs_psds[key]
+        # Spectra of previous versions of the epochs are outdated.
+        for outdated in [k for k in self.epochs_psds if k[0] != version]:
+            del self.epochs_psds[outdated]
+
+        psds = None
+        for start in range(0, len(epochs), batch_size):
+            batch = epochs[start : start + batch_size].load_data()
+            if reference is not None:
+                batch.set_eeg_reference(reference)
+            spectrum = batch.compute_psd(picks=picks, **psd_kwargs)
+            if psds is None:
+                shape = (len(epochs), *spectrum.get_data().shape[1:])
+                if np.prod(shape) * 8 > memmap_bytes:
+                    psds = _scratch_memmap(
+                        self.output_dir / self.__class__.__name__, "epochs_psd_", shape
+                    )
+                else:
+                    psds = np.empty(shape)
+            psds[start : start + len(batch)] = spectrum.get_data()
+        if isinstance(psds, np.memmap):
+            psds.flush()
+
+        self.epochs_psds[key] = {
+            "psds": psds,
+            "freqs": spectrum.freqs,
+            "info": spectrum.info,
+        }
+        return self.epochs_psds[key]
+
+    def _get_data(self, picks, dtype, block_sec=300):
+        """Data of the picks in dtype, read in blocks so that
+        no float64 copy of the whole recording is made for float32."""
+        dtype = np.dtype(dtype)
+        if dtype == np.float64:
+            return self.mne_raw.get_data(picks=picks)
+        data = np.empty((len(picks), self.mne_raw.n_times), dtype=dtype)
+        block = int(block_sec * self.sf)
+        for start in range(0, self.mne_raw.n_times, block):
+            stop = min(start + block, self.mne_raw.n_times)
+            data[:, start:stop] = self.mne_raw.get_data(picks, start, stop)
+        return data
+
+    def _compute_spectra(self, data, regions, bad, operators, n_jobs=1, **kwargs):
+        from concurrent.futures import ThreadPoolExecutor
+
+        regions = list(regions)
+        n_jobs = os.cpu_count() if n_jobs is None or n_jobs < 1 else n_jobs
+        n_rows = len(data) if operators[0] is None else len(operators[0])
+        # With a single reference, the runs are also split by channels,
+        # so that a stage of a few long runs uses all the threads.
+        n_chunks = min(n_jobs, n_rows) if len(operators) == 1 else 1
+        chunks = np.array_split(np.arange(n_rows), n_chunks)
+
+        def welch(start, stop, rows):
+            x = data[:, start:stop]
+            if operators[0] is None:
+                return _referenced_welch(x[rows], self.sf, operators, **kwargs)
+            return _referenced_welch(
+                x, self.sf, [operator[rows] for operator in operators], **kwargs
+            )
+
+        with ThreadPoolExecutor(n_jobs) as executor:
+            futures = [
+                [executor.submit(welch, start, stop, rows) for rows in chunks]
+                for start, stop in regions
+            ]
+            results = [[future.result() for future in region] for region in futures]
+        freqs = results[0][0][1]
+        psds_list = [
+            np.concatenate([psds for psds, _ in region], axis=1) for region in results
+        ]
+        # For weighting.
+        weights = [stop - start - bad.count(start, stop) for start, stop in regions]
+        return _average_regions(psds_list, weights), freqs
+
+    def _stream_spectra(
+        self, picks, stage_regions, bad, operators, block_sec, dtype, **kwargs
+    ):
+        """Spectra per stage of the picks streamed in blocks of block_sec.
+
+        The periodograms of the Welch segments of each stage run are summed
+        over the blocks the segments start in. Each block is read with
+        the length of a segment more, so that its last segments are complete.
+        """
+        from mne.time_frequency.psd import _check_nfft
+
+        if kwargs.get("average", "mean") != "mean":
+            raise ValueError("Streamed spectra support only average='mean'.")
+        raw = self.mne_raw
+        block = int(block_sec * self.sf)
+        sums = {stage: {} for stage in stage_regions}
+        counts = {stage: {} for stage in stage_regions}
+        freqs = None
+        for block_start in range(0, raw.n_times, block):
+            block_stop = min(block_start + block, raw.n_times)
+            # A segment is at most n_fft long.
+            data_stop = min(block_stop + kwargs.get("n_fft", 256), raw.n_times)
+            data = raw.get_data(picks, block_start, data_stop).astype(dtype, copy=False)
+            data[:, bad.mask(block_start, data_stop)] = np.nan
+            for stage, regions in stage_regions.items():
+                first = np.searchsorted(regions.stops, block_start, side="right")
+                last = np.searchsorted(regions.starts, block_stop, side="left")
+                for i in range(first, last):
+                    start, stop = regions.starts[i], regions.stops[i]
+                    _, n_per_seg, n_overlap = _check_nfft(
+                        stop - start,
+                        kwargs.get("n_fft", 256),
+                        kwargs.get("n_per_seg"),
+                        kwargs.get("n_overlap", 0),
+                    )
+                    step = n_per_seg - n_overlap
+                    n_segments = (stop - start - n_per_seg) // step + 1
+                    # Segments of the run starting within the block.
+                    seg_first = max(0, -(-(block_start - start) // step))
+                    seg_last = min(n_segments, -(-(block_stop - start) // step))
+                    if seg_first >= seg_last:
+                        continue
+                    seg_start = start + seg_first * step - block_start
+                    seg_stop = start + (seg_last - 1) * step + n_per_seg - block_start
+                    run_sums, run_counts, freqs = _welch_sums(
+                        data[:, seg_start:seg_stop],
+                        self.sf,
+                        operators,
+                        **{**kwargs, "n_per_seg": n_per_seg},
+                    )
+                    sums[stage][i] = sums[stage].get(i, 0) + run_sums
+                    counts[stage][i] = counts[stage].get(i, 0) + run_counts
+
+        stage_psds = {}
+        for stage, regions in stage_regions.items():
+            with np.errstate(invalid="ignore", divide="ignore"):
+                psds_list = [sums[stage][i] / counts[stage][i] for i in sums[stage]]
+            runs = list(regions)
+            weights = [
+                runs[i][1] - runs[i][0] - bad.count(*runs[i]) for i in sums[stage]
+            ]
+            stage_psds[stage] = _average_regions(psds_list, weights), freqs
+        return stage_psds
+
+    @logger_wraps()
+    def compute_epoch_features(
+        self,
+        bands: dict = DEFAULT_BANDS,
+        epoch_sec: float = 30,
+        win_sec: float = 4,
+        fmin: float = 0.5,
+        fmax: float = 35,
+        slope_range: tuple = (1, 30),
+        picks: str | Iterable[str] = "eeg",
+        reference: Iterable[str] | str | None = None,
+        reject_by_annotation: bool = True,
+        n_jobs: int = 1,
+        block_sec: float = 300,
+        memmap_bytes: int = 2**28,
+        save: bool = False,
+        **psd_kwargs,
+    ):
+        """Computes spectral features of every epoch of the recording.
+
+        The recording is read in blocks of whole epochs and the Welch spectrum
+        of every epoch and channel is computed once, from which all features
+        are derived.
+        Segments overlapping BAD annotations are left out of the spectra,
+        so that epochs with no good segment have NaN features.
+
+        Args:
+            bands: Dict of name-value pairs - with name=arbitrary name
+                and value=(l_freq, h_freq).
+                Defaults to { "Delta": (0, 3.99), "Theta": (4, 7.99), "Alpha": (8, 12.49),
+                "Sigma": (12.5, 15), "Beta": (12.5, 29.99), "Gamma": (30, 60), }.
+            epoch_sec: Length of the epochs in seconds. Defaults to 30.
+            win_sec: Length of the Welch segments in seconds,
+                which overlap by half. Defaults to 4.
+            fmin: Lower frequency bound of the total power. Defaults to 0.5.
+            fmax: Upper frequency bound of the total power. Defaults to 35.
+            slope_range: Range of frequencies the spectral slope is fitted in,
+                as the slope of the log-log spectrum. Defaults to (1, 30).
+            picks: Channels to compute features for. Refer to :py:meth:`mne:mne.io.Raw.pick`.
+                Defaults to "eeg".
+            reference: Which eeg reference to compute features with,
+                as accepts :py:meth:`mne:mne.io.Raw.set_eeg_reference`.
+                If None, the reference isn't changed. Defaults to None.
+            reject_by_annotation: Whether to leave out the segments
+                overlapping BAD annotations. Defaults to True.
+            n_jobs: Number of threads computing the features of channel blocks.
+                If None or < 1, as many as CPUs. Defaults to 1.
+            block_sec: Length of the blocks the recording is read in, in seconds,
+                rounded down to whole epochs. Defaults to 300.
+            memmap_bytes: Size of the features above which they are kept
+                in a scratch memmap, removed once it is no longer referenced.
+                Defaults to 2**28.
+            save: Whether to save the features to epoch_features.h5.
+                Defaults to False.
+            **psd_kwargs: Additional arguments passed to :py:func:`mne:mne.time_frequency.psd_array_welch`.
+
+        Returns:
+            dict: Features of shape (n_epochs, n_channels, n_features)
+            in microVolts^2 for powers, with their "feature_names" and "ch_names",
+            and the "onsets" in seconds, "stages" at the middle,
+            and "bad_percent" of every epoch.
+        """
+        import warnings
+        from concurrent.futures import ThreadPoolExecutor
+
+        from mne.io.pick import _picks_to_idx
+
+        from .intervals import Intervals
+
+        if isinstance(self.mne_raw, mne.BaseEpochs):
+            raise ValueError("Epoch features are computed from a continuous recording.")
+        raw = self.mne_raw
+        epoch_len = int(epoch_sec * self.sf)
+        n_epochs = raw.n_times // epoch_len
+        n_per_seg = int(win_sec * self.sf)
+        psd_kwargs = {
+            "n_fft": n_per_seg,
+            "n_per_seg": n_per_seg,
+            "n_overlap": n_per_seg // 2,
+            **psd_kwargs,
+            "fmin": min(fmin, slope_range[0], *(b[0] for b in bands.values())),
+            "fmax": max(fmax, slope_range[1], *(b[1] for b in bands.values())),
+        }
+
+        picks = _picks_to_idx(raw.info, picks, "all", exclude=())
+        operator = _reference_operator(raw.info, picks, reference)
+        if operator is None:
+            channels = picks
+        else:
+            channels = np.flatnonzero(np.any(operator, axis=0))
+            operator = operator[:, channels]
+        if reject_by_annotation:
+            bad = self.bad_intervals
+        else:
+            bad = Intervals(starts=[], stops=[], n_times=raw.n_times)
+
+        feature_names = (
+            [f"{band}_power" for band in bands]
+            + [f"{band}_relative_power" for band in bands]
+            + ["total_power", "slope"]
+        )
+        shape = (n_epochs, len(picks), len(feature_names))
+        if np.prod(shape) * 8 > memmap_bytes:
+            features = _scratch_memmap(
+                self.output_dir / self.__class__.__name__, "epoch_features_", shape
+            )
+        else:
+            features = np.empty(shape)
+
+        n_jobs = os.cpu_count() if n_jobs is None or n_jobs < 1 else n_jobs
+        chunks = np.array_split(np.arange(len(picks)), min(n_jobs, len(picks)))
+        epochs_per_block = max(1, int(block_sec // epoch_sec))
+
+        def compute(data, first, rows):
+            x = data[rows] if operator is None else operator[rows] @ data
+            x = x.reshape(len(rows), -1, epoch_len)
+            with warnings.catch_warnings():
+                # Epochs with no good segment.
+                warnings.simplefilter("ignore", RuntimeWarning)
+                psds, freqs = mne.time_frequency.psd_array_welch(
+                    x, self.sf, verbose=False, **psd_kwargs
                 )
+            features[first : first + x.shape[1], rows] = _spectral_features(
+                10**12 * psds.swapaxes(0, 1), freqs, bands, (fmin, fmax), slope_range
+            )
+
+        with ThreadPoolExecutor(n_jobs) as executor:
+            for first in range(0, n_epochs, epochs_per_block):
+                last = min(first + epochs_per_block, n_epochs)
+                start, stop = first * epoch_len, last * epoch_len
+                data = raw.get_data(channels, start, stop)
+                data[:, bad.mask(start, stop)] = np.nan
+                for future in [
+                    executor.submit(compute, data, first, rows) for rows in chunks
+                ]:
+                    future.result()
+        if isinstance(features, np.memmap):
+            features.flush()
+
+        onsets = np.arange(n_epochs) * epoch_len
+        self.epoch_features = {
+            "features": features,
+            "feature_names": feature_names,
+            "ch_names": [raw.ch_names[pick] for pick in picks],
+            "onsets": onsets / self.sf,
+            "stages": (
+                None
+                if self.hypno_up is None
+                else np.asarray(self.hypno_up)[onsets + epoch_len // 2]
+            ),
+            "bad_percent": 100
+            / epoch_len
+            * np.array([bad.count(onset, onset + epoch_len) for onset in onsets]),
+        }
+        if save:
+            self._save_epoch_features()
+        return self.epoch_features
+
+    def _save_epoch_features(self):
+        import json
+
+        import h5py
+
+        fname = self.output_dir / self.__class__.__name__ / "epoch_features.h5"
+        with h5py.File(fname, "w") as f:
+            for key, value in self.epoch_features.items():
+                if key in ("feature_names", "ch_names"):
+                    f.attrs[key] = json.dumps(value)
+                elif value is not None:
+                    f.create_dataset(key, data=value)
+
+    @logger_wraps()
+    def compute_coherence(
+        self,
+        sleep_stages: dict = {"Wake": 0, "N1": 1, "N2": 2, "N3": 3, "REM": 4},
+        bands: dict = DEFAULT_BANDS,
+        reference: Iterable[str] | str | None = None,
+        picks: str | Iterable[str] = "eeg",
+        pairs: Iterable[tuple[str, str]] | None = None,
+        reject_by_annotation: bool = True,
+        n_jobs: int = 1,
+        tile_size: int = 64,
+        **psd_kwargs,
+    ):
+        """Computes coherence and imaginary coherence between channels
+        per sleep stage and band.
+
+        The cross-spectral densities are accumulated over the Fourier coefficients
+        of the Welch segments of the stage runs, computed once for all channel pairs.
+        The stage runs are read in blocks of segments, so that the recording
+        isn't loaded at once.
+        Pairs are processed in tiles of channels, so that the intermediate products
+        are bounded by the tile size. Coherence is averaged over the frequencies
+        of each band.
+
+        Args:
+            sleep_stages: Sleep stages mapping in hypnogram.
+                Defaults to {"Wake": 0, "N1": 1, "N2": 2, "N3": 3, "REM": 4}.
+            bands: Dict of name-value pairs - with name=arbitrary name
+                and value=(l_freq, h_freq).
+                Defaults to { "Delta": (0, 3.99), "Theta": (4, 7.99), "Alpha": (8, 12.49),
+                "Sigma": (12.5, 15), "Beta": (12.5, 29.99), "Gamma": (30, 60), }.
+            reference: Which eeg reference to compute coherence with,
+                as accepts :py:meth:`mne:mne.io.Raw.set_eeg_reference`.
+                If None, the reference isn't changed. Defaults to None.
+            picks: Channels to compute coherence between. Refer to :py:meth:`mne:mne.io.Raw.pick`.
+                Defaults to "eeg".
+            pairs: Pairs of channel names to compute coherence of.
+                If None, all pairs of picks. Defaults to None.
+            reject_by_annotation: Whether to leave out the segments
+                overlapping BAD annotations. Defaults to True.
+            n_jobs: Number of threads computing the tiles.
+                If None or < 1, as many as CPUs. Defaults to 1.
+            tile_size: Number of channels per tile. Defaults to 64.
+            **psd_kwargs: Additional arguments passed to :py:func:`mne:mne.time_frequency.psd_array_welch`.
+
+        Returns:
+            dict: "coh" and "imcoh" per sleep stage,
+            of shape (n_bands, n_channels, n_channels), or (n_bands, n_pairs)
+            if pairs are provided, with their "ch_names", "bands" and "pairs".
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        from mne.io.pick import _picks_to_idx
+
+        from .intervals import Intervals
+
+        if isinstance(self.mne_raw, mne.BaseEpochs):
+            raise ValueError("Coherence is computed from a continuous recording.")
+        raw = self.mne_raw
+        picks = _picks_to_idx(raw.info, picks, "all", exclude=())
+        ch_names = [raw.ch_names[pick] for pick in picks]
+        operator = _reference_operator(raw.info, picks, reference)
+        if operator is None:
+            channels = picks
         else:
-            data = inst.get_data(
-                picks=picks,
-                reject_by_annotation="NaN" if reject_by_annotation else None,
+            channels = np.flatnonzero(np.any(operator, axis=0))
+            operator = operator[:, channels]
+        if reject_by_annotation:
+            bad = self.bad_intervals
+        else:
+            bad = Intervals(starts=[], stops=[], n_times=raw.n_times)
+
+        n_fft = psd_kwargs.get("n_fft", 256)
+        n_per_seg = min(psd_kwargs.get("n_per_seg") or n_fft, n_fft)
+        step = n_per_seg - psd_kwargs.get("n_overlap", 0)
+        welch_kwargs = {
+            **psd_kwargs,
+            "n_per_seg": n_per_seg,
+            "fmin": min(band[0] for band in bands.values()),
+            "fmax": max(band[1] for band in bands.values()),
+            "average": None,
+            "output": "complex",
+            "verbose": False,
+        }
+        freqs = np.fft.rfftfreq(n_fft, 1 / self.sf)
+        freqs = freqs[
+            (freqs >= welch_kwargs["fmin"]) & (freqs <= welch_kwargs["fmax"])
+        ]
+        band_bins = [
+            (freqs >= l_freq) & (freqs <= h_freq) for l_freq, h_freq in bands.values()
+        ]
+
+        n_channels = len(picks)
+        if pairs is None:
+            n_tiles = -(-n_channels // tile_size)
+            bounds = np.linspace(0, n_channels, n_tiles + 1).astype(int)
+            tiles = [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+            tasks = [(a, b) for i, a in enumerate(tiles) for b in tiles[i:]]
+        else:
+            pairs = [tuple(pair) for pair in pairs]
+            rows = np.array([ch_names.index(pair[0]) for pair in pairs])
+            cols = np.array([ch_names.index(pair[1]) for pair in pairs])
+            tasks = np.array_split(
+                np.arange(len(pairs)), -(-len(pairs) // tile_size**2)
             )
+        # Segments per block of Fourier coefficients.
+        block = max(1, _WELCH_BLOCK_SIZE // (n_channels * len(freqs)))
+
+        n_jobs = os.cpu_count() if n_jobs is None or n_jobs < 1 else n_jobs
+        result = {"ch_names": ch_names, "bands": list(bands), "pairs": pairs}
+        result["coh"], result["imcoh"] = {}, {}
+        with ThreadPoolExecutor(n_jobs) as executor:
             for stage, stage_idx in sleep_stages.items():
-                n_samples_total = np.count_nonzero(~np.isnan(data), axis=1)[0]
+                auto = np.zeros((n_channels, len(freqs)))
+                if pairs is None:
+                    cross = np.zeros((len(freqs), n_channels, n_channels), complex)
+                else:
+                    cross = np.zeros((len(pairs), len(freqs)), complex)
+
+                def accumulate(coefs, task):
+                    if pairs is None:
+                        a, b = task
+                        conj = coefs[:, b].conj().swapaxes(1, 2)
+                        cross[:, a, b] += coefs[:, a] @ conj
+                    else:
+                        cross[task] += np.einsum(
+                            "pfs,pfs->pf", coefs[rows[task]], coefs[cols[task]].conj()
+                        )
+
+                for start, stop in self.stage_intervals(stage_idx):
+                    n_segments = (stop - start - n_per_seg) // step + 1
+                    for first in range(0, max(n_segments, 0), block):
+                        last = min(first + block, n_segments)
+                        seg_start = start + first * step
+                        seg_stop = start + (last - 1) * step + n_per_seg
+                        data = raw.get_data(channels, seg_start, seg_stop)
+                        data[:, bad.mask(seg_start, seg_stop)] = np.nan
+                        coefs, _ = mne.time_frequency.psd_array_welch(
+                            data, self.sf, **welch_kwargs
+                        )
+                        if operator is not None:
+                            coefs = np.einsum("pc,cfs->pfs", operator, coefs)
+                        # Segments overlapping BAD spans.
+                        coefs = coefs[..., ~np.isnan(coefs).any(axis=(0, 1))]
+                        auto += (np.abs(coefs) ** 2).sum(-1)
+                        if pairs is None:
+                            coefs = coefs.transpose(1, 0, 2)
+                        for future in [
+                            executor.submit(accumulate, coefs, task) for task in tasks
+                        ]:
+                            future.result()
+
+                if pairs is None:
+                    # Only the upper triangle of tiles is computed.
+                    lower = np.tril_indices(n_channels, -1)
+                    cross[:, lower[0], lower[1]] = cross[:, lower[1], lower[0]].conj()
+                    cross = np.moveaxis(cross, 0, -1)
+                    norm = auto[:, None] * auto[None]
+                else:
+                    norm = auto[rows] * auto[cols]
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    coherency = cross / np.sqrt(norm)
+                result["coh"][stage] = np.array(
+                    [np.abs(coherency[..., bins]).mean(-1) for bins in band_bins]
+                )
+                result["imcoh"][stage] = np.array(
+                    [coherency[..., bins].imag.mean(-1) for bins in band_bins]
+                )
 
-                # Two cases: when one stage is provided as integer vs
-                # when multiple stages as list, e.g., 'NREM': (1,2,3).
-                try:
-                    stage_mask = np.logical_or.reduce(
-                        [self.hypno_up == i for i in stage_idx]
-                    )
-                except TypeError:
-                    stage_mask = self.hypno_up == stage_idx
+        self.coherence = result
+        return result
 
-                # Get regions with the sleep stage of interest.
-                regions = collapse(ndimage.find_objects(ndimage.label(stage_mask)[0]))
-                psds, freqs, n_samples = self._compute_spectra(
-                    data, regions, **psd_kwargs
-                )
-                info = self.mne_raw.copy().pick(picks).info
-                # Save percentage of the sleep stage.
-                info["description"] = str(round(n_samples / n_samples_total * 100, 2))
+    @logger_wraps()
+    def compute_pac(
+        self,
+        sleep_stages: dict = {"N2": 2, "N3": 3},
+        phase_band: tuple = (0.3, 1.5),
+        amp_band: tuple = (12, 16),
+        picks: str | Iterable[str] = "eeg",
+        reference: Iterable[str] | str | None = None,
+        reject_by_annotation: bool = True,
+        n_bins: int = 18,
+        n_surrogates: int = 200,
+        seed: int | None = None,
+        n_jobs: int = 1,
+        save: bool = False,
+    ):
+        """Computes phase-amplitude coupling of every channel per sleep stage.
+
+        All channels are band-pass filtered and Hilbert transformed at once.
+        Coupling is computed over the samples of the stage runs outside BAD spans
+        as the modulation index of Tort et al. (2010) and the mean vector length
+        of Canolty et al. (2006). Surrogates shift the amplitude circularly
+        relative to the phase by at least a second, by the same random lags
+        for all channels, and give z-scores and p-values of both measures.
+
+        Args:
+            sleep_stages: Sleep stages mapping in hypnogram.
+                Defaults to {"N2": 2, "N3": 3}.
+            phase_band: Frequency band of the phase, e.g., slow oscillations.
+                Defaults to (0.3, 1.5).
+            amp_band: Frequency band of the amplitude, e.g., spindles.
+                Defaults to (12, 16).
+            picks: Channels to compute coupling for. Refer to :py:meth:`mne:mne.io.Raw.pick`.
+                Defaults to "eeg".
+            reference: Which eeg reference to compute coupling with,
+                as accepts :py:meth:`mne:mne.io.Raw.set_eeg_reference`.
+                If None, the reference isn't changed. Defaults to None.
+            reject_by_annotation: Whether to leave out the samples
+                of BAD annotations. Defaults to True.
+            n_bins: Number of phase bins of the modulation index. Defaults to 18.
+            n_surrogates: Number of surrogates. Defaults to 200.
+            seed: Seed of the random lags of the surrogates. Defaults to None.
+            n_jobs: Number of processes computing the coupling of channel chunks.
+                If None or < 1, as many as CPUs. Defaults to 1.
+            save: Whether to save the table to pac.csv. Defaults to False.
+
+        Returns:
+            :py:class:`pandas:pandas.DataFrame`: Per stage and channel,
+            mi and mvl (in Volts), their z-scores and p-values against
+            the surrogates, and the preferred phase in radians.
+        """
+        import pandas as pd
+        from concurrent.futures import ProcessPoolExecutor
+
+        from mne.io.pick import _picks_to_idx
+
+        from .intervals import Intervals
+
+        if isinstance(self.mne_raw, mne.BaseEpochs):
+            raise ValueError("Coupling is computed from a continuous recording.")
+        raw = self.mne_raw
+        picks = _picks_to_idx(raw.info, picks, "all", exclude=())
+        operator = _reference_operator(raw.info, picks, reference)
+        if operator is None:
+            data = self._get_data(picks, "float64")
+        else:
+            channels = np.flatnonzero(np.any(operator, axis=0))
+            data = operator[:, channels] @ self._get_data(channels, "float64")
+        if reject_by_annotation:
+            bad = self.bad_intervals
+        else:
+            bad = Intervals(starts=[], stops=[], n_times=raw.n_times)
+
+        rng = np.random.default_rng(seed)
+        stage_samples, stage_lags = {}, {}
+        for stage, stage_idx in sleep_stages.items():
+            samples = np.flatnonzero((self.stage_intervals(stage_idx) - bad).mask())
+            stage_samples[stage] = samples
+            min_lag = min(int(self.sf), len(samples) // 2)
+            stage_lags[stage] = rng.integers(
+                min_lag, max(len(samples) - min_lag, min_lag + 1), n_surrogates
+            )
+
+        from scipy.fft import next_fast_len
+        from scipy.signal import hilbert
 
-                self.psds[stage] = mne.time_frequency.SpectrumArray(
-                    data=psds, info=info, freqs=freqs
+        n_times = data.shape[-1]
+        analytic = {}
+        for key, (l_freq, h_freq) in (("phase", phase_band), ("amp", amp_band)):
+            filtered = mne.filter.filter_data(
+                data, self.sf, l_freq, h_freq, verbose=False
+            )
+            analytic[key] = hilbert(filtered, next_fast_len(n_times), axis=-1)[
+                :, :n_times
+            ]
+        del data, filtered
+        phase = np.angle(analytic["phase"])
+        amp = np.abs(analytic["amp"])
+        del analytic
+
+        n_jobs = os.cpu_count() if n_jobs is None or n_jobs < 1 else n_jobs
+        chunks = np.array_split(np.arange(len(picks)), min(n_jobs, len(picks)))
+        # Workers get the phase and amplitude at the stage samples only.
+        args = []
+        for rows in chunks:
+            index = {stage: np.ix_(rows, idx) for stage, idx in stage_samples.items()}
+            args.append(
+                (
+                    {stage: phase[i] for stage, i in index.items()},
+                    {stage: amp[i] for stage, i in index.items()},
+                    stage_lags,
+                    n_bins,
                 )
+            )
+        del phase, amp
+        if len(chunks) == 1:
+            results = [_pac_chunk(*args[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+                results = list(executor.map(_pac_chunk, *zip(*args)))
 
-        if save:
-            self.save_psds(overwrite)
-
-    def _compute_spectra(self, data, regions, **kwargs):
-        psds_list, weights = [], []
-        n_samples = 0
-        for region in regions:
-            # For weighting.
-            n_samples_per_reg = np.count_nonzero(~np.isnan(data[:, region]), axis=1)[0]
-            psds, freqs = mne.time_frequency.psd_array_welch(
-                data[:, region], self.sf, **kwargs
+        tables = []
+        for stage in sleep_stages:
+            measures = {
+                key: np.concatenate([result[stage][key] for result in results])
+                for key in results[0][stage]
+            }
+            table = pd.DataFrame(
+                {"stage": stage, "channel": [raw.ch_names[pick] for pick in picks]}
             )
-            psds_list.append(psds)
-            weights.append(n_samples_per_reg)
-            n_samples += n_samples_per_reg
+            for name in ("mi", "mvl"):
+                observed = measures[name]
+                surrogates = measures[f"{name}_surrogates"]
+                table[name] = observed
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    table[f"{name}_z"] = (
+                        observed - surrogates.mean(-1)
+                    ) / surrogates.std(-1)
+                n_above = (surrogates >= observed[:, None]).sum(-1)
+                table[f"{name}_p"] = (n_above + 1) / (n_surrogates + 1)
+            table["preferred_phase"] = measures["preferred_phase"]
+            tables.append(table)
+        table = pd.concat(tables, ignore_index=True)
 
-        # If there are nans in PSD, mask'em.
-        masked_data = np.ma.masked_array(
-            np.array(psds_list), np.isnan(np.array(psds_list))
-        )
-        # Weighted average
-        average = np.ma.average(masked_data, weights=weights, axis=0)
-        avg_psds = average.filled(np.nan)
-        return avg_psds, freqs, n_samples
+        if save:
+            table.to_csv(
+                self.output_dir / self.__class__.__name__ / "pac.csv", index=False
+            )
+        return table
 
     @logger_wraps()
-    def parametrize(self, picks, freq_range=None, average_ch=False, **kwargs):
+    def parametrize(
+        self,
+        picks,
+        freq_range=None,
+        average_ch=False,
+        engine: str = "fooof",
+        refine_r2: float | None = None,
+        n_jobs: int = 1,
+        **kwargs,
+    ):
         """Spectral parametrization by :std:doc:`fooof:index`.
 
         Args:
@@ -517,8 +2606,18 @@ class SpectralPipe(BaseHypnoPipe, SpectrumPlots):
             average_ch: Whether to average psds over channels.
                 If False or multiple channels are provided, the FOOOFGroup will be used.
                 Defaults to False.
+            engine: "fooof" to fit each spectrum by FOOOF, or "fast" to fit
+                all spectra of a stage at once, see :py:func:`sleepeegpy.parametrization.fit_fast`.
+                Defaults to "fooof".
+            refine_r2: With the "fast" engine, spectra fitted with R^2 below it
+                are refitted by FOOOF. If None, none are refitted. Defaults to None.
+            n_jobs: Number of processes fitting the spectra by FOOOF.
+                If None or < 1, as many as CPUs. Defaults to 1.
             **kwargs: Arguments passed to :py:class:`fooof:fooof.FOOOF`.
         """
+        from .parametrization import fit_fast
+
+        n_jobs = os.cpu_count() if n_jobs is None or n_jobs < 1 else n_jobs
         if freq_range is None:
             freq_range = (self.mne_raw.info["highpass"], self.mne_raw.info["lowpass"])
         for stage, spectrum in self.psds.items():
@@ -529,33 +2628,77 @@ class SpectralPipe(BaseHypnoPipe, SpectrumPlots):
 
                 self.fooofs[stage] = FOOOF(**kwargs)
                 psd = psd.mean(axis=0)
+                fit_kwargs = {}
             else:
                 from fooof import FOOOFGroup
 
                 self.fooofs[stage] = FOOOFGroup(**kwargs)
+                fit_kwargs = {"n_jobs": n_jobs}
 
-            self.fooofs[stage].fit(freqs, psd, freq_range)
+            if engine == "fast":
+                fit_fast(self.fooofs[stage], freqs, psd, freq_range, refine_r2, n_jobs)
+            elif engine == "fooof":
+                self.fooofs[stage].fit(freqs, psd, freq_range, **fit_kwargs)
+            else:
+                raise ValueError("the 'engine' argument should be 'fooof' or 'fast'")
 
     @logger_wraps()
-    def read_spectra(self, dirpath: str | None = None):
-        """Loads spectra stored in hdf5 files.
+    def read_spectra(
+        self,
+        dirpath: str | None = None,
+        stages: Iterable[str] | None = None,
+        picks: str | Iterable[str] | None = None,
+        fmin: float | None = None,
+        fmax: float | None = None,
+    ):
+        """Loads spectra stored in the archive or in hdf5 files.
 
-        Filenames should end with {sleep_stage}-psd.h5
+        The archive is looked up in dirpath and in its parent directory.
+        If it's not found, filenames should end with {sleep_stage}-psd.h5
 
         Args:
-            dirpath: Path to the directory containing hdf5 files. Defaults to None.
+            dirpath: Path to the archive or to the directory containing hdf5 files.
+                Defaults to None.
+            stages: Sleep stages to load. If None, all stages. Defaults to None.
+            picks: Channels to load. If None, all channels. Defaults to None.
+            fmin: Lower frequency bound. Defaults to None.
+            fmax: Upper frequency bound. Defaults to None.
         """
         import re
         from mne.time_frequency import read_spectrum
 
-        r = f"(.+)(?:-psd.h5)"
+        from .archive import SleepArchive, find_archive
+
         dirpath = (
             Path(dirpath) if dirpath else self.output_dir / self.__class__.__name__
         )
+        path_to_archive = find_archive(dirpath, "psd")
+        if path_to_archive:
+            archive = SleepArchive(path=path_to_archive)
+            for stage in archive.stages("psd"):
+                if stages is None or stage in stages:
+                    self.psds[stage] = archive.read(
+                        "psd", stage, picks=picks, fmin=fmin, fmax=fmax
+                    )
+            return
+
+        r = f"(.+)(?:-psd.h5)"
         for p in dirpath.glob("*psd.h5"):
             m = re.search(r, str(p.name))
-            if m:
-                self.psds[m.groups()[0]] = read_spectrum(p)
+            if m and (stages is None or m.groups()[0] in stages):
+                spectrum = read_spectrum(p)
+                if picks is not None:
+                    spectrum.pick(picks)
+                if fmin is not None or fmax is not None:
+                    data, freqs = spectrum.get_data(
+                        fmin=fmin or 0,
+                        fmax=np.inf if fmax is None else fmax,
+                        return_freqs=True,
+                    )
+                    spectrum = mne.time_frequency.SpectrumArray(
+                        data=data, info=spectrum.info, freqs=freqs
+                    )
+                self.psds[m.groups()[0]] = spectrum
 
     @logger_wraps()
     def plot_hypnospectrogram(
@@ -592,9 +2735,13 @@ class SpectralPipe(BaseHypnoPipe, SpectrumPlots):
                 Defaults to None.
         """
         # Import data from the raw mne file.
-        data = self.mne_raw.get_data(
-            picks, units="uV", reject_by_annotation=reject_by_annotation
-        )[0]
+        if reject_by_annotation == "NaN":
+            data = self.mne_raw.get_data(picks, units="uV")[0]
+            data[self.bad_intervals.mask()] = np.nan
+        else:
+            data = self.mne_raw.get_data(
+                picks, units="uV", reject_by_annotation=reject_by_annotation
+            )[0]
         # Create a plot figure
         if overlap or self.hypno_up is None:
             if axis is None:
@@ -721,10 +2868,221 @@ class SpectralPipe(BaseHypnoPipe, SpectrumPlots):
         return im
 
 
+_WELCH_BLOCK_SIZE = 2**22
+"""Number of Fourier coefficients held at once per reference."""
+
+def _scratch_memmap(directory, prefix, shape, dtype="float64"):
+    """Memmap in a new file of the directory, removed with the memmap."""
+    import tempfile
+    import weakref
+
+    fd, fname = tempfile.mkstemp(prefix=prefix, suffix=".dat", dir=directory)
+    os.close(fd)
+    array = np.memmap(fname, dtype=dtype, mode="w+", shape=shape)
+    weakref.finalize(array, _remove_file, fname)
+    return array
+
+
+def _remove_file(fname):
+    try:
+        os.remove(fname)
+    except OSError:
+        pass
+
+
+def _reference_operator(info, picks, reference):
+    """Matrix of shape (n_picks, n_channels) combining the channels
+    as :py:meth:`mne:mne.io.Raw.set_eeg_reference` re-references the picks,
+    or None if the reference isn't changed."""
+    if reference is None or (not isinstance(reference, str) and not len(reference)):
+        return None
+    if reference == "REST":
+        raise ValueError("REST reference can't be applied as a channel combination.")
+    # As MNE, the reference is applied to and averaged over good EEG channels.
+    ref_to = mne.pick_types(info, eeg=True)
+    if reference == "average":
+        ref_from = ref_to
+    else:
+        ref_from = mne.pick_channels(
+            info["ch_names"],
+            [reference] if isinstance(reference, str) else list(reference),
+            ordered=True,
+        )
+    operator = np.zeros((len(picks), info["nchan"]))
+    operator[np.arange(len(picks)), picks] = 1
+    rows = np.flatnonzero(np.isin(picks, ref_to))
+    operator[np.ix_(rows, ref_from)] -= 1 / len(ref_from)
+    return operator
+
+
+def _referenced_welch(x, sfreq, operators, **kwargs):
+    """Welch PSDs of the channel combinations of each operator,
+    of shape (n_operators, n_channels, n_freqs).
+
+    With several operators, the Fourier coefficients of the segments are
+    computed once, in blocks of segments, and each operator is applied to them.
+    """
+    from mne.time_frequency.psd import _check_nfft
+
+    if len(operators) == 1 or kwargs.get("average", "mean") != "mean":
+        psds = []
+        for operator in operators:
+            psd, freqs = mne.time_frequency.psd_array_welch(
+                x if operator is None else operator @ x, sfreq, **kwargs
+            )
+            psds.append(psd)
+        return np.array(psds), freqs
+
+    operators = np.array(operators)
+    n_fft, n_per_seg, n_overlap = _check_nfft(
+        x.shape[-1],
+        kwargs.get("n_fft", 256),
+        kwargs.get("n_per_seg"),
+        kwargs.get("n_overlap", 0),
+    )
+    step = n_per_seg - n_overlap
+    n_segments = (x.shape[-1] - n_per_seg) // step + 1
+    block = max(1, _WELCH_BLOCK_SIZE // (operators.shape[1] * (n_fft // 2 + 1)))
+    kwargs = {**kwargs, "n_per_seg": n_per_seg}
+    sums, counts = 0, 0
+    for first in range(0, n_segments, block):
+        last = min(first + block, n_segments)
+        block_sums, block_counts, freqs = _welch_sums(
+            x[:, first * step : (last - 1) * step + n_per_seg],
+            sfreq,
+            operators,
+            **kwargs,
+        )
+        sums, counts = sums + block_sums, counts + block_counts
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts, freqs
+
+
+def _welch_sums(x, sfreq, operators, **kwargs):
+    """Sums and counts of the Welch periodograms of the segments of x
+    not containing NaN, per channel combination of each operator."""
+    kwargs = {**kwargs, "average": None}
+    if len(operators) == 1:
+        operator = operators[0]
+        power, freqs = mne.time_frequency.psd_array_welch(
+            x if operator is None else operator @ x, sfreq, **kwargs
+        )
+        power = power[None]
+    else:
+        coefs, freqs = mne.time_frequency.psd_array_welch(
+            x, sfreq, output="complex", **kwargs
+        )
+        power = np.abs(np.einsum("opc,cfs->opfs", operators, coefs)) ** 2
+        # One-sided densities, as scipy doubles all but the DC and Nyquist bins.
+        n_fft = kwargs.get("n_fft", 256)
+        bins = np.round(freqs * n_fft / sfreq).astype(int)
+        power[..., (bins > 0) & ((n_fft % 2 == 1) | (bins < n_fft // 2)), :] *= 2
+    return (
+        np.nansum(power, axis=-1),
+        np.count_nonzero(~np.isnan(power), axis=-1),
+        freqs,
+    )
+
+
+def _average_regions(psds_list, weights):
+    """Average of the spectra of stage runs weighted by their good samples."""
+    # If there are nans in PSD, mask'em.
+    masked_data = np.ma.masked_array(np.array(psds_list), np.isnan(np.array(psds_list)))
+    # Weighted average
+    average = np.ma.average(masked_data, weights=weights, axis=0)
+    return average.filled(np.nan)
+
+
+def _spectral_features(psds, freqs, bands, total_range, slope_range):
+    """Absolute and relative band powers, total power and slope
+    of spectra of shape (..., n_freqs), of shape (..., n_features).
+
+    Powers are integrated over the bands, both edges included, by differences
+    of cumulative sums over the frequency axis. The slope is the least squares fit
+    of the log-log spectrum.
+    """
+    powers = _band_sums(psds, freqs, [*bands.values(), total_range])[0]
+    powers *= freqs[1] - freqs[0]
+    band_powers, total_power = powers[..., :-1], powers[..., -1:]
+    in_range = (freqs > 0) & (freqs >= slope_range[0]) & (freqs <= slope_range[1])
+    log_freqs = np.log10(freqs[in_range])
+    log_freqs -= log_freqs.mean()
+    slope = np.log10(psds[..., in_range]) @ log_freqs / (log_freqs @ log_freqs)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        relative_powers = band_powers / total_power
+    return np.concatenate(
+        [band_powers, relative_powers, total_power, slope[..., None]], axis=-1
+    )
+
+
+def _pac_chunk(stage_phase, stage_amp, stage_lags, n_bins):
+    """Modulation index and mean vector length of channels per stage,
+    from their phase and amplitude at the samples of the stage,
+    with their surrogates, run in a worker process.
+
+    The surrogates of all lags are circular cross-correlations of the amplitude
+    with the phase bin indicators and with the phase vectors,
+    computed by FFT instead of shifting the amplitude per lag.
+    """
+    import scipy.fft
+
+    results = {}
+    for stage, phase in stage_phase.items():
+        amp, lags = stage_amp[stage], stage_lags[stage]
+        n_channels, n_samples = amp.shape
+        bins = np.minimum(
+            ((phase + np.pi) / (2 * np.pi) * n_bins).astype(int), n_bins - 1
+        )
+        vectors = np.exp(1j * phase)
+        # Phase bins of the channels are offset to be counted at once.
+        offset_bins = (bins + (np.arange(n_channels) * n_bins)[:, None]).ravel()
+        counts = np.bincount(offset_bins, minlength=n_channels * n_bins)
+
+        def modulation_index(sums):
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means = sums / counts.reshape(n_channels, n_bins)
+                dist = means / means.sum(-1, keepdims=True)
+                entropy = -np.nansum(dist * np.log(dist), axis=-1)
+            return (np.log(n_bins) - entropy) / np.log(n_bins)
+
+        # Sums over the phase bins and the phase vectors of the amplitude
+        # shifted circularly by each lag. Unless the FFT of the samples is fast,
+        # the amplitude is repeated and correlated linearly at a fast length.
+        n_fft = scipy.fft.next_fast_len(n_samples, real=True) if n_samples else 0
+        if n_fft != n_samples:
+            n_fft = scipy.fft.next_fast_len(2 * n_samples, real=True)
+        lag_sums = np.zeros((n_bins + 2, n_channels, len(lags)))
+        for channel in range(n_channels if n_samples else 0):
+            signal = amp[channel] if n_fft == n_samples else np.tile(amp[channel], 2)
+            amp_fft = scipy.fft.rfft(signal, n_fft)
+            weights = [bins[channel] == b for b in range(n_bins)]
+            weights += [vectors[channel].real, vectors[channel].imag]
+            for i, weight in enumerate(weights):
+                lag_sums[i, channel] = scipy.fft.irfft(
+                    amp_fft * scipy.fft.rfft(weight, n_fft).conj(), n_fft
+                )[lags]
+
+        mean_vectors = (amp * vectors).mean(-1)
+        with np.errstate(invalid="ignore"):
+            mvl_surrogates = np.abs(lag_sums[-2] + 1j * lag_sums[-1]) / n_samples
+        sums = np.bincount(offset_bins, amp.ravel(), minlength=n_channels * n_bins)
+        results[stage] = {
+            "mi": modulation_index(sums.reshape(n_channels, n_bins)),
+            "mi_surrogates": modulation_index(lag_sums[:-2].transpose(2, 1, 0)).T,
+            "mvl": np.abs(mean_vectors),
+            "mvl_surrogates": mvl_surrogates,
+            "preferred_phase": np.angle(mean_vectors),
+        }
+    return results
+
+
 @define(kw_only=True)
 class SpindlesPipe(BaseEventPipe):
     """Spindles detection."""
 
+    # The RMS threshold is computed over the whole night of the included stages.
+    _block_local_detection = False
+
     @logger_wraps()
     def detect(
         self,
@@ -739,17 +3097,23 @@ class SpindlesPipe(BaseEventPipe):
         multi_only: bool = False,
         remove_outliers: bool = False,
         verbose: bool = False,
+        engine: str = "yasa",
+        n_jobs: int = -1,
         save: bool = False,
     ):
-        """A wrapper around :py:func:`yasa:yasa.spindles_detect` with option to save."""
-        from yasa import spindles_detect
+        """A wrapper around :py:func:`yasa:yasa.spindles_detect` with option to save.
 
-        inst = self.mne_raw.copy().load_data()
-        if reference is not None:
-            inst.set_eeg_reference(ref_channels=reference)
-        self.results = spindles_detect(
-            data=inst.pick(picks),
-            hypno=self.hypno_up,
+        Args:
+            engine: Either "yasa" or "numba". The latter runs
+                :py:func:`sleepeegpy.detection.spindles_detect`, a multithreaded
+                reimplementation of the same algorithm. Defaults to "yasa".
+            n_jobs: Number of threads detecting channels in parallel
+                with the "numba" engine, -1 for all CPUs. Defaults to -1.
+        """
+        inst = self._get_detection_inst(picks, reference)
+        detect_kwargs = dict(
+            engine=engine,
+            n_jobs=n_jobs,
             verbose=verbose,
             include=include,
             freq_sp=freq_sp,
@@ -760,14 +3124,35 @@ class SpindlesPipe(BaseEventPipe):
             multi_only=multi_only,
             remove_outliers=remove_outliers,
         )
+        self.results = self._detect_array(
+            inst, inst.ch_names, self.hypno_up, **detect_kwargs
+        )
+        self._remember_detection(picks, reference, detect_kwargs)
         if save:
             self._save_to_csv()
 
+    def _detect_array(self, data, ch_names, hypno, engine="yasa", n_jobs=-1, **kwargs):
+        if engine == "yasa":
+            from yasa import spindles_detect
+        elif engine == "numba":
+            from .detection import spindles_detect
+
+            kwargs["n_jobs"] = n_jobs
+        else:
+            raise ValueError("the 'engine' argument should be 'yasa' or 'numba'")
+
+        return spindles_detect(
+            data=data, sf=self.sf, ch_names=ch_names, hypno=hypno, **kwargs
+        )
+
 
 @define(kw_only=True)
 class SlowWavesPipe(BaseEventPipe):
     """Slow waves detection."""
 
+    _sync_center = "NegPeak"
+    _sync_window = (0.4, 0.8)
+
     @logger_wraps()
     def detect(
         self,
@@ -784,17 +3169,23 @@ class SlowWavesPipe(BaseEventPipe):
         coupling_params: dict = {"freq_sp": (12, 16), "p": 0.05, "time": 1},
         remove_outliers: bool = False,
         verbose: bool = False,
+        engine: str = "yasa",
+        n_jobs: int = -1,
         save: bool = False,
     ):
-        """A wrapper around :py:func:`yasa:yasa.sw_detect` with option to save."""
-        from yasa import sw_detect
+        """A wrapper around :py:func:`yasa:yasa.sw_detect` with option to save.
 
-        inst = self.mne_raw.copy().load_data()
-        if reference is not None:
-            inst.set_eeg_reference(ref_channels=reference)
-        self.results = sw_detect(
-            data=inst.pick(picks),
-            hypno=self.hypno_up,
+        Args:
+            engine: Either "yasa" or "numba". The latter runs
+                :py:func:`sleepeegpy.detection.sw_detect`, a multithreaded
+                reimplementation of the same algorithm. Defaults to "yasa".
+            n_jobs: Number of threads detecting channels in parallel
+                with the "numba" engine, -1 for all CPUs. Defaults to -1.
+        """
+        inst = self._get_detection_inst(picks, reference)
+        detect_kwargs = dict(
+            engine=engine,
+            n_jobs=n_jobs,
             verbose=verbose,
             include=include,
             freq_sw=freq_sw,
@@ -807,14 +3198,35 @@ class SlowWavesPipe(BaseEventPipe):
             coupling_params=coupling_params,
             remove_outliers=remove_outliers,
         )
+        self.results = self._detect_array(
+            inst, inst.ch_names, self.hypno_up, **detect_kwargs
+        )
+        self._remember_detection(picks, reference, detect_kwargs)
         if save:
             self._save_to_csv()
 
+    def _detect_array(self, data, ch_names, hypno, engine="yasa", n_jobs=-1, **kwargs):
+        if engine == "yasa":
+            from yasa import sw_detect
+        elif engine == "numba":
+            from .detection import sw_detect
+
+            kwargs["n_jobs"] = n_jobs
+        else:
+            raise ValueError("the 'engine' argument should be 'yasa' or 'numba'")
+
+        return sw_detect(data=data, sf=self.sf, ch_names=ch_names, hypno=hypno, **kwargs)
+
 
 @define(kw_only=True)
 class RapidEyeMovementsPipe(BaseEventPipe):
     """Rapid eye movements detection."""
 
+    pair_results: dict = field(init=False, factory=dict)
+    """Instances of :py:class:`yasa:yasa.REMResults` per (LOC, ROC) pair
+    as returned by :py:meth:`detect_pairs`.
+    """
+
     @logger_wraps()
     def detect(
         self,
@@ -852,11 +3264,190 @@ class RapidEyeMovementsPipe(BaseEventPipe):
         if save:
             self._save_to_csv()
 
+    @logger_wraps()
+    def detect_pairs(
+        self,
+        pairs: Iterable[tuple[str, str]] | str = "auto",
+        n_auto_pairs: int = 3,
+        reference: Iterable[str] | str = "average",
+        include: int | Iterable[int] = 4,
+        freq_rem: Iterable[float] = (0.5, 5),
+        duration: Iterable[float] = (0.3, 1.2),
+        amplitude: Iterable[float] = (50, 325),
+        remove_outliers: bool = False,
+        n_jobs: int = -1,
+        save: bool = False,
+    ):
+        """Runs :py:func:`yasa:yasa.rem_detect` for multiple LOC/ROC pairs at once.
+
+        Only the channels of the pairs are extracted, once, and re-referenced
+        without copying the recording. Pairs are detected concurrently.
+
+        Args:
+            pairs: (LOC, ROC) channel name pairs. If "auto", left-right symmetric
+                channel pairs closest to the nasion are taken from the montage.
+                Defaults to "auto".
+            n_auto_pairs: Number of pairs to take if pairs is "auto". Defaults to 3.
+            reference: Which eeg reference to detect with.
+                If None, the reference isn't changed. Defaults to "average".
+            include: Refer to :py:meth:`detect`. Defaults to 4.
+            freq_rem: Refer to :py:meth:`detect`. Defaults to (0.5, 5).
+            duration: Refer to :py:meth:`detect`. Defaults to (0.3, 1.2).
+            amplitude: Refer to :py:meth:`detect`. Defaults to (50, 325).
+            remove_outliers: Refer to :py:meth:`detect`. Defaults to False.
+            n_jobs: Number of pairs detected in parallel, -1 for all CPUs. Defaults to -1.
+            save: Whether to save the combined table to csv file. Defaults to False.
+
+        Returns:
+            pandas.DataFrame: Events of all pairs labelled by "LOC" and "ROC" columns.
+        """
+        import pandas as pd
+        from concurrent.futures import ThreadPoolExecutor
+        from yasa import rem_detect
+
+        if isinstance(pairs, str):
+            if pairs != "auto":
+                raise ValueError(
+                    "the 'pairs' argument should be 'auto' or list of pairs"
+                )
+            pairs = self._auto_eog_pairs(n_auto_pairs)
+        pairs = [tuple(pair) for pair in pairs]
+        if not pairs:
+            raise ValueError("No LOC/ROC pairs to detect on")
+
+        ch_names = list(dict.fromkeys(ch for pair in pairs for ch in pair))
+        data = dict(zip(ch_names, self._get_referenced_data(ch_names, reference)))
+
+        def detect_pair(pair):
+            return rem_detect(
+                loc=data[pair[0]],
+                roc=data[pair[1]],
+                sf=self.sf,
+                hypno=self.hypno_up,
+                verbose=False,
+                include=include,
+                freq_rem=freq_rem,
+                duration=duration,
+                amplitude=amplitude,
+                remove_outliers=remove_outliers,
+            )
+
+        n_workers = os.cpu_count() if n_jobs is None or n_jobs < 1 else n_jobs
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(detect_pair, pairs))
+
+        self.pair_results = {
+            pair: result for pair, result in zip(pairs, results) if result is not None
+        }
+        tables = [
+            result.summary().assign(LOC=pair[0], ROC=pair[1])
+            for pair, result in self.pair_results.items()
+        ]
+        if not tables:
+            logger.warning("No REMs were detected in any of the pairs.")
+            return None
+        table = pd.concat(tables, ignore_index=True)
+        table = table[["LOC", "ROC"] + list(table.columns[:-2])]
+        if save:
+            table.to_csv(
+                self.output_dir
+                / self.__class__.__name__
+                / f"{self.__class__.__name__[:-4].lower()}_pairs.csv",
+                index=False,
+            )
+        return table
+
+    def _get_referenced_data(self, ch_names, reference, chunk_sec=600):
+        """Extracts channels in uV, re-referencing the eeg ones
+        by a reference signal computed chunk-wise from the raw."""
+        raw = self.mne_raw
+        data = raw.get_data(ch_names, units="uV", reject_by_annotation="NaN")
+        if reference is None:
+            return data
+
+        if isinstance(reference, str) and reference == "average":
+            ref_picks = mne.pick_types(raw.info, eeg=True, exclude="bads")
+        else:
+            ref_picks = mne.pick_channels(
+                raw.ch_names,
+                [reference] if isinstance(reference, str) else list(reference),
+            )
+        ref = np.empty(raw.n_times)
+        chunk = int(chunk_sec * self.sf)
+        for start in range(0, raw.n_times, chunk):
+            ref[start : start + chunk] = raw.get_data(
+                ref_picks, start=start, stop=start + chunk, units="uV"
+            ).mean(axis=0)
+
+        # As set_eeg_reference, only eeg channels are re-referenced.
+        is_eeg = np.array(raw.get_channel_types(picks=ch_names)) == "eeg"
+        data[is_eeg] -= ref
+        return data
+
+    def _auto_eog_pairs(self, n_pairs):
+        """Left-right symmetric channel pairs closest to the nasion."""
+        from scipy.spatial import cKDTree
+
+        montage = self.mne_raw.get_montage()
+        if montage is None:
+            raise ValueError("Automatic pairing requires a montage")
+        positions = montage.get_positions()
+        ch_pos = {
+            ch: pos
+            for ch, pos in positions["ch_pos"].items()
+            if ch in self.mne_raw.ch_names
+            and ch not in self.mne_raw.info["bads"]
+            and not np.isnan(pos).any()
+        }
+        names = list(ch_pos)
+        coords = np.array(list(ch_pos.values()))
+        nasion = positions["nasion"]
+        if nasion is None:
+            nasion = coords[np.argmax(coords[:, 1])]
+
+        # Mirror left channels to the right and match the nearest right channel.
+        tree = cKDTree(coords)
+        left = np.flatnonzero(coords[:, 0] < 0)
+        dist, right = tree.query(coords[left] * [-1, 1, 1])
+        tol = 0.1 * np.median(np.linalg.norm(coords, axis=1))
+        pairs = [
+            (names[i], names[j])
+            for i, j, d in zip(left, right, dist)
+            if d < tol and coords[j, 0] > 0
+        ]
+        pairs.sort(
+            key=lambda pair: np.linalg.norm(ch_pos[pair[0]] - nasion)
+            + np.linalg.norm(ch_pos[pair[1]] - nasion)
+        )
+        return pairs[:n_pairs]
+
+    @logger_wraps()
+    def plot_average(self, save: bool = False, **kwargs):
+        """Plot average of the detected event.
+
+        Args:
+            save: Whether to save the figure to file. Defaults to False.
+            **kwargs: Arguments passed to the YASA's plot_average().
+        """
+        self.results.plot_average(**kwargs)
+        if save:
+            self._savefig(f"{self.__class__.__name__[:-4].lower()}_avg.png")
+
+    def compute_average(self):
+        raise AttributeError(
+            "'RapidEyeMovementsPipe' object has no attribute 'compute_average'"
+        )
+
     def plot_topomap(self):
         raise AttributeError(
             "'RapidEyeMovementsPipe' object has no attribute 'plot_topomap'"
         )
 
+    def redetect(self):
+        raise AttributeError(
+            "'RapidEyeMovementsPipe' object has no attribute 'redetect'"
+        )
+
     def plot_topomap_collage(self):
         raise AttributeError(
             "'RapidEyeMovementsPipe' object has no attribute 'plot_topomap'"
@@ -915,6 +3506,7 @@ class GrandSpectralPipe(SpectrumPlots):
         reject_by_annotation: bool = True,
         save: bool = False,
         overwrite: bool = False,
+        archive: bool = False,
         **psd_kwargs,
     ):
         """For each sleep stage creates a :py:class:`mne:mne.time_frequency.SpectrumArray` object.
@@ -932,6 +3524,8 @@ class GrandSpectralPipe(SpectrumPlots):
                 Defaults to True.
             save: Whether to save the spectra in .h5 files. Defaults to False.
             overwrite: Whether to overwrite the file. Defaults to False.
+            archive: Whether to save the spectra into the per-subject archive
+                instead of a file per sleep stage. Defaults to False.
             **psd_kwargs: Additional arguments passed to :py:func:`mne:mne.time_frequency.psd_array_welch`
         """
 
@@ -962,10 +3556,19 @@ class GrandSpectralPipe(SpectrumPlots):
             self.psds[stage] = mne.time_frequency.SpectrumArray(avg_psds, info, freqs)
 
         if save:
-            self.save_psds(overwrite)
+            self.save_psds(overwrite, archive=archive)
 
     @logger_wraps()
-    def parametrize(self, picks, freq_range, average_ch=False, **kwargs):
+    def parametrize(
+        self,
+        picks,
+        freq_range,
+        average_ch=False,
+        engine: str = "fooof",
+        refine_r2: float | None = None,
+        n_jobs: int = 1,
+        **kwargs,
+    ):
         """Spectral parametrization by :std:doc:`fooof:index`.
 
         Args:
@@ -974,11 +3577,21 @@ class GrandSpectralPipe(SpectrumPlots):
                 If None, set to bandpass filter boundaries. Defaults to None.
             average_ch: Whether to average psds over channels.
                 If False will be averaged over subjects. Defaults to False.
+            engine: "fooof" to fit each spectrum by FOOOF, or "fast" to fit
+                all spectra of a stage at once, see :py:func:`sleepeegpy.parametrization.fit_fast`.
+                Defaults to "fooof".
+            refine_r2: With the "fast" engine, spectra fitted with R^2 below it
+                are refitted by FOOOF. If None, none are refitted. Defaults to None.
+            n_jobs: Number of processes fitting the spectra by FOOOF.
+                If None or < 1, as many as CPUs. Defaults to 1.
             **kwargs: Arguments passed to :py:class:`fooof:fooof.FOOOFGroup`.
         """
         from collections import defaultdict
         from fooof import FOOOFGroup
 
+        from .parametrization import fit_fast
+
+        n_jobs = os.cpu_count() if n_jobs is None or n_jobs < 1 else n_jobs
         psds = defaultdict(list)
         for d in [pipe.psds for pipe in self.pipes]:
             for key, value in d.items():
@@ -991,4 +3604,165 @@ class GrandSpectralPipe(SpectrumPlots):
             )
             spectra = spectra.mean(axis=1 if average_ch else 0)
             self.fooofs[stage] = FOOOFGroup(**kwargs)
-            self.fooofs[stage].fit(freqs, spectra, freq_range)
+            if engine == "fast":
+                fit_fast(
+                    self.fooofs[stage], freqs, spectra, freq_range, refine_r2, n_jobs
+                )
+            elif engine == "fooof":
+                self.fooofs[stage].fit(freqs, spectra, freq_range, n_jobs=n_jobs)
+            else:
+                raise ValueError("the 'engine' argument should be 'fooof' or 'fast'")
+
+
+@define(kw_only=True)
+class GrandICAPipe:
+    """The pipeline element fitting ICA for multiple subjects.
+
+    Subjects are fitted in parallel processes, each by :py:class:`ICAPipe`
+    with output to output_dir/{subject}, optionally warm-started from a template.
+    """
+
+    paths_to_eeg: list = field(converter=lambda paths: [Path(p) for p in paths])
+    """Paths to eeg files of the subjects."""
+
+    output_dir: Path = field(converter=Path)
+    """Path to the directory where the output will be saved."""
+
+    @output_dir.validator
+    def _validate_output_dir(self, attr, value):
+        self.output_dir.mkdir(exist_ok=True)
+        (self.output_dir / self.__class__.__name__).mkdir(exist_ok=True)
+        logger.remove()
+        logger.add(sys.stderr, level="INFO")
+        logger.add(self.output_dir / "pipeline.log", level="TRACE")
+
+    ica_kwargs: dict = field(factory=dict)
+    """Arguments passed to :py:class:`ICAPipe`, e.g., method and n_components."""
+
+    icas: dict = field(init=False, factory=dict)
+    """Paths to the fitted -ica.fif files per subject."""
+
+    report: "pd.DataFrame | None" = field(init=False, default=None)
+    """Instance of :py:class:`pandas:pandas.DataFrame` with iterations and fit time
+    per subject as computed by :py:meth:`fit`. None until the cohort is fitted.
+    """
+
+    @property
+    def subjects(self):
+        """Subject names, i.e., eeg file names without extensions."""
+        return [path.name.split(".")[0] for path in self.paths_to_eeg]
+
+    @logger_wraps()
+    def fit(
+        self,
+        template: mne.preprocessing.ICA | str | None = None,
+        fit_kwargs: dict | None = None,
+        n_jobs: int = -1,
+        memory_budget_gb: float | None = None,
+        compare_cold: bool = False,
+    ):
+        """Fits ICA for every subject and saves it.
+
+        Args:
+            template: Fitted ICA or path to -ica.fif file to warm-start every fit with.
+                If "first", the first subject is fitted from scratch and serves as template.
+                If None, all fits start from scratch. Defaults to None.
+            fit_kwargs: Arguments passed to :py:meth:`ICAPipe.fit`. Defaults to None.
+            n_jobs: Maximal number of subjects fitted in parallel, -1 for all CPUs.
+                Defaults to -1.
+            memory_budget_gb: Subjects are started only while their estimated memory,
+                three times the recording size, fits into the budget. If None,
+                not limited. Defaults to None.
+            compare_cold: Whether to also fit warm-started subjects from scratch
+                and report iterations, fit time and components similarity. Defaults to False.
+
+        Returns:
+            pandas.DataFrame: Iterations and fit time per subject.
+        """
+        import pandas as pd
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+        fit_kwargs = fit_kwargs or dict()
+        subjects = dict(zip(self.subjects, self.paths_to_eeg))
+        if len(subjects) != len(self.paths_to_eeg):
+            raise ValueError("Subject names, i.e., eeg file names, should be unique")
+        estimates = dict()
+        for subject, path in subjects.items():
+            raw = mne.io.read_raw(path, verbose=False)
+            estimates[subject] = 3 * len(raw.ch_names) * raw.n_times * 8 / 1024**3
+
+        def submit(executor, subject, template):
+            return executor.submit(
+                _fit_subject_ica,
+                subject,
+                subjects[subject],
+                self.output_dir / subject,
+                self.ica_kwargs,
+                fit_kwargs,
+                template,
+                compare_cold,
+            )
+
+        rows = []
+        pending = list(subjects)
+        n_workers = os.cpu_count() if n_jobs is None or n_jobs < 1 else n_jobs
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            if isinstance(template, str) and template == "first":
+                rows.append(submit(executor, pending[0], None).result())
+                template = rows[0]["fname"]
+                pending = pending[1:]
+
+            running, used = dict(), 0.0
+            while pending or running:
+                while pending and len(running) < n_workers:
+                    estimate = estimates[pending[0]]
+                    if (
+                        running
+                        and memory_budget_gb is not None
+                        and used + estimate > memory_budget_gb
+                    ):
+                        break
+                    subject = pending.pop(0)
+                    running[submit(executor, subject, template)] = estimate
+                    used += estimate
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    used -= running.pop(future)
+                    rows.append(future.result())
+
+        self.report = pd.DataFrame(rows).set_index("subject").loc[list(subjects)]
+        self.icas = self.report.pop("fname").to_dict()
+        self.report.to_csv(
+            self.output_dir / self.__class__.__name__ / "grand_ica_report.csv"
+        )
+        return self.report
+
+
+def _fit_subject_ica(
+    subject, path_to_eeg, output_dir, ica_kwargs, fit_kwargs, template, compare_cold
+):
+    import time
+
+    pipe = ICAPipe(path_to_eeg=path_to_eeg, output_dir=output_dir, **ica_kwargs)
+    start = time.perf_counter()
+    pipe.fit(template=template, **fit_kwargs)
+    row = {
+        "subject": subject,
+        "warm_start": template is not None,
+        "n_iter": pipe.mne_ica.n_iter_,
+        "fit_sec": time.perf_counter() - start,
+    }
+    pipe.save_ica(overwrite=True)
+    row["fname"] = pipe.output_dir / pipe.__class__.__name__ / "data-ica.fif"
+
+    if compare_cold and template is not None:
+        cold_pipe = ICAPipe(prec_pipe=pipe, **ica_kwargs)
+        start = time.perf_counter()
+        cold_pipe.fit(**fit_kwargs)
+        row.update(
+            cold_n_iter=cold_pipe.mne_ica.n_iter_,
+            cold_fit_sec=time.perf_counter() - start,
+            **_match_components(pipe.mne_ica, cold_pipe.mne_ica),
+        )
+        row["speedup"] = row["cold_fit_sec"] / row["fit_sec"]
+    return row
@@ -0,0 +1,218 @@
+"""This module contains the on-disk cache of the spectra computed per sleep stage.
+
+Spectra are keyed by a hash of everything they depend on: the version of the data,
+the hypnogram, the annotations, the reference, the picks and the spectral parameters.
+The data version is the size and modification time of the files of a recording
+that isn't loaded, or a hash of its content if it is, as it may have been changed
+in memory. Entries are archives evicted by age and, least recently used first,
+by the total size of the cache. They are written to a temporary file and moved
+into place, so an interrupted write never leaves a partial entry.
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+import mne
+import numpy as np
+from attrs import define, field
+from loguru import logger
+
+
+def _update_digest(digest, value):
+    """Hashes arrays by their bytes, as their repr is truncated, and
+    containers item by item."""
+    if isinstance(value, np.ndarray):
+        digest.update(repr((value.dtype.str, value.shape)).encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        digest.update(b"dict")
+        for item in sorted(value.items(), key=lambda item: repr(item[0])):
+            _update_digest(digest, item)
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}{len(value)}".encode())
+        for item in value:
+            _update_digest(digest, item)
+    else:
+        digest.update(repr(value).encode())
+
+
+def data_version(inst: mne.io.BaseRaw | mne.BaseEpochs) -> str:
+    """Version of the data of a recording or epochs.
+
+    Args:
+        inst: An instance of :py:class:`mne:mne.io.Raw` or :py:class:`mne:mne.Epochs`.
+
+    Returns:
+        str: Hash of the files or of the loaded data, and of the channels info.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    info = inst.info
+    digest.update(
+        repr(
+            (
+                info["sfreq"],
+                info["ch_names"],
+                info["bads"],
+                info["highpass"],
+                info["lowpass"],
+                info["custom_ref_applied"],
+                [(proj["desc"], proj["active"]) for proj in info["projs"]],
+                getattr(inst, "first_samp", None),
+                len(inst.times),
+                len(inst) if isinstance(inst, mne.BaseEpochs) else None,
+            )
+        ).encode()
+    )
+    if isinstance(inst, mne.BaseEpochs):
+        digest.update(inst.events.tobytes())
+        digest.update(repr(sorted(inst.event_id.items())).encode())
+    if inst.preload:
+        digest.update(np.ascontiguousarray(inst._data).tobytes())
+    else:
+        filenames = (
+            [inst.filename] if isinstance(inst, mne.BaseEpochs) else inst.filenames
+        )
+        for filename in filenames:
+            stat = os.stat(filename)
+            digest.update(f"{filename}{stat.st_size}{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+@define(kw_only=True)
+class SpectraCache:
+    """On-disk cache of spectra per sleep stage."""
+
+    cache_dir: Path = field(converter=Path)
+    """Directory to store the spectra in."""
+
+    max_bytes: int = 2**30
+    """Total size of the cache in bytes above which
+    the least recently used entries are evicted."""
+
+    max_age_days: float | None = 30
+    """Age of the entries in days after which they are evicted.
+    If None, entries don't expire."""
+
+    hits: int = field(default=0, init=False)
+    """Number of spectra served from the cache."""
+
+    misses: int = field(default=0, init=False)
+    """Number of spectra computed."""
+
+    def __attrs_post_init__(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(**parts) -> str:
+        """Hash of the parameters the spectra depend on."""
+        digest = hashlib.sha1()
+        _update_digest(digest, parts)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.h5"
+
+    def get(self, key: str) -> dict | None:
+        """Returns the cached spectra per label per stage or None on a miss.
+
+        Args:
+            key: Hash of the parameters, see :py:meth:`key`.
+        """
+        import h5py
+
+        from .archive import SleepArchive
+
+        path = self._path(key)
+        if not path.is_file() or self._expired(path):
+            self.misses += 1
+            return None
+
+        try:
+            with h5py.File(path, "r") as f:
+                labels = json.loads(f.attrs["labels"])
+                stages = json.loads(f.attrs["stages"])
+            archive = SleepArchive(path=path)
+            spectra = {
+                label: {
+                    stage: archive.read(f"psd{i}", f"stage{j}")
+                    for j, stage in enumerate(stages)
+                }
+                for i, label in enumerate(labels)
+            }
+        except (OSError, KeyError, ValueError) as e:
+            # Unreadable entries are dropped and recomputed.
+            logger.warning(f"Removing unreadable spectra cache entry {path.name}: {e}")
+            path.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+        # Marks the entry as recently used.
+        os.utime(path)
+        self.hits += 1
+        return spectra
+
+    def put(self, key: str, spectra: dict):
+        """Stores the spectra per label per stage and evicts old entries.
+
+        Args:
+            key: Hash of the parameters, see :py:meth:`key`.
+            spectra: Instances of :py:class:`mne:mne.time_frequency.Spectrum`
+                per sleep stage per label.
+        """
+        import h5py
+
+        from .archive import write_archive
+
+        path = self._path(key)
+        tmp_path = self.cache_dir / f"{key}.{uuid.uuid4().hex}.tmp"
+        stages = list(next(iter(spectra.values())))
+        try:
+            for i, stage_spectra in enumerate(spectra.values()):
+                items = {f"stage{j}": stage_spectra[s] for j, s in enumerate(stages)}
+                write_archive(tmp_path, f"psd{i}", items, compression=None)
+            with h5py.File(tmp_path, "a") as f:
+                f.attrs["labels"] = json.dumps(list(spectra))
+                f.attrs["stages"] = json.dumps(stages)
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        self.evict()
+
+    def _expired(self, path):
+        return (
+            self.max_age_days is not None
+            and time.time() - path.stat().st_mtime > self.max_age_days * 86400
+        )
+
+    def evict(self):
+        """Removes expired entries, then the least recently used ones
+        until the cache fits in max_bytes, keeping the most recent one.
+        Temporary files of writes interrupted over a day ago are removed too."""
+        for path in self.cache_dir.glob("*.tmp"):
+            if time.time() - path.stat().st_mtime > 86400:
+                path.unlink(missing_ok=True)
+        entries = sorted(self.cache_dir.glob("*.h5"), key=lambda p: p.stat().st_mtime)
+        for path in [path for path in entries if self._expired(path)]:
+            path.unlink()
+            entries.remove(path)
+        total = sum(path.stat().st_size for path in entries)
+        for path in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            total -= path.stat().st_size
+            path.unlink()
+
+    def clear(self):
+        """Removes all entries and resets the counters."""
+        for pattern in ("*.h5", "*.tmp"):
+            for path in self.cache_dir.glob(pattern):
+                path.unlink()
+        self.hits = 0
+        self.misses = 0
+
+    def log_stats(self):
+        """Logs the hit rate of the cache."""
+        logger.info(f"Spectra cache: {self.hits} hits, {self.misses} misses")
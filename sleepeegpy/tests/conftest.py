@@ -0,0 +1,62 @@
+import mne
+import numpy as np
+import pytest
+
+
+def _basic_eeg_file_creation():
+    sfreq = 250
+    n_channels = 22
+    duration = 10
+    times = np.arange(0, duration, 1 / sfreq)
+
+    # Generate synthetic EEG-like data for basic testing.
+    # Note: This simplified model doesn't capture the full complexity of real EEG data.
+    # It's suitable for testing fundamental EEG processing functions.
+    # Seeded, so that tolerances don't depend on the draw.
+    rng = np.random.default_rng(0)
+    data = np.zeros((n_channels, len(times)))
+    for i in range(n_channels):
+        alpha = 0.5 * np.sin(2 * np.pi * 10 * times + rng.random())
+        beta = 0.3 * np.sin(2 * np.pi * 20 * times + rng.random())
+        theta = 0.1 * np.sin(2 * np.pi * 4 * times + rng.random())
+        noise = rng.normal(0, 0.05, size=times.shape)
+        data[i] = alpha + beta + theta + noise
+
+    ch_names = [
+        "Fp1",
+        "Fp2",
+        "Fz",
+        "F3",
+        "F4",
+        "F7",
+        "F8",
+        "FC1",
+        "FC2",
+        "Cz",
+        "C3",
+        "C4",
+        "T7",
+        "T8",
+        "Pz",
+        "P3",
+        "P4",
+        "P7",
+        "P8",
+        "O1",
+        "O2",
+        "Iz",
+    ]
+    info = mne.create_info(
+        ch_names=ch_names, sfreq=sfreq, ch_types=["eeg"] * n_channels
+    )
+    return mne.io.RawArray(data, info)
+
+
+@pytest.fixture
+def setup_eeg_file(tmp_path):
+    raw = _basic_eeg_file_creation()
+    montage = mne.channels.make_standard_montage("standard_1020")
+    raw.set_montage(montage)
+    eeg_file_path = tmp_path / "test_eeg_file_raw.fif"
+    raw.save(eeg_file_path, overwrite=True)
+    return eeg_file_path
@@ -1,69 +1,14 @@
 import os
 import pytest
-from sleepeegpy.pipeline import CleaningPipe
+from sleepeegpy.pipeline import CleaningPipe, SpectralPipe
 from sleepeegpy.dashboard import create_dashboard
+from sleepeegpy.interpolation import InterpolationCache
+from sleepeegpy.intervals import Intervals
 
 import numpy as np
 import mne
 
 
-def _basic_eeg_file_creation():
-    sfreq = 250
-    n_channels = 22
-    duration = 10
-    times = np.arange(0, duration, 1 / sfreq)
-
-    # Generate synthetic EEG-like data for basic testing.
-    # Note: This simplified model doesn't capture the full complexity of real EEG data.
-    # It's suitable for testing fundamental EEG processing functions.
-    data = np.zeros((n_channels, len(times)))
-    for i in range(n_channels):
-        alpha = 0.5 * np.sin(2 * np.pi * 10 * times + np.random.rand())
-        beta = 0.3 * np.sin(2 * np.pi * 20 * times + np.random.rand())
-        theta = 0.1 * np.sin(2 * np.pi * 4 * times + np.random.rand())
-        noise = np.random.normal(0, 0.05, size=times.shape)
-        data[i] = alpha + beta + theta + noise
-
-    ch_names = [
-        "Fp1",
-        "Fp2",
-        "Fz",
-        "F3",
-        "F4",
-        "F7",
-        "F8",
-        "FC1",
-        "FC2",
-        "Cz",
-        "C3",
-        "C4",
-        "T7",
-        "T8",
-        "Pz",
-        "P3",
-        "P4",
-        "P7",
-        "P8",
-        "O1",
-        "O2",
-        "Iz",
-    ]
-    info = mne.create_info(
-        ch_names=ch_names, sfreq=sfreq, ch_types=["eeg"] * n_channels
-    )
-    return mne.io.RawArray(data, info)
-
-
-@pytest.fixture
-def setup_eeg_file(tmp_path):
-    raw = _basic_eeg_file_creation()
-    montage = mne.channels.make_standard_montage("standard_1020")
-    raw.set_montage(montage)
-    eeg_file_path = tmp_path / "test_eeg_file_raw.fif"
-    raw.save(eeg_file_path, overwrite=True)
-    return eeg_file_path
-
-
 @pytest.fixture
 def setup_cleaning_pipe(setup_eeg_file, tmp_path):
     output_dir = tmp_path / "output"
@@ -105,6 +50,88 @@ def test_auto_detect_bad_channels(setup_cleaning_pipe):
     assert isinstance(bad_channels, list)
 
 
+def test_ransac_cache(setup_cleaning_pipe):
+    cleaning_pipe = setup_cleaning_pipe
+    cache = InterpolationCache(maxsize=1024)
+    results, misses = [], []
+    for _ in range(2):
+        bad_channels_file = cleaning_pipe.auto_detect_bad_channels(cache=cache)
+        with open(bad_channels_file, "r") as f:
+            results.append(sorted(f.read().splitlines()))
+        misses.append(cache.misses)
+    assert results[0] == results[1]
+    # The second run reuses every predictor of the first one.
+    assert misses[0] == misses[1] > 0
+    assert cache.hits >= misses[0]
+
+
+def test_validate_proxy(tmp_path):
+    sfreq = 500
+    n_times = 120 * sfreq
+    rng = np.random.default_rng(0)
+    montage = mne.channels.make_standard_montage("standard_1020")
+    ch_names = montage.ch_names[:32]
+    # Spatially smooth activity of a few sources.
+    pos = np.array([montage.get_positions()["ch_pos"][ch] for ch in ch_names])
+    weights = np.exp(-((pos[:, None] - pos[rng.choice(32, 6)]) ** 2).sum(-1) / 0.05**2)
+    sources = mne.filter.filter_data(
+        rng.normal(size=(6, n_times)), sfreq, 0.5, 30, verbose=False
+    )
+    data = 20 * weights @ sources + 0.5 * rng.normal(size=(32, n_times))
+    data[5] += 5 * rng.normal(size=n_times)
+    for onset in rng.uniform(10, 110, 10):
+        idx = int(onset * sfreq)
+        data[:10, idx : idx + 5] += 500 * np.array([-1, 1, -1, 1, -1])
+    raw = mne.io.RawArray(data * 1e-6, mne.create_info(ch_names, sfreq, "eeg"))
+    raw.set_montage(montage)
+    raw.save(tmp_path / "test_proxy_raw.fif")
+    cleaning_pipe = CleaningPipe(
+        path_to_eeg=tmp_path / "test_proxy_raw.fif", output_dir=tmp_path / "output"
+    )
+
+    report = cleaning_pipe.validate_proxy(amplitude_peak=200e-6)
+    assert cleaning_pipe.proxy["raw"].info["sfreq"] == 125
+    assert ch_names[5] in report["full_bad_channels"]
+    assert ch_names[5] in report["proxy_bad_channels"]
+    assert report["bad_channels_jaccard"] > 0.8
+    assert report["missed_bad_sec"] == 0
+    assert report["extra_bad_sec"] <= 10 * 4 / sfreq
+    assert (tmp_path / "output" / "CleaningPipe" / "proxy_validation.csv").exists()
+
+    cleaning_pipe.auto_set_annotations(amplitude_peak=200e-6, proxy=True)
+    assert len(cleaning_pipe.mne_raw.annotations) == 10
+
+
+def test_chunked_annotations(setup_eeg_file, tmp_path):
+    raw = mne.io.read_raw_fif(setup_eeg_file, preload=True)
+    rng = np.random.default_rng(0)
+    data = raw.get_data() * 1e-5
+    # Jumps, one of them across the chunk boundary, NaN and flat spans.
+    for idx in list(rng.integers(0, raw.n_times - 10, 20)) + [498]:
+        data[rng.integers(0, 22), idx : idx + 4] += 1e-3 * np.array([1, -1, 1, -1])
+    data[3, 490:520] = np.nan
+    data[7, 1000:1100] = 0
+    raw = mne.io.RawArray(data, raw.info, first_samp=100)
+    raw.set_meas_date(1e9)
+    raw.save(tmp_path / "test_chunks_raw.fif")
+    cleaning_pipe = CleaningPipe(
+        path_to_eeg=tmp_path / "test_chunks_raw.fif", output_dir=tmp_path / "output"
+    )
+
+    kwargs = dict(amplitude_peak=100e-6, amplitude_min_duration=0.008)
+    cleaning_pipe.auto_set_annotations(amplitude_flat=1e-9, chunk_sec=None, **kwargs)
+    expected = cleaning_pipe.mne_raw.annotations
+    cleaning_pipe.auto_set_annotations(
+        amplitude_flat=1e-9, chunk_sec=2, n_jobs=2, **kwargs
+    )
+    annotations = cleaning_pipe.mne_raw.annotations
+    assert set(annotations.description) == {"BAD_peak", "BAD_flat", "BAD_NAN"}
+    np.testing.assert_array_equal(annotations.onset, expected.onset)
+    np.testing.assert_array_equal(annotations.duration, expected.duration)
+    assert list(annotations.description) == list(expected.description)
+    assert list(annotations.ch_names) == list(expected.ch_names)
+
+
 def test_save_annotations(setup_cleaning_pipe):
     cleaning_pipe = setup_cleaning_pipe
     cleaning_pipe.mne_raw = mne.io.read_raw_fif(cleaning_pipe.path_to_eeg, preload=True)
@@ -120,6 +147,103 @@ def test_save_annotations(setup_cleaning_pipe):
     assert len(loaded_annotations) > 0, "loaded_annotations is 0"
 
 
+def test_interpolation_cache(setup_eeg_file, tmp_path):
+    expected = mne.io.read_raw_fif(setup_eeg_file, preload=True)
+    expected.info["bads"] = ["C3", "Pz"]
+    expected.interpolate_bads()
+
+    cache = InterpolationCache(cache_dir=tmp_path / "interp")
+    for _ in range(2):
+        pipe = CleaningPipe(path_to_eeg=setup_eeg_file, output_dir=tmp_path / "out")
+        pipe.mne_raw.info["bads"] = ["C3", "Pz"]
+        pipe.interpolate_bads(cache=cache)
+        np.testing.assert_allclose(pipe.mne_raw.get_data(), expected.get_data())
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # A fresh in-memory cache finds the matrix on disk.
+    disk_cache = InterpolationCache(cache_dir=tmp_path / "interp")
+    pipe.mne_raw.info["bads"] = ["C3", "Pz"]
+    pipe.interpolate_bads(cache=disk_cache)
+    assert (disk_cache.hits, disk_cache.misses) == (1, 0)
+
+    # Nested patches restore the function that was there before.
+    from mne.channels import interpolation
+
+    original = interpolation._make_interpolation_matrix
+    with cache.patch():
+        patched = interpolation._make_interpolation_matrix
+        with disk_cache.patch():
+            assert interpolation._make_interpolation_matrix is not patched
+        assert interpolation._make_interpolation_matrix is patched
+    assert interpolation._make_interpolation_matrix is original
+
+
+def test_intervals():
+    rng = np.random.default_rng(0)
+    n_times = 1000
+    masks = []
+    for _ in range(2):
+        starts = rng.integers(-10, n_times, 30)
+        stops = starts + rng.integers(0, 60, 30)
+        mask = np.zeros(n_times, dtype=bool)
+        for start, stop in zip(starts, stops):
+            mask[max(start, 0) : stop] = True
+        masks.append(mask)
+        intervals = Intervals.from_spans(starts, stops, n_times)
+        np.testing.assert_array_equal(intervals.mask(), mask)
+        assert (np.diff(intervals.starts) > 0).all()
+        assert (intervals.starts[1:] > intervals.stops[:-1]).all()
+
+    a, b = Intervals.from_mask(masks[0]), Intervals.from_mask(masks[1])
+    np.testing.assert_array_equal((a | b).mask(), masks[0] | masks[1])
+    np.testing.assert_array_equal((a & b).mask(), masks[0] & masks[1])
+    np.testing.assert_array_equal((a - b).mask(), masks[0] & ~masks[1])
+    np.testing.assert_array_equal((~a).mask(), ~masks[0])
+    for start, stop in rng.integers(0, n_times, (50, 2)):
+        start, stop = min(start, stop), max(start, stop)
+        assert a.count(start, stop) == masks[0][start:stop].sum()
+        assert a.overlaps(start, stop) == masks[0][start:stop].any()
+        np.testing.assert_array_equal(a.mask(start, stop), masks[0][start:stop])
+
+
+def test_bad_intervals(setup_eeg_file, tmp_path):
+    pipe = CleaningPipe(path_to_eeg=setup_eeg_file, output_dir=tmp_path / "out")
+    pipe.mne_raw.set_annotations(
+        mne.Annotations([1, 1.5, 6, 8], [1, 1, 0.5, 1], ["BAD_1", "bad", "EDGE", "BAD"])
+    )
+    # Overlapping spans are counted once, non-BAD ones not at all.
+    assert pipe.bad_data_percent == 25
+    expected = np.isnan(pipe.mne_raw.get_data([0], reject_by_annotation="NaN")[0])
+    np.testing.assert_array_equal(pipe.bad_intervals.mask(), expected)
+    assert pipe.bad_intervals is pipe.bad_intervals
+    pipe.mne_raw.annotations.append(3, 1, "BAD")
+    assert pipe.bad_data_percent == 35
+    # Other annotations are indexed by the same rule, leaving the recording's own.
+    other = mne.Annotations([0.5, 6], [1, 0.5], ["BAD", "EDGE"])
+    np.testing.assert_array_equal(
+        pipe._bad_samples(other),
+        np.isnan(
+            pipe.mne_raw.copy()
+            .set_annotations(other)
+            .get_data([0], reject_by_annotation="NaN")[0]
+        ),
+    )
+    assert pipe.bad_data_percent == 35
+
+    np.savetxt(tmp_path / "hypno.txt", np.repeat([2, 3], 5), fmt="%d")
+    spectral_pipe = SpectralPipe(
+        prec_pipe=pipe, path_to_hypno=tmp_path / "hypno.txt", hypno_freq=1
+    )
+    spectral_pipe.compute_psd(sleep_stages={"N2": 2, "NREM": (2, 3)}, n_fft=250)
+    data = pipe.mne_raw.get_data("eeg", reject_by_annotation="NaN")
+    expected, _ = mne.time_frequency.psd_array_welch(
+        data[:, : 5 * 250], 250, fmin=0, fmax=60, n_fft=250
+    )
+    np.testing.assert_allclose(spectral_pipe.psds["N2"].get_data(), expected)
+    assert spectral_pipe.psds["N2"].info["description"] == str(round(250 / 6.5, 2))
+    assert spectral_pipe.psds["NREM"].info["description"] == "100.0"
+
+
 def test_dashboard(setup_cleaning_pipe):
     fig = create_dashboard(subject_code="EL3001", prec_pipe=setup_cleaning_pipe)
 
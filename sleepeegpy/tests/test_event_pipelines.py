@@ -0,0 +1,241 @@
+import numpy as np
+import mne
+import pandas as pd
+import pytest
+from sleepeegpy.pipeline import RapidEyeMovementsPipe, SlowWavesPipe, SpindlesPipe
+
+
+def _events_eeg_file_creation():
+    sfreq = 100
+    n_channels = 4
+    duration = 1200
+    rng = np.random.default_rng(42)
+    times = np.arange(0, duration, 1 / sfreq)
+
+    # Background noise with superimposed 13 Hz spindle-like bursts
+    # and 0.8 Hz slow-wave-like deflections, in microvolts.
+    data = rng.normal(0, 8, size=(n_channels, times.size))
+    for ch in range(n_channels):
+        for onset in np.arange(5, duration - 5, 12) + rng.uniform(0, 2):
+            idx = np.searchsorted(times, onset)
+            t = times[idx : idx + sfreq] - times[idx]
+            data[ch, idx : idx + t.size] += (
+                40 * np.sin(2 * np.pi * 13 * t) * np.hanning(t.size)
+            )
+        for onset in np.arange(10, duration - 5, 12):
+            idx = np.searchsorted(times, onset)
+            t = times[idx : idx + int(1.2 * sfreq)] - times[idx]
+            data[ch, idx : idx + t.size] += -100 * np.sin(2 * np.pi * t / 1.2)
+
+    info = mne.create_info(
+        ch_names=[f"EEG{i}" for i in range(n_channels)],
+        sfreq=sfreq,
+        ch_types="eeg",
+    )
+    return mne.io.RawArray(data * 1e-6, info)
+
+
+@pytest.fixture
+def setup_event_files(tmp_path):
+    raw = _events_eeg_file_creation()
+    eeg_file_path = tmp_path / "test_events_raw.fif"
+    raw.save(eeg_file_path, overwrite=True)
+    hypno_file_path = tmp_path / "hypno.txt"
+    np.savetxt(hypno_file_path, np.full(40, 2), fmt="%d")
+    return eeg_file_path, hypno_file_path
+
+
+@pytest.fixture(params=[SpindlesPipe, SlowWavesPipe])
+def setup_event_pipe(request, setup_event_files, tmp_path):
+    eeg_file_path, hypno_file_path = setup_event_files
+    return request.param(
+        path_to_eeg=eeg_file_path,
+        output_dir=tmp_path / "output",
+        path_to_hypno=hypno_file_path,
+        hypno_freq=1 / 30,
+    )
+
+
+def test_redetect_unchanged(setup_event_pipe):
+    pipe = setup_event_pipe
+    pipe.detect(reference=None, include=(2,))
+    before = pipe.results.summary()
+    pipe.redetect()
+    assert pipe.results.summary().equals(before)
+
+
+def test_redetect_changed_channel(setup_event_pipe):
+    pipe = setup_event_pipe
+    pipe.detect(reference=None, include=(2,))
+    before = pipe.results.summary()
+    rng = np.random.default_rng(0)
+    pipe.mne_raw.load_data().apply_function(
+        lambda x: rng.normal(0, 8e-6, x.shape), picks=["EEG1"]
+    )
+    pipe.redetect()
+    after = pipe.results.summary()
+    unchanged = before["Channel"] != "EEG1"
+    assert after[after["Channel"] != "EEG1"].reset_index(drop=True).equals(
+        before[unchanged].reset_index(drop=True)
+    )
+    assert (after["Channel"] == "EEG1").sum() < (before["Channel"] == "EEG1").sum()
+
+
+def test_redetect_changed_hypnogram(setup_event_pipe):
+    pipe = setup_event_pipe
+    pipe.hypno[:] = np.random.default_rng(0).choice([2, 3], len(pipe.hypno))
+    pipe._upsample_hypno()
+    pipe.detect(reference=None, include=(2,))
+    n_before = len(pipe.results.summary())
+    # Re-score the first 5 minutes as wake and a later block as N2.
+    pipe.hypno[:10] = 0
+    pipe.hypno[15:20] = 2
+    pipe._upsample_hypno()
+    pipe.redetect()
+    after = pipe.results.summary()
+    assert (after["Start"] >= 300).all()
+    assert len(after) != n_before
+    pipe.detect(reference=None, include=(2,))
+    pd.testing.assert_frame_equal(after, pipe.results.summary())
+
+
+def test_numba_engine_agrees_with_yasa(setup_event_pipe):
+    pipe = setup_event_pipe
+    pipe.detect(reference=None, include=(2,), engine="yasa")
+    yasa_events = pipe.results.summary()
+    pipe.detect(reference=None, include=(2,), engine="numba")
+    numba_events = pipe.results.summary()
+    assert list(numba_events.columns) == list(yasa_events.columns)
+    assert numba_events.shape == yasa_events.shape
+    np.testing.assert_allclose(
+        numba_events.select_dtypes("number").to_numpy(),
+        yasa_events.select_dtypes("number").to_numpy(),
+    )
+
+
+@pytest.mark.parametrize("pipe_class", [SpindlesPipe, SlowWavesPipe])
+def test_numba_engine_without_hypnogram(pipe_class, setup_event_files, tmp_path):
+    pipe = pipe_class(path_to_eeg=setup_event_files[0], output_dir=tmp_path / "output")
+    pipe.detect(reference=None, engine="yasa")
+    yasa_events = pipe.results.summary()
+    pipe.detect(reference=None, engine="numba", n_jobs=2)
+    numba_events = pipe.results.summary()
+    assert "Stage" not in numba_events
+    assert list(numba_events.columns) == list(yasa_events.columns)
+    np.testing.assert_allclose(
+        numba_events.select_dtypes("number").to_numpy(),
+        yasa_events.select_dtypes("number").to_numpy(),
+    )
+
+
+def test_numba_engine_coupling(setup_event_files, tmp_path):
+    eeg_file_path, hypno_file_path = setup_event_files
+    pipe = SlowWavesPipe(
+        path_to_eeg=eeg_file_path,
+        output_dir=tmp_path / "output",
+        path_to_hypno=hypno_file_path,
+        hypno_freq=1 / 30,
+    )
+    pipe.detect(reference=None, include=(2,), coupling=True, engine="yasa")
+    yasa_events = pipe.results.summary()
+    pipe.detect(reference=None, include=(2,), coupling=True, engine="numba")
+    numba_events = pipe.results.summary()
+    assert {"PhaseAtSigmaPeak", "ndPAC"} <= set(numba_events.columns)
+    assert list(numba_events.columns) == list(yasa_events.columns)
+    np.testing.assert_allclose(
+        numba_events.select_dtypes("number").to_numpy(),
+        yasa_events.select_dtypes("number").to_numpy(),
+    )
+
+
+def test_compute_average_matches_sync_events(setup_event_pipe):
+    pipe = setup_event_pipe
+    pipe.detect(reference=None, include=(2,))
+    avg = pipe.compute_average(n_boot=200, seed=0)
+    expected = (
+        pipe.results.get_sync_events().groupby(["Channel", "Time"])["Amplitude"].mean()
+    )
+    for i, channel in enumerate(avg["labels"]):
+        np.testing.assert_allclose(avg["mean"][i], expected[channel].to_numpy())
+    assert (avg["ci_low"] <= avg["mean"] + 1e-9).all()
+    assert (avg["ci_high"] >= avg["mean"] - 1e-9).all()
+    assert (avg["sem"] > 0).all()
+
+
+def test_average_without_hypnogram(setup_event_files, tmp_path):
+    pipe = SpindlesPipe(path_to_eeg=setup_event_files[0], output_dir=tmp_path / "out")
+    pipe.detect(reference=None)
+    avg = pipe.compute_average(n_boot=50, seed=0)
+    assert avg["labels"] == pipe.results._ch_names
+    with pytest.raises(ValueError):
+        pipe.compute_average(hue="Stage")
+    pipe.plot_average()
+    pipe.compute_tfr(freqs=(10, 15), n_freqs=3, time_before=1, time_after=1)
+    assert list(pipe.tfrs) == ["Unscored"]
+
+
+def test_plot_average_seaborn_kwargs(setup_event_pipe):
+    import matplotlib.pyplot as plt
+
+    pipe = setup_event_pipe
+    pipe.detect(reference=None, include=(2,))
+    _, axis = plt.subplots()
+    pipe.plot_average(axis=axis, errorbar=None, palette="tab10", linewidth=3)
+    legend = [text.get_text() for text in axis.get_legend().get_texts()]
+    assert legend == pipe.results._ch_names
+    assert axis.get_lines()[0].get_linewidth() == 3
+    plt.close("all")
+
+
+def test_tfr_archive_matches_stage_files(setup_event_pipe):
+    pipe = setup_event_pipe
+    pipe.detect(reference=None, include=(2,))
+    pipe.compute_tfr(freqs=(10, 15), n_freqs=6, time_before=1, time_after=1, save=True)
+    pipe.compute_tfr(
+        freqs=(10, 15), n_freqs=6, time_before=1, time_after=1, save=True, archive=True
+    )
+    expected = pipe.tfrs["N2"].copy().pick(["EEG2", "EEG0"]).crop(fmin=11, fmax=14)
+
+    pipe.read_tfrs(picks=["EEG2", "EEG0"], fmin=11, fmax=14)
+    assert pipe.tfrs["N2"].ch_names == ["EEG2", "EEG0"]
+    np.testing.assert_allclose(pipe.tfrs["N2"].data, expected.data)
+    np.testing.assert_allclose(pipe.tfrs["N2"].freqs, expected.freqs)
+
+    # Per-stage files are still read when there is no archive.
+    (pipe.output_dir / "archive.h5").unlink()
+    pipe.read_tfrs(picks=["EEG2", "EEG0"], fmin=11, fmax=14)
+    np.testing.assert_allclose(pipe.tfrs["N2"].data, expected.data)
+
+
+def test_detect_pairs_matches_detect(tmp_path):
+    sfreq = 100
+    ch_names = ["Fp1", "Fp2", "F7", "F8", "F3", "F4", "Cz", "O1", "O2"]
+    rng = np.random.default_rng(0)
+    data = rng.normal(0, 5, size=(len(ch_names), 600 * sfreq))
+    # Opposite-phase eye-movement-like deflections on lateral frontal channels.
+    for onset in np.arange(5, 595, 4) + rng.uniform(0, 1):
+        idx = int(onset * sfreq)
+        w = 150 * np.hanning(60)
+        data[[2, 0], idx : idx + 60] += [w, w / 2]
+        data[[3, 1], idx : idx + 60] -= [w, w / 2]
+    raw = mne.io.RawArray(data * 1e-6, mne.create_info(ch_names, sfreq, "eeg"))
+    raw.set_montage("standard_1020")
+    raw.save(tmp_path / "test_rem_raw.fif")
+    np.savetxt(tmp_path / "hypno.txt", np.full(20, 4), fmt="%d")
+    pipe = RapidEyeMovementsPipe(
+        path_to_eeg=tmp_path / "test_rem_raw.fif",
+        output_dir=tmp_path / "output",
+        path_to_hypno=tmp_path / "hypno.txt",
+        hypno_freq=1 / 30,
+    )
+
+    assert pipe._auto_eog_pairs(2) == [("Fp1", "Fp2"), ("F7", "F8")]
+    table = pipe.detect_pairs(pairs=[("F7", "F8"), ("Fp1", "Fp2")])
+    assert set(pipe.pair_results) == {("F7", "F8"), ("Fp1", "Fp2")}
+    pipe.detect(loc_chname="F7", roc_chname="F8")
+    expected = pipe.results.summary()
+    pair_table = table[table["LOC"] == "F7"].drop(columns=["LOC", "ROC"])
+    np.testing.assert_allclose(
+        pair_table.select_dtypes("number").to_numpy(),
+        expected.select_dtypes("number").to_numpy(),
+    )
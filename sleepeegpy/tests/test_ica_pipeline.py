@@ -0,0 +1,180 @@
+import matplotlib.pyplot as plt
+import numpy as np
+import mne
+import pytest
+from sleepeegpy.pipeline import GrandICAPipe, ICAPipe
+
+
+def _ica_eeg_file_creation():
+    sfreq = 250
+    duration = 600
+    rng = np.random.default_rng(0)
+    ch_names = ["Fp1", "Fp2", "F3", "F4", "C3", "C4", "P3", "P4", "O1", "O2"]
+    times = np.arange(0, duration, 1 / sfreq)
+
+    # Independent non-gaussian sources, including blink- and pulse-like ones,
+    # linearly mixed into the channels.
+    sources = np.vstack(
+        [rng.laplace(size=times.size) for _ in range(len(ch_names) - 2)]
+        + [
+            np.sign(np.sin(2 * np.pi * 0.3 * times)),
+            np.sin(2 * np.pi * 1.2 * times) ** 15,
+        ]
+    )
+    mixing = rng.normal(size=(len(ch_names), len(ch_names)))
+    info = mne.create_info(ch_names=ch_names, sfreq=sfreq, ch_types="eeg")
+    data = mixing @ sources * 1e-5
+    # Large artifacts inside the BAD spans.
+    data[:, 110 * sfreq : 140 * sfreq] += 1e-2
+    raw = mne.io.RawArray(data, info)
+    raw.set_montage("standard_1020")
+    raw.set_annotations(mne.Annotations([100, 400], [50, 20], ["BAD_1", "bad_2"]))
+    return raw
+
+
+@pytest.fixture
+def setup_ica_pipe(tmp_path):
+    raw = _ica_eeg_file_creation()
+    eeg_file_path = tmp_path / "test_ica_raw.fif"
+    raw.save(eeg_file_path, overwrite=True)
+    return ICAPipe(
+        path_to_eeg=eeg_file_path,
+        output_dir=tmp_path / "output",
+        n_components=10,
+        random_state=0,
+    )
+
+
+def test_training_set(setup_ica_pipe):
+    pipe = setup_ica_pipe
+    hypno = np.repeat([0, 2, 3, 4], 5)
+    training_raw = pipe._build_training_set(
+        {"l_freq": 1.0, "h_freq": None, "verbose": "error"},
+        20_000,
+        100,
+        10,
+        hypno,
+        1 / 30,
+        0,
+    )
+    assert training_raw.info["sfreq"] == 100
+    assert training_raw.n_times == 20_000
+    assert np.abs(training_raw.get_data()).max() < 1e-3
+
+
+def test_fit_report(setup_ica_pipe):
+    pipe = setup_ica_pipe
+    pipe.fit(sample_budget=30_000, target_sfreq=100, seed=0, report=True)
+    assert pipe.fit_report["training_samples"] == 30_000
+    assert pipe.fit_report["mean_abs_corr"] > 0.95
+    assert (pipe.output_dir / "ICAPipe" / "ica_fit_report.csv").exists()
+
+
+def test_apply_in_blocks(setup_ica_pipe, tmp_path):
+    pipe = setup_ica_pipe
+    pipe.fit(sample_budget=30_000, target_sfreq=100, seed=0)
+    expected = pipe.mne_ica.apply(pipe.mne_raw.copy(), exclude=[0, 3]).get_data()
+
+    pipe = ICAPipe(
+        path_to_eeg=pipe.path_to_eeg,
+        output_dir=pipe.output_dir,
+        preload=False,
+    )
+    pipe.mne_ica = setup_ica_pipe.mne_ica
+    pipe.apply(exclude=[0, 3], block_sec=7)
+    assert isinstance(pipe.mne_raw._data, np.memmap)
+    np.testing.assert_allclose(pipe.mne_raw.get_data(), expected, atol=1e-12)
+
+    # Another pipe applying in blocks doesn't change the first recording.
+    other = ICAPipe(
+        path_to_eeg=pipe.path_to_eeg, output_dir=pipe.output_dir, preload=False
+    )
+    other.mne_ica = setup_ica_pipe.mne_ica
+    other.apply(exclude=[1], block_sec=7)
+    assert other.mne_raw._data.filename != pipe.mne_raw._data.filename
+    np.testing.assert_allclose(pipe.mne_raw.get_data(), expected, atol=1e-12)
+    # Applying again to the recording backed by the store updates it in place.
+    fname = pipe.mne_raw._data.filename
+    pipe.apply(exclude=[0, 3], block_sec=7)
+    assert pipe.mne_raw._data.filename == fname
+
+
+def test_sources_cache(setup_ica_pipe):
+    pipe = setup_ica_pipe
+    pipe.fit(sample_budget=30_000, target_sfreq=100, seed=0)
+    pipe.compute_sources(block_sec=7)
+    expected = pipe.mne_ica.get_sources(pipe.mne_raw).get_data()
+    np.testing.assert_allclose(pipe._ica_sources(), expected, atol=1e-12)
+    assert pipe.sources_cache["segment_var"].shape == (10, 300)
+    # Segments overlapping the BAD annotations.
+    assert (~pipe.sources_cache["good_segments"]).sum() == 35
+
+    fnames = pipe.plot_properties(picks=[0, 1], save=True, n_jobs=2)
+    assert all(fname.exists() for fname in fnames)
+    # MNE-only arguments are passed to MNE's properties figure, as in the notebooks.
+    figs = pipe.plot_properties(picks=[1], psd_args=dict(fmin=0, fmax=40), show=False)
+    assert len(figs) == 1
+    # The first five components by default, as MNE.
+    assert len(pipe.plot_properties()) == 5
+    plt.close("all")
+    pipe.apply(exclude=[0])
+    assert not pipe.sources_cache
+
+
+def test_score_components(tmp_path):
+    sfreq = 250
+    n_times = 300 * sfreq
+    rng = np.random.default_rng(1)
+    blink = np.zeros(n_times)
+    for onset in rng.uniform(0, 295, 80):
+        idx = int(onset * sfreq)
+        blink[idx : idx + 100] += 5 * np.hanning(100)
+    muscle = mne.filter.filter_data(
+        3 * rng.normal(size=n_times), sfreq, 40, 100, verbose=False
+    )
+    sources = np.vstack([rng.laplace(size=(8, n_times)), blink, muscle])
+    data = rng.normal(size=(10, 10)) @ sources * 1e-5
+    eog = (blink + 0.3 * rng.normal(size=n_times)) * 1e-4
+    ch_names = ["Fp1", "Fp2", "F3", "F4", "C3", "C4", "P3", "P4", "O1", "O2", "EOG"]
+    info = mne.create_info(ch_names, sfreq, ["eeg"] * 10 + ["eog"])
+    raw = mne.io.RawArray(np.vstack([data, eog]), info)
+    raw.set_montage("standard_1020")
+    raw.save(tmp_path / "test_scores_raw.fif")
+    pipe = ICAPipe(
+        path_to_eeg=tmp_path / "test_scores_raw.fif",
+        output_dir=tmp_path / "output",
+        n_components=10,
+        random_state=0,
+    )
+    pipe.fit()
+
+    scores = pipe.score_components()
+    blink_idx = np.argmax(np.abs(scores["EOG_corr"].to_numpy()))
+    assert abs(scores["EOG_corr"].iloc[blink_idx]) > 0.9
+    assert scores["decision"].iloc[blink_idx] != "keep"
+    muscle_idx = np.argmax(scores["hf_ratio"].to_numpy())
+    assert muscle_idx in pipe.suggested_exclude
+
+    pipe.export_templates([blink_idx], ["blink"], tmp_path / "templates.csv")
+    scores = pipe.score_components(templates=tmp_path / "templates.csv")
+    assert scores["blink_template_corr"].iloc[blink_idx] == pytest.approx(1)
+    assert blink_idx in pipe.suggested_exclude
+
+
+def test_grand_ica_warm_start(tmp_path):
+    raw = _ica_eeg_file_creation()
+    paths = [tmp_path / "sub1_raw.fif", tmp_path / "sub2_raw.fif"]
+    for path in paths:
+        raw.save(path)
+    grand_pipe = GrandICAPipe(
+        paths_to_eeg=paths,
+        output_dir=tmp_path / "output",
+        ica_kwargs={"n_components": 10, "random_state": 0},
+    )
+    report = grand_pipe.fit(template="first", n_jobs=2, compare_cold=True)
+
+    assert list(report.index) == ["sub1_raw", "sub2_raw"]
+    assert report.loc["sub2_raw", "warm_start"]
+    assert report.loc["sub2_raw", "n_iter"] < report.loc["sub2_raw", "cold_n_iter"]
+    assert report.loc["sub2_raw", "mean_abs_corr"] > 0.99
+    assert all(path.exists() for path in grand_pipe.icas.values())
@@ -0,0 +1,519 @@
+import os
+from pathlib import Path
+
+import h5py
+import numpy as np
+import mne
+import pandas as pd
+import pytest
+from h5io import read_hdf5
+from sleepeegpy.pipeline import SpectralPipe
+from sleepeegpy.spectra_cache import SpectraCache
+
+
+@pytest.fixture
+def setup_spectral_pipe(setup_eeg_file, tmp_path):
+    np.savetxt(tmp_path / "hypno.txt", np.repeat([2, 3], 5), fmt="%d")
+    return SpectralPipe(
+        path_to_eeg=setup_eeg_file,
+        output_dir=tmp_path / "out",
+        path_to_hypno=tmp_path / "hypno.txt",
+        hypno_freq=1,
+    )
+
+
+def test_multi_reference_psd(setup_spectral_pipe, monkeypatch):
+    from sleepeegpy import pipeline
+
+    # Blocks of a few segments, to check they add up to the full Welch average.
+    monkeypatch.setattr(pipeline, "_WELCH_BLOCK_SIZE", 22 * 129 * 3)
+    spectral_pipe = setup_spectral_pipe
+    raw = spectral_pipe.mne_raw
+    raw.set_annotations(mne.Annotations([3], [1.5], ["BAD"]))
+    references = {"original": None, "average": "average", "linked": ["T7", "T8"]}
+    sleep_stages = {"N2": 2, "N3": 3}
+    spectra = spectral_pipe.compute_psd(
+        sleep_stages=sleep_stages, reference=references, n_fft=256, n_overlap=128
+    )
+    assert spectral_pipe.psds["N2"] is spectra["original"]["N2"]
+    assert not raw.preload
+
+    for label, reference in references.items():
+        expected_pipe = SpectralPipe(prec_pipe=spectral_pipe)
+        expected_pipe.mne_raw = raw.copy().load_data()
+        if reference is not None:
+            expected_pipe.mne_raw.set_eeg_reference(reference)
+        expected_pipe.compute_psd(sleep_stages=sleep_stages, n_fft=256, n_overlap=128)
+        for stage in sleep_stages:
+            np.testing.assert_allclose(
+                spectra[label][stage].get_data(),
+                expected_pipe.psds[stage].get_data(),
+                rtol=1e-10,
+            )
+
+    # As MNE, the reference is averaged over and applied to good channels only.
+    raw = raw.copy().load_data()
+    raw.info["bads"] = ["Fz"]
+    for reference in ("average", ["T7", "T8"]):
+        operator = pipeline._reference_operator(raw.info, np.arange(22), reference)
+        np.testing.assert_allclose(
+            operator @ raw.get_data(),
+            raw.copy().set_eeg_reference(reference).get_data(),
+            atol=1e-12,
+        )
+
+
+def test_psd_n_jobs_and_dtype(setup_spectral_pipe):
+    spectral_pipe = setup_spectral_pipe
+    psds = {}
+    for reference in (None, "average"):
+        for n_jobs, dtype in [(1, "float64"), (3, "float64"), (3, "float32")]:
+            spectral_pipe.compute_psd(
+                sleep_stages={"N2": 2, "N3": 3},
+                reference=reference,
+                fmax=125,
+                n_fft=256,
+                n_jobs=n_jobs,
+                dtype=dtype,
+                cache=False,
+            )
+            psds[reference, n_jobs, dtype] = np.array(
+                [spectrum.get_data() for spectrum in spectral_pipe.psds.values()]
+            )
+
+        # Threads split the channels differently, which only changes the rounding.
+        expected = psds[reference, 1, "float64"]
+        np.testing.assert_allclose(psds[reference, 3, "float64"], expected, rtol=1e-12)
+        # The documented accuracy of single precision, over all bins.
+        rel_error = np.abs(psds[reference, 3, "float32"] / expected - 1)
+        bound = 1e-5 * np.sqrt(expected.max(axis=-1, keepdims=True) / expected)
+        assert (rel_error <= bound).all()
+
+
+def test_streamed_psd(setup_spectral_pipe):
+    spectral_pipe = SpectralPipe(
+        prec_pipe=setup_spectral_pipe, hypno=np.array([2, 2, 3, 2, 2, 2, 3, 3, 2, 3])
+    )
+    spectral_pipe.mne_raw.set_annotations(mne.Annotations([2.5, 7], [1, 2], "BAD"))
+    sleep_stages = {"N2": 2, "N3": 3, "NREM": (2, 3)}
+    kwargs = dict(n_fft=256, n_per_seg=200, n_overlap=100, window="hann")
+    for reference in (None, {"original": None, "average": "average"}):
+        spectral_pipe.compute_psd(
+            sleep_stages=sleep_stages, reference=reference, cache=False, **kwargs
+        )
+        expected = {stage: psd.get_data() for stage, psd in spectral_pipe.psds.items()}
+        # Blocks shorter and longer than the stage runs.
+        for block_sec in (0.37, 1.5, 20):
+            spectral_pipe.compute_psd(
+                sleep_stages=sleep_stages,
+                reference=reference,
+                block_sec=block_sec,
+                cache=False,
+                **kwargs,
+            )
+            for stage in sleep_stages:
+                np.testing.assert_allclose(
+                    spectral_pipe.psds[stage].get_data(), expected[stage], rtol=1e-10
+                )
+
+
+def test_spectra_cache(setup_spectral_pipe, tmp_path):
+    spectral_pipe = setup_spectral_pipe
+    cache = SpectraCache(cache_dir=tmp_path / "psd_cache")
+    kwargs = dict(
+        sleep_stages={"N2": 2, "NREM": (2, 3)},
+        reference={"original": None, "average": "average"},
+        n_fft=256,
+        cache=cache,
+    )
+    expected = spectral_pipe.compute_psd(**kwargs)
+    spectra = spectral_pipe.compute_psd(**kwargs)
+    assert (cache.hits, cache.misses) == (1, 1)
+    for label, stage_spectra in expected.items():
+        for stage, spectrum in stage_spectra.items():
+            np.testing.assert_array_equal(
+                spectra[label][stage].get_data(), spectrum.get_data()
+            )
+            assert spectra[label][stage].info["description"] == (
+                spectrum.info["description"]
+            )
+
+    # Changed annotations, parameters or force are misses.
+    spectral_pipe.mne_raw.set_annotations(mne.Annotations([1], [1], "BAD"))
+    spectral_pipe.compute_psd(**kwargs)
+    spectral_pipe.compute_psd(**{**kwargs, "n_fft": 128})
+    spectral_pipe.compute_psd(**kwargs, force=True)
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert len(list(cache.cache_dir.glob("*.h5"))) == 3
+
+    # Eviction of the least recently used and of expired entries.
+    small_cache = SpectraCache(cache_dir=cache.cache_dir, max_bytes=0)
+    small_cache.evict()
+    assert len(list(cache.cache_dir.glob("*.h5"))) == 1
+    (path,) = cache.cache_dir.glob("*.h5")
+    os.utime(path, (0, 0))
+    spectral_pipe.compute_psd(**kwargs)
+    assert (cache.hits, cache.misses) == (1, 4)
+    assert path.stat().st_mtime > 0
+
+
+def test_spectra_cache_integrity(setup_spectral_pipe, tmp_path, monkeypatch):
+    from sleepeegpy import archive
+
+    spectral_pipe = setup_spectral_pipe
+    cache = SpectraCache(cache_dir=tmp_path / "psd_cache")
+    kwargs = dict(
+        sleep_stages={"N2": 2, "N3": 3},
+        reference={"original": None, "average": "average"},
+        n_fft=256,
+        cache=cache,
+    )
+
+    # A write interrupted after the first reference leaves no entry.
+    write_archive = archive.write_archive
+
+    def interrupted(fname, kind, *args, **kwargs):
+        if kind == "psd1":
+            raise KeyboardInterrupt
+        write_archive(fname, kind, *args, **kwargs)
+
+    monkeypatch.setattr(archive, "write_archive", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        spectral_pipe.compute_psd(**kwargs)
+    assert not any(cache.cache_dir.iterdir())
+    monkeypatch.undo()
+
+    # Incomplete entries are misses, removed and recomputed.
+    expected = spectral_pipe.compute_psd(**kwargs)
+    (path,) = cache.cache_dir.glob("*.h5")
+    with h5py.File(path, "a") as f:
+        del f.attrs["labels"]
+    spectra = spectral_pipe.compute_psd(**kwargs)
+    assert (cache.hits, cache.misses) == (0, 3)
+    np.testing.assert_array_equal(
+        spectra["average"]["N3"].get_data(), expected["average"]["N3"].get_data()
+    )
+    spectral_pipe.compute_psd(**kwargs)
+    assert cache.hits == 1
+
+    # Arrays differing past what their repr shows have different keys.
+    window = np.hanning(2000)
+    changed = window.copy()
+    changed[1000] += 1e-3
+    assert SpectraCache.key(window=window) != SpectraCache.key(window=changed)
+    assert repr(window) == repr(changed)
+
+
+def test_band_powers(setup_spectral_pipe):
+    spectral_pipe = setup_spectral_pipe
+    spectral_pipe.compute_psd(
+        sleep_stages={"N2": 2, "N3": 3}, n_fft=256, cache=False
+    )
+    bands = {"Delta": (0, 3.99), "Alpha": (8, 12.5), "Wide": (1, 40)}
+    table, arrays = spectral_pipe.compute_band_powers(
+        bands=bands, stages=["N3", "N2"], save=True
+    )
+    assert len(table) == 2 * len(bands) * len(arrays["ch_names"])
+    assert arrays["power"].shape == (2, len(bands), len(arrays["ch_names"]))
+    for i, stage in enumerate(arrays["stages"]):
+        freqs = spectral_pipe.psds[stage].freqs
+        psds = 10**12 * spectral_pipe.psds[stage].get_data()
+        for j, (l_freq, h_freq) in enumerate(bands.values()):
+            in_band = (freqs >= l_freq) & (freqs <= h_freq)
+            band_sum = psds[:, in_band].sum(axis=1)
+            np.testing.assert_allclose(
+                arrays["power"][i, j], band_sum * (freqs[1] - freqs[0])
+            )
+            np.testing.assert_allclose(
+                arrays["relative_power"][i, j], band_sum / psds.sum(axis=1)
+            )
+            np.testing.assert_allclose(
+                arrays["mean_psd_db"][i, j],
+                (10 * np.log10(psds[:, in_band])).mean(axis=1),
+            )
+    rows = table[(table["stage"] == "N2") & (table["band"] == "Alpha")]
+    np.testing.assert_array_equal(rows["channel"], arrays["ch_names"])
+    np.testing.assert_array_equal(rows["mean_psd"], arrays["mean_psd"][1, 1])
+    out_dir = spectral_pipe.output_dir / "SpectralPipe"
+    pd.testing.assert_frame_equal(
+        pd.read_parquet(out_dir / "band_powers.parquet"), table
+    )
+    saved = read_hdf5(out_dir / "band_powers.h5", title="band_powers")
+    assert saved["stages"] == ["N3", "N2"] and saved["bands"] == list(bands)
+    np.testing.assert_array_equal(saved["power"], arrays["power"])
+    np.testing.assert_array_equal(saved["band_edges"], list(bands.values()))
+    spectral_pipe.plot_topomap_collage(bands=bands, stages_to_plot=["N2"])
+
+
+def test_epoch_features(setup_spectral_pipe):
+    spectral_pipe = setup_spectral_pipe
+    spectral_pipe.mne_raw.set_annotations(mne.Annotations([3.6], [0.3], "BAD"))
+    bands = {"Theta": (3, 6), "Alpha": (8, 12)}
+    kwargs = dict(bands=bands, epoch_sec=2, win_sec=1, fmax=40, reference="average")
+    result = spectral_pipe.compute_epoch_features(**kwargs)
+    assert result["features"].shape == (5, 22, 6)
+    assert result["feature_names"][-2:] == ["total_power", "slope"]
+    np.testing.assert_array_equal(result["stages"], [2, 2, 3, 3, 3])
+    np.testing.assert_allclose(result["bad_percent"], [0, 15, 0, 0, 0])
+
+    raw = spectral_pipe.mne_raw.copy().load_data().set_eeg_reference("average")
+    data = raw.get_data().reshape(22, 5, 500).swapaxes(0, 1)
+    psds, freqs = mne.time_frequency.psd_array_welch(
+        data, 250, fmin=0.5, fmax=40, n_fft=250, n_overlap=125, average=None
+    )
+    # The last segment of the second epoch overlaps the BAD span.
+    psds[1, ..., -1] = np.nan
+    psds = 10**12 * np.nanmean(psds, axis=-1)
+    df = freqs[1] - freqs[0]
+    alpha = psds[..., (freqs >= 8) & (freqs <= 12)].sum(-1) * df
+    total = psds[..., (freqs >= 0.5) & (freqs <= 40)].sum(-1) * df
+    in_range = (freqs >= 1) & (freqs <= 30)
+    log_psds = np.log10(psds[..., in_range]).reshape(-1, in_range.sum())
+    slope = np.polyfit(np.log10(freqs[in_range]), log_psds.T, 1)[0].reshape(5, 22)
+    features = result["features"]
+    np.testing.assert_allclose(features[..., 1], alpha)
+    np.testing.assert_allclose(features[..., 3], alpha / total)
+    np.testing.assert_allclose(features[..., 4], total)
+    np.testing.assert_allclose(features[..., 5], slope)
+
+    # Threads, blocks and the memmap don't change the features.
+    expected = np.array(features)
+    result = spectral_pipe.compute_epoch_features(
+        **kwargs, n_jobs=3, block_sec=3, memmap_bytes=0, save=True
+    )
+    assert isinstance(result["features"], np.memmap)
+    np.testing.assert_allclose(result["features"], expected, rtol=1e-12)
+    assert (spectral_pipe.output_dir / "SpectralPipe" / "epoch_features.h5").exists()
+
+    # Another call doesn't overwrite the memmap an earlier call returned.
+    first = result["features"]
+    kwargs["reference"] = None
+    result = spectral_pipe.compute_epoch_features(**kwargs, memmap_bytes=0)
+    assert result["features"].filename != first.filename
+    np.testing.assert_allclose(first, expected, rtol=1e-12)
+
+
+def test_fast_parametrization(setup_spectral_pipe):
+    from fooof import FOOOFGroup
+    from fooof.sim import gen_group_power_spectra
+    from sleepeegpy.parametrization import fit_fast
+
+    np.random.seed(0)
+    freqs, spectra = gen_group_power_spectra(
+        40, [1, 45], [1, 1.5], [[10, 0.5, 1.5], [20, 0.3, 2]], nlvs=0.02
+    )
+    exact = FOOOFGroup(max_n_peaks=6, verbose=False)
+    exact.fit(freqs, spectra)
+    fast = FOOOFGroup(max_n_peaks=6, verbose=False)
+    fit_fast(fast, freqs, spectra)
+    np.testing.assert_array_equal(exact.n_peaks_, fast.n_peaks_)
+    np.testing.assert_allclose(
+        fast.get_params("aperiodic_params"),
+        exact.get_params("aperiodic_params"),
+        atol=1e-2,
+    )
+    np.testing.assert_allclose(
+        fast.get_params("r_squared"), exact.get_params("r_squared"), atol=1e-3
+    )
+    # Spectra fitted worse than refine_r2 are fitted by FOOOF.
+    fit_fast(fast, freqs, spectra, refine_r2=1)
+    np.testing.assert_allclose(
+        fast.get_params("aperiodic_params"),
+        exact.get_params("aperiodic_params"),
+        rtol=1e-6,
+    )
+
+    spectral_pipe = setup_spectral_pipe
+    spectral_pipe.compute_psd(sleep_stages={"N2": 2, "N3": 3}, cache=False)
+    spectral_pipe.parametrize(
+        picks=["Fz", "Cz", "Pz"], freq_range=(2, 40), engine="fast", verbose=False
+    )
+    assert len(spectral_pipe.fooofs["N2"]) == 3
+    assert spectral_pipe.fooofs["N3"].get_params("r_squared").min() > 0.5
+    with pytest.raises(ValueError):
+        spectral_pipe.parametrize(picks="Cz", freq_range=(2, 40), engine="specparam")
+
+
+def test_coherence(setup_spectral_pipe, monkeypatch):
+    from scipy.signal import csd
+
+    spectral_pipe = setup_spectral_pipe
+    get_data = spectral_pipe.mne_raw.get_data
+    reads = []
+
+    def spy(*args, **kwargs):
+        data = get_data(*args, **kwargs)
+        reads.append(data.shape[-1])
+        return data
+
+    monkeypatch.setattr(spectral_pipe.mne_raw, "get_data", spy)
+    bands = {"Theta": (3, 6), "Alpha": (8, 12)}
+    kwargs = dict(
+        sleep_stages={"N2": 2, "N3": 3},
+        bands=bands,
+        reference="average",
+        n_fft=256,
+        n_overlap=128,
+        window="hann",
+    )
+    result = spectral_pipe.compute_coherence(**kwargs)
+    assert result["coh"]["N2"].shape == (2, 22, 22)
+    # The stage runs are read by blocks of segments, not the whole recording.
+    assert reads and max(reads) <= 1250
+    monkeypatch.undo()
+
+    raw = spectral_pipe.mne_raw.copy().load_data().set_eeg_reference("average")
+    data = raw.get_data()[:, 1250:]
+    welch_kwargs = dict(fs=250, nperseg=256, noverlap=128, window="hann")
+    freqs, cross = csd(data[:, None], data[None], **welch_kwargs)
+    auto = np.real(np.einsum("iif->if", cross))
+    # Scipy conjugates the first signal.
+    coherency = cross.conj() / np.sqrt(auto[:, None] * auto[None])
+    for i, (l_freq, h_freq) in enumerate(bands.values()):
+        in_band = (freqs >= l_freq) & (freqs <= h_freq)
+        np.testing.assert_allclose(
+            result["coh"]["N3"][i], np.abs(coherency[..., in_band]).mean(-1)
+        )
+        np.testing.assert_allclose(
+            result["imcoh"]["N3"][i],
+            coherency[..., in_band].imag.mean(-1),
+            atol=1e-12,
+        )
+
+    # Tiles, threads and pair subsets don't change the coherence.
+    pairs = [("Fz", "Cz"), ("O2", "O1")]
+    tiled = spectral_pipe.compute_coherence(**kwargs, tile_size=5, n_jobs=3)
+    subset = spectral_pipe.compute_coherence(**kwargs, pairs=pairs, tile_size=1)
+    for measure in ("coh", "imcoh"):
+        np.testing.assert_allclose(tiled[measure]["N2"], result[measure]["N2"])
+        for i, (first, second) in enumerate(pairs):
+            np.testing.assert_allclose(
+                subset[measure]["N2"][:, i],
+                result[measure]["N2"][
+                    :, result["ch_names"].index(first), result["ch_names"].index(second)
+                ],
+            )
+
+
+def test_pac(tmp_path):
+    from scipy.signal import hilbert
+
+    from sleepeegpy import pipeline
+
+    sfreq = 250
+    times = np.arange(120 * sfreq) / sfreq
+    rng = np.random.default_rng(0)
+    # Slow oscillations of varying frequency modulating spindle amplitude.
+    so_freq = np.repeat(0.5 + 0.7 * rng.random(120), sfreq)
+    so_phase = 2 * np.pi * np.cumsum(so_freq) / sfreq
+    so = np.sin(so_phase)
+    spindles = (1 + 0.8 * np.sin(so_phase)) * 0.3 * np.sin(2 * np.pi * 14 * times)
+    data = np.vstack(
+        [
+            so + spindles + 0.3 * rng.normal(size=times.size),
+            so + 0.3 * rng.normal(size=times.size),
+        ]
+    )
+    info = mne.create_info(["C3", "C4"], sfreq, "eeg")
+    mne.io.RawArray(data * 1e-5, info).save(tmp_path / "pac_raw.fif")
+    np.savetxt(tmp_path / "hypno.txt", [2, 2, 3, 3], fmt="%d")
+    spectral_pipe = SpectralPipe(
+        path_to_eeg=tmp_path / "pac_raw.fif",
+        output_dir=tmp_path / "out",
+        path_to_hypno=tmp_path / "hypno.txt",
+        hypno_freq=1 / 30,
+    )
+    spectral_pipe.mne_raw.set_annotations(mne.Annotations([20], [10], "BAD"))
+    table = spectral_pipe.compute_pac(n_surrogates=50, seed=0, save=True)
+    assert list(table["stage"]) == ["N2", "N2", "N3", "N3"]
+    coupled = table[table["channel"] == "C3"]
+    uncoupled = table[table["channel"] == "C4"]
+    assert (coupled["mi_z"] > 5).all() and (coupled["mvl_p"] < 0.05).all()
+    assert (uncoupled["mi_p"] > 0.05).all()
+    assert (spectral_pipe.output_dir / "SpectralPipe" / "pac.csv").exists()
+
+    # Modulation index of N2 over the samples outside the BAD span.
+    x = spectral_pipe.mne_raw.get_data()
+    phase = np.angle(hilbert(mne.filter.filter_data(x, sfreq, 0.3, 1.5)))
+    amp = np.abs(hilbert(mne.filter.filter_data(x, sfreq, 12, 16)))
+    samples = np.r_[0 : 20 * sfreq, 30 * sfreq : 60 * sfreq]
+    bins = ((phase[0, samples] + np.pi) / (2 * np.pi) * 18).astype(int)
+    bins = np.minimum(bins, 17)
+    means = np.bincount(bins, amp[0, samples]) / np.bincount(bins)
+    dist = means / means.sum()
+    mi = 1 + (dist * np.log(dist)).sum() / np.log(18)
+    assert coupled["mi"].iloc[0] == pytest.approx(mi, rel=1e-6)
+
+    parallel = spectral_pipe.compute_pac(n_surrogates=50, seed=0, n_jobs=2)
+    pd.testing.assert_frame_equal(parallel, table)
+
+    # Surrogates by FFT match shifting the amplitude, at fast and other lengths.
+    for n_samples in (1000, 1009):
+        stage_phase = {"N2": phase[:, :n_samples]}
+        stage_amp = {"N2": amp[:, :n_samples]}
+        lags = np.array([250, 500, 700])
+        result = pipeline._pac_chunk(stage_phase, stage_amp, {"N2": lags}, 18)["N2"]
+        vectors = np.exp(1j * stage_phase["N2"])
+        bins = ((stage_phase["N2"][0] + np.pi) / (2 * np.pi) * 18).astype(int)
+        bins = np.minimum(bins, 17)
+        for i, lag in enumerate(lags):
+            shifted = np.roll(stage_amp["N2"], -lag, axis=-1)
+            means = np.bincount(bins, shifted[0]) / np.bincount(bins)
+            dist = means / means.sum()
+            assert result["mi_surrogates"][0, i] == pytest.approx(
+                1 + (dist * np.log(dist)).sum() / np.log(18), rel=1e-9
+            )
+            np.testing.assert_allclose(
+                result["mvl_surrogates"][:, i],
+                np.abs((shifted * vectors).mean(-1)),
+                rtol=1e-9,
+            )
+
+
+def test_epochs_psd(setup_eeg_file, tmp_path):
+    raw = mne.io.read_raw_fif(setup_eeg_file)
+    events = mne.make_fixed_length_events(raw, duration=0.5)
+    events[:, 2] = np.tile([2, 3, 4, 3], len(events))[: len(events)]
+    epochs = mne.Epochs(
+        raw,
+        events,
+        {"N2": 2, "N3": 3, "REM": 4},
+        tmin=0,
+        tmax=0.5 - 1 / raw.info["sfreq"],
+        baseline=None,
+    )
+    epochs.save(tmp_path / "test-epo.fif")
+    spectral_pipe = SpectralPipe(
+        path_to_eeg=tmp_path / "test-epo.fif", output_dir=tmp_path / "out"
+    )
+    assert not spectral_pipe.mne_raw.preload
+
+    sleep_stages = {"N2": "N2", "N3": "N3", "NREM": ["N2", "N3"]}
+    spectral_pipe.compute_psd(sleep_stages=sleep_stages, fmax=40)
+    assert len(spectral_pipe.epochs_psds) == 1
+    for stage, stage_epo in sleep_stages.items():
+        expected = epochs[stage_epo].compute_psd(fmin=0, fmax=40).average()
+        np.testing.assert_allclose(
+            spectral_pipe.psds[stage].get_data(), expected.get_data()
+        )
+        assert spectral_pipe.psds[stage].info["description"] == str(
+            round(len(epochs[stage_epo]) / len(epochs) * 100, 2)
+        )
+
+    cache = spectral_pipe._compute_epochs_spectra(
+        "eeg", "average", batch_size=3, memmap_bytes=0, fmax=40
+    )
+    assert isinstance(cache["psds"], np.memmap)
+    expected = epochs.copy().load_data().set_eeg_reference().compute_psd(fmax=40)
+    np.testing.assert_allclose(cache["psds"], expected.get_data())
+
+    # Epochs changed in place are recomputed and outdated memmaps removed.
+    fname = Path(cache["psds"].filename)
+    del cache
+    spectral_pipe.mne_raw.drop([0, 1])
+    spectral_pipe.compute_psd(sleep_stages=sleep_stages, fmax=40)
+    assert len(spectral_pipe.epochs_psds) == 1
+    assert not fname.exists()
+    epochs.drop([0, 1])
+    expected = epochs["N2"].compute_psd(fmin=0, fmax=40).average()
+    np.testing.assert_allclose(spectral_pipe.psds["N2"].get_data(), expected.get_data())